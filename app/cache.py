@@ -0,0 +1,127 @@
+"""In-process caches keyed by the sync data generation.
+
+Every read endpoint is a pure function of its filters and the data loaded so
+far, so results are cached under ``(endpoint, normalized filters,
+data_generation)``. A sync bumps the generation (new keys) and clears the
+caches of this process when it commits.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import duckdb
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from .db import get_data_generation
+from .settings import get_settings
+
+_MISSING = object()
+_REGISTRY: "weakref.WeakSet[LRUCache]" = weakref.WeakSet()
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _REGISTRY.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def clear_all() -> None:
+    """Drop every cached entry in this process (called when a sync commits)."""
+    for cache in list(_REGISTRY):
+        cache.clear()
+
+
+_RESPONSES: Optional[LRUCache] = None
+_RESPONSES_LOCK = threading.Lock()
+
+
+def get_response_cache() -> LRUCache:
+    global _RESPONSES
+    with _RESPONSES_LOCK:
+        if _RESPONSES is None:
+            _RESPONSES = LRUCache(get_settings().response_cache_size)
+        return _RESPONSES
+
+
+def _normalize(params: Dict[str, Any]) -> tuple:
+    # Empty strings filter nothing in the query layer, same as None.
+    return tuple((name, None if value == "" else value) for name, value in sorted(params.items()))
+
+
+def _etag(key: tuple) -> str:
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20]
+    return f'"g{key[1]}-{digest}"'
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def cached_json(
+    request: Request,
+    conn: duckdb.DuckDBPyConnection,
+    endpoint: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Any],
+) -> Response:
+    """Serve ``compute()`` as JSON through the response cache.
+
+    The ETag is derived from the cache key, so a matching If-None-Match is
+    answered with 304 before any query runs.
+    """
+    key = (endpoint, get_data_generation(conn), _normalize(params))
+    etag = _etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    responses = get_response_cache()
+    body = responses.get(key)
+    if body is None:
+        body = JSONResponse(jsonable_encoder(compute())).body
+        responses.put(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,9 +1,202 @@
+import contextvars
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
 import duckdb
-from .settings import get_settings
+from .settings import DEFAULT_PROFILE, get_settings
 
-def init_db(conn: duckdb.DuckDBPyConnection):
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS procesos_secop1 (
+def normalize_sql(expr: str) -> str:
+    """Accent-folded, upper-cased SQL expression for ``expr``."""
+    return (
+        "UPPER(translate("
+        + expr
+        + ", 'ÁÉÍÓÚÜÑáéíóúüñ', 'AEIOUUNaeiouun'))"
+    )
+
+
+# Typed/normalized shadow columns maintained by the sync so filters become
+# plain comparisons: name -> (source column, SQL type, expression).
+DERIVED_COLUMNS = {
+    "anno_firma_int": ("anno_firma_contrato", "INTEGER", "TRY_CAST(anno_firma_contrato AS INTEGER)"),
+    "nombre_entidad_norm": ("nombre_entidad", "TEXT", normalize_sql("nombre_entidad")),
+    "departamento_entidad_norm": ("departamento_entidad", "TEXT", normalize_sql("departamento_entidad")),
+    "municipio_entidad_norm": ("municipio_entidad", "TEXT", normalize_sql("municipio_entidad")),
+}
+
+
+# Columns feeding the local full-text index (procesos_tokens).
+TEXT_INDEX_COLUMNS = [
+    "detalle_del_objeto_a_contratar",
+    "objeto_del_contrato_a_la",
+    "nombre_entidad",
+    "nom_razon_social_contratista",
+    "municipio_entidad",
+    "departamento_entidad",
+]
+TEXT_STOPWORDS = (
+    "de", "la", "el", "los", "las", "y", "en", "del", "para", "por", "con",
+    "al", "un", "una", "se", "que", "su", "sus", "lo", "o", "e",
+)
+
+
+def refresh_text_index(
+    conn: duckdb.DuckDBPyConnection, uid_source: str | None = None, table: str = "procesos_secop1",
+    stale_source: str | None = None,
+) -> None:
+    """Rebuild ``procesos_tokens`` for the uids selected by ``uid_source``.
+
+    ``uid_source`` is a SQL relation with a ``uid`` column (e.g. a registered
+    staging table); ``None`` reindexes the whole table. The text is read
+    from ``table``, which must hold those uids. Tokens are lower-cased,
+    accent-stripped alphanumeric runs, stored with their term frequency.
+    ``stale_source``, when given, narrows the uids whose old postings are
+    deleted; the token table has no uid index, so the delete is a full scan
+    and is skipped when that relation is empty.
+    """
+    uid_filter = f"WHERE uid IN (SELECT uid FROM {uid_source})" if uid_source else ""
+    text_expr = "strip_accents(lower(concat_ws(' ', " + ", ".join(TEXT_INDEX_COLUMNS) + ")))"
+    stopwords = ", ".join(f"'{w}'" for w in TEXT_STOPWORDS)
+    if stale_source is None:
+        conn.execute(f"DELETE FROM procesos_tokens {uid_filter}")
+    elif conn.execute(f"SELECT EXISTS (SELECT 1 FROM {stale_source})").fetchone()[0]:
+        conn.execute(f"DELETE FROM procesos_tokens WHERE uid IN (SELECT uid FROM {stale_source})")
+    conn.execute(f"""
+        INSERT INTO procesos_tokens(uid, token, tf)
+        SELECT uid, token, COUNT(*)::INTEGER
+        FROM (
+            SELECT uid, unnest(regexp_split_to_array({text_expr}, '[^a-z0-9]+')) AS token
+            FROM {table} {uid_filter}
+        )
+        WHERE length(token) >= 2 AND token NOT IN ({stopwords})
+        GROUP BY uid, token
+    """)
+
+
+# Columns served by /catalogos, materialized with value counts in catalog_values.
+CATALOG_COLUMNS = [
+    "anno_firma_contrato",
+    "modalidad_de_contratacion",
+    "destino_gasto",
+    "nombre_entidad",
+    "departamento_entidad",
+    "municipio_entidad",
+    "estado_del_proceso",
+    "codigo_bpin",
+]
+
+
+def apply_catalog_delta(conn: duckdb.DuckDBPyConnection, old_rows: str | None, new_rows: str) -> None:
+    """Adjust ``catalog_values`` counts from before/after images of changed rows.
+
+    ``old_rows`` and ``new_rows`` are SQL relations exposing the catalog
+    columns plus ``departamento_entidad_norm``/``municipio_entidad_norm``.
+    """
+    cols = ", ".join(CATALOG_COLUMNS)
+
+    def _unpivot(relation: str, sign: int) -> str:
+        return f"""
+            SELECT column_name, value,
+                   COALESCE(departamento_entidad_norm, '') AS departamento_norm,
+                   COALESCE(municipio_entidad_norm, '') AS municipio_norm,
+                   {sign} AS n
+            FROM (UNPIVOT (SELECT {cols}, departamento_entidad_norm, municipio_entidad_norm FROM {relation})
+                  ON {cols} INTO NAME column_name VALUE value)
+        """
+
+    parts = [_unpivot(new_rows, 1)]
+    if old_rows:
+        parts.append(_unpivot(old_rows, -1))
+    conn.execute(f"""
+        INSERT INTO catalog_values(column_name, value, departamento_norm, municipio_norm, n)
+        SELECT column_name, value, departamento_norm, municipio_norm, SUM(n)
+        FROM ({" UNION ALL ".join(parts)})
+        GROUP BY ALL
+        HAVING SUM(n) <> 0
+        ON CONFLICT DO UPDATE SET n = catalog_values.n + excluded.n
+    """)
+    conn.execute("DELETE FROM catalog_values WHERE n <= 0")
+
+
+# Dimensions of the stats_rollup cube; names match procesos_secop1 so the
+# same filter clauses apply to both tables.
+ROLLUP_DIMENSIONS = [
+    "anno_firma_int",
+    "modalidad_de_contratacion",
+    "estado_del_proceso",
+    "destino_gasto",
+    "nombre_entidad_norm",
+    "departamento_entidad_norm",
+    "municipio_entidad_norm",
+]
+
+
+def apply_rollup_delta(conn: duckdb.DuckDBPyConnection, old_rows: str | None, new_rows: str) -> None:
+    """Append signed count/sum deltas for changed rows to ``stats_rollup``.
+
+    Deltas for the same group accumulate as separate rows until
+    :func:`compact_rollup` folds them; readers always aggregate, so the cube
+    is correct in between.
+    """
+    dims = ", ".join(ROLLUP_DIMENSIONS)
+
+    def _signed(relation: str, sign: int) -> str:
+        return (
+            f"SELECT {dims}, {sign} AS n, {sign} * cuantia_contrato AS cc, {sign} * cuantia_proceso AS cp "
+            f"FROM {relation}"
+        )
+
+    parts = [_signed(new_rows, 1)]
+    if old_rows:
+        parts.append(_signed(old_rows, -1))
+    conn.execute(f"""
+        INSERT INTO stats_rollup({dims}, n, sum_cuantia_contrato, sum_cuantia_proceso)
+        SELECT {dims}, SUM(n), SUM(cc), SUM(cp)
+        FROM ({" UNION ALL ".join(parts)})
+        GROUP BY ALL
+        HAVING SUM(n) <> 0 OR SUM(cc) <> 0 OR SUM(cp) <> 0
+    """)
+
+
+def compact_rollup(conn: duckdb.DuckDBPyConnection) -> None:
+    """Fold accumulated deltas into one row per group and drop empty groups."""
+    dims = ", ".join(ROLLUP_DIMENSIONS)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE stats_rollup_compact AS
+            SELECT {dims}, SUM(n) AS n, SUM(sum_cuantia_contrato) AS sum_cuantia_contrato,
+                   SUM(sum_cuantia_proceso) AS sum_cuantia_proceso
+            FROM stats_rollup
+            GROUP BY ALL
+            HAVING SUM(n) <> 0
+        """)
+        conn.execute("DELETE FROM stats_rollup")
+        conn.execute("INSERT INTO stats_rollup SELECT * FROM stats_rollup_compact")
+        conn.execute("DROP TABLE stats_rollup_compact")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _migrate_derived_columns(conn: duckdb.DuckDBPyConnection) -> None:
+    existing = {r[1] for r in conn.execute("PRAGMA table_info('procesos_secop1')").fetchall()}
+    missing = [name for name in DERIVED_COLUMNS if name not in existing]
+    if not missing:
+        return
+    for name in missing:
+        conn.execute(f"ALTER TABLE procesos_secop1 ADD COLUMN {name} {DERIVED_COLUMNS[name][1]}")
+    assignments = ", ".join(f"{name} = {DERIVED_COLUMNS[name][2]}" for name in missing)
+    conn.execute(f"UPDATE procesos_secop1 SET {assignments}")
+
+
+def create_procesos_table(conn: duckdb.DuckDBPyConnection, table: str = "procesos_secop1") -> None:
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
       uid TEXT PRIMARY KEY,
       anno_cargue_secop DOUBLE,
       anno_firma_contrato TEXT,
@@ -83,9 +276,32 @@ def init_db(conn: duckdb.DuckDBPyConnection):
       destino_gasto TEXT,
       pliegos_tipo TEXT,
       sector_pliegos_tipo TEXT,
-      dataset_updated_at TIMESTAMP
+      dataset_updated_at TIMESTAMP,
+      anno_firma_int INTEGER,
+      nombre_entidad_norm TEXT,
+      departamento_entidad_norm TEXT,
+      municipio_entidad_norm TEXT
     );
     """)
+
+
+def is_view(conn: duckdb.DuckDBPyConnection, name: str) -> bool:
+    row = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = ?", [name]
+    ).fetchone()
+    return bool(row) and row[0] == "VIEW"
+
+
+def init_db(conn: duckdb.DuckDBPyConnection):
+    s = get_settings()
+    # With STORAGE_BACKEND=parquet, procesos_secop1 is a view over partition
+    # files (see app.partitions); switching back loads them into the table.
+    if s.storage_backend != "parquet" and is_view(conn, "procesos_secop1"):
+        from .partitions import detach
+        detach(conn, s.parquet_dir)
+    partitioned = is_view(conn, "procesos_secop1")
+    if not partitioned:
+        create_procesos_table(conn)
     conn.execute("""
     CREATE TABLE IF NOT EXISTS sync_state (
       dataset_id TEXT PRIMARY KEY,
@@ -93,12 +309,404 @@ def init_db(conn: duckdb.DuckDBPyConnection):
       last_run_ts TIMESTAMP,
       last_run_status TEXT,
       rows_upserted INTEGER,
-      last_error TEXT
+      last_error TEXT,
+      data_generation BIGINT DEFAULT 0
+    );
+    """)
+    conn.execute("ALTER TABLE sync_state ADD COLUMN IF NOT EXISTS data_generation BIGINT DEFAULT 0")
+    # Watermark and last run of each filter profile; sync_state keeps the
+    # dataset-wide status, the latest watermark and the data generation.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_profile_state (
+      dataset_id TEXT,
+      profile TEXT,
+      last_dataset_updated_at TIMESTAMP,
+      last_run_ts TIMESTAMP,
+      last_run_status TEXT,
+      rows_upserted INTEGER,
+      last_error TEXT,
+      PRIMARY KEY (dataset_id, profile)
+    );
+    """)
+    # Checkpoints predating profiles were keyed by dataset only.
+    checkpoint_cols = {r[0] for r in conn.execute("""
+        SELECT column_name FROM information_schema.columns WHERE table_name = 'sync_checkpoint'
+    """).fetchall()}
+    if checkpoint_cols and "profile" not in checkpoint_cols:
+        conn.execute("ALTER TABLE sync_checkpoint RENAME TO sync_checkpoint_v1")
+    # Last committed page of an unfinished snapshot, per profile; a snapshot
+    # with the same where_hash resumes after it instead of starting over.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_checkpoint (
+      dataset_id TEXT,
+      profile TEXT,
+      where_hash TEXT,
+      pagination TEXT,
+      last_updated_at TEXT,
+      last_id TEXT,
+      next_offset BIGINT,
+      pages BIGINT,
+      rows_upserted BIGINT,
+      max_updated_at TIMESTAMP,
+      started_ts TIMESTAMP,
+      updated_ts TIMESTAMP,
+      PRIMARY KEY (dataset_id, profile)
+    );
+    """)
+    if checkpoint_cols and "profile" not in checkpoint_cols:
+        conn.execute(f"""
+            INSERT INTO sync_checkpoint BY NAME
+            SELECT *, '{DEFAULT_PROFILE}' AS profile FROM sync_checkpoint_v1
+        """)
+        conn.execute("DROP TABLE sync_checkpoint_v1")
+    if not partitioned:
+        _migrate_derived_columns(conn)
+    has_text_index = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'procesos_tokens'"
+    ).fetchone()[0]
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS procesos_tokens (
+      uid TEXT,
+      token TEXT,
+      tf INTEGER
+    );
+    """)
+    # No ART index on token: with a few thousand distinct tokens over millions
+    # of postings it made every sync commit slower than the last, while the
+    # vectorized scan for `token IN (...)` is already cheap.
+    conn.execute("DROP INDEX IF EXISTS idx_procesos_tokens_token")
+    if not has_text_index:
+        refresh_text_index(conn)
+    has_catalogs = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'catalog_values'"
+    ).fetchone()[0]
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalog_values (
+      column_name TEXT,
+      value TEXT,
+      departamento_norm TEXT,
+      municipio_norm TEXT,
+      n BIGINT,
+      PRIMARY KEY (column_name, value, departamento_norm, municipio_norm)
+    );
+    """)
+    if not has_catalogs:
+        apply_catalog_delta(conn, None, "procesos_secop1")
+    has_rollup = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'stats_rollup'"
+    ).fetchone()[0]
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS stats_rollup (
+      anno_firma_int INTEGER,
+      modalidad_de_contratacion TEXT,
+      estado_del_proceso TEXT,
+      destino_gasto TEXT,
+      nombre_entidad_norm TEXT,
+      departamento_entidad_norm TEXT,
+      municipio_entidad_norm TEXT,
+      n BIGINT,
+      sum_cuantia_contrato DOUBLE,
+      sum_cuantia_proceso DOUBLE
     );
     """)
+    if not has_rollup:
+        apply_rollup_delta(conn, None, "procesos_secop1")
+    if s.storage_backend == "parquet":
+        from .partitions import attach
+        attach(conn, s.parquet_dir)
 
-def get_conn() -> duckdb.DuckDBPyConnection:
-    s = get_settings()
-    conn = duckdb.connect(s.duckdb_path)
-    init_db(conn)
-    return conn
+def get_data_generation(conn: duckdb.DuckDBPyConnection) -> int:
+    """Counter bumped by every sync that touched ``procesos_secop1``."""
+    row = conn.execute("SELECT COALESCE(SUM(data_generation), 0) FROM sync_state").fetchone()
+    return int(row[0])
+
+
+class CursorPool:
+    """Bounded pool of cursors sharing a single DuckDB database handle.
+
+    DuckDB cursors are independent connections to the same database instance,
+    so each worker thread gets its own cursor while the file is opened once.
+    """
+
+    def __init__(self, db: duckdb.DuckDBPyConnection, size: int, timeout: float = 30.0):
+        self._db = db
+        self._size = max(1, size)
+        self._timeout = timeout
+        self._idle: "queue.LifoQueue[duckdb.DuckDBPyConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self._size)
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def acquire(self) -> duckdb.DuckDBPyConnection:
+        if self._closed:
+            raise RuntimeError("Cursor pool is closed")
+        if not self._slots.acquire(timeout=self._timeout):
+            raise TimeoutError("Timed out waiting for a DuckDB cursor")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._db.cursor()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, cur: duckdb.DuckDBPyConnection) -> None:
+        if self._closed:
+            cur.close()
+        else:
+            self._idle.put(cur)
+        self._slots.release()
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        cur = self.acquire()
+        try:
+            yield cur
+        finally:
+            self.release(cur)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_DB: duckdb.DuckDBPyConnection | None = None
+_POOL: CursorPool | None = None
+_LOCK = threading.Lock()
+
+
+def get_db() -> duckdb.DuckDBPyConnection:
+    """Return the process-wide database handle, creating the schema on first use."""
+    global _DB
+    if _DB is None:
+        with _LOCK:
+            if _DB is None:
+                s = get_settings()
+                db = duckdb.connect(s.duckdb_path)
+                init_db(db)
+                _DB = db
+    return _DB
+
+
+def get_pool() -> CursorPool:
+    global _POOL
+    if _POOL is None:
+        db = get_db()
+        with _LOCK:
+            if _POOL is None:
+                _POOL = CursorPool(db, get_settings().duckdb_pool_size)
+    return _POOL
+
+
+def close_db() -> None:
+    global _DB, _POOL
+    with _LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+        if _DB is not None:
+            _DB.close()
+            _DB = None
+
+
+# Readers hold a slot on this gate while they use a pooled cursor or a
+# get_conn() cursor; a swap of the database file closes it to new readers and
+# waits for the slots to drain.
+_GATE = threading.Condition()
+_IN_FLIGHT = 0
+_SWAPPING = False
+# Nesting is tracked per execution context rather than per thread: FastAPI
+# enters and exits sync dependencies (and streaming generators) on whichever
+# threadpool worker is free, each running in a copy of the request's context.
+_DEPTH: contextvars.ContextVar[int] = contextvars.ContextVar("pooled_cursor_depth", default=0)
+
+
+@contextmanager
+def pooled_cursor() -> Iterator[duckdb.DuckDBPyConnection]:
+    """Pooled cursor on the live database; waits while a swap is in progress.
+
+    A context that already holds one is never blocked for another, so nested
+    use cannot deadlock against a pending swap.
+    """
+    global _IN_FLIGHT
+    with _GATE:
+        depth = _DEPTH.get()
+        while _SWAPPING and not depth:
+            _GATE.wait()
+        _IN_FLIGHT += 1
+    token = _DEPTH.set(depth + 1)
+    try:
+        with get_pool().cursor() as cur:
+            yield cur
+    finally:
+        with _GATE:
+            _IN_FLIGHT -= 1
+            _GATE.notify_all()
+        try:
+            _DEPTH.reset(token)
+        except ValueError:
+            # Exited from another context copy; the one holding the depth is gone.
+            pass
+
+
+def get_cursor() -> Iterator[duckdb.DuckDBPyConnection]:
+    """FastAPI dependency yielding a pooled cursor for the duration of a request."""
+    with pooled_cursor() as cur:
+        yield cur
+
+
+class GatedConnection:
+    """Cursor returned by :func:`get_conn`; holds a gate slot until it is closed.
+
+    A swap waits for it like for a pooled cursor, so it is never left
+    pointing at a closed or renamed file. Everything else is delegated to
+    the DuckDB cursor.
+    """
+
+    def __init__(self, cur: duckdb.DuckDBPyConnection):
+        self._cur = cur
+        self._held = True
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __enter__(self) -> "GatedConnection":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        global _IN_FLIGHT
+        try:
+            self._cur.close()
+        finally:
+            with _GATE:
+                if self._held:
+                    self._held = False
+                    _IN_FLIGHT -= 1
+                    _GATE.notify_all()
+
+
+def get_conn() -> GatedConnection:
+    """Standalone cursor on the shared handle, for scripts and long-running jobs.
+
+    It counts as in flight until closed, so callers must close it. Closing it
+    does not close the underlying database.
+    """
+    global _IN_FLIGHT
+    with _GATE:
+        while _SWAPPING:
+            _GATE.wait()
+        _IN_FLIGHT += 1
+    try:
+        return GatedConnection(get_db().cursor())
+    except BaseException:
+        with _GATE:
+            _IN_FLIGHT -= 1
+            _GATE.notify_all()
+        raise
+
+
+def shadow_path() -> str:
+    """Where a rebuild writes the database that will replace the live one."""
+    return f"{get_settings().duckdb_path}.next"
+
+
+def previous_path() -> str:
+    """Where the database replaced by the last swap is kept for rollback."""
+    return f"{get_settings().duckdb_path}.prev"
+
+
+def _move(src: str, dst: str) -> None:
+    """Rename a database file together with its WAL, replacing ``dst``."""
+    for suffix in ("", ".wal"):
+        if os.path.exists(dst + suffix):
+            os.remove(dst + suffix)
+        if os.path.exists(src + suffix):
+            os.replace(src + suffix, dst + suffix)
+
+
+def remove_database(path: str) -> None:
+    for suffix in ("", ".wal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+@contextmanager
+def _exclusive(timeout: float) -> Iterator[None]:
+    global _SWAPPING
+    with _GATE:
+        if _SWAPPING:
+            raise RuntimeError("A database swap is already in progress")
+        _SWAPPING = True
+        deadline = time.monotonic() + timeout
+        while _IN_FLIGHT:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _SWAPPING = False
+                _GATE.notify_all()
+                raise TimeoutError(f"{_IN_FLIGHT} request(s) still using the database after {timeout}s")
+            _GATE.wait(remaining)
+    try:
+        yield
+    finally:
+        with _GATE:
+            _SWAPPING = False
+            _GATE.notify_all()
+
+
+def _checkpoint_and_close() -> None:
+    # Idle pooled cursors can still hold an open result (and its transaction),
+    # which would keep CHECKPOINT waiting; close them first.
+    if _POOL is not None:
+        _POOL.close()
+    db = _DB
+    if db is not None:
+        try:
+            db.execute("CHECKPOINT")
+        except duckdb.Error:
+            pass  # closing the last connection checkpoints as well
+    close_db()
+
+
+def swap_database(new_path: str, expected_generation: int | None = None, timeout: float | None = None) -> None:
+    """Make ``new_path`` the live database file and reopen it.
+
+    New readers wait while in-flight ones finish (up to ``timeout`` seconds,
+    default ``SWAP_DRAIN_TIMEOUT``), then the live file is closed and kept
+    at :func:`previous_path`. If the reopened file does not report
+    ``expected_generation``, the old file is put back and the swap fails.
+    """
+    live = get_settings().duckdb_path
+    if not os.path.exists(new_path):
+        raise FileNotFoundError(f"No database to swap in at {new_path}")
+    if timeout is None:
+        timeout = get_settings().swap_drain_timeout
+    with _exclusive(timeout):
+        _checkpoint_and_close()
+        staged = f"{live}.swap"
+        _move(live, staged)
+        _move(new_path, live)
+        try:
+            generation = get_data_generation(get_db())
+            if expected_generation is not None and generation != expected_generation:
+                raise RuntimeError(
+                    f"Swapped database reports generation {generation}, expected {expected_generation}"
+                )
+        except Exception:
+            close_db()
+            _move(live, new_path)
+            _move(staged, live)
+            get_db()
+            raise
+        _move(staged, previous_path())
@@ -1,36 +1,28 @@
 from __future__ import annotations
 
-import os
-import tempfile
-from typing import Optional, List
+import csv
+import io
+import time
+from typing import Iterator, Optional, List
 
-from fastapi import APIRouter, Query, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse
-from openpyxl import Workbook
-from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+import duckdb
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import StreamingResponse
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as paipc
+import pyarrow.parquet as pq
 
-from .db import get_conn
+from .db import DERIVED_COLUMNS, get_cursor, pooled_cursor
+from .metrics import QUERY_LATENCY, QUERY_ROWS
+from .partitions import PARTITION_COLUMNS
 from .settings import get_settings
 from . import query as qlib
+from .xlsx import ChunkSink, iter_xlsx
 
 router = APIRouter()
 
 
-def _apply_permanent_filters(
-    entidad: Optional[str],
-    departamento: Optional[str],
-    municipio: Optional[str],
-):
-    s = get_settings()
-    if s.filter_entidad:
-        entidad = s.filter_entidad
-    if s.filter_departamento:
-        departamento = s.filter_departamento
-    if s.filter_municipio:
-        municipio = s.filter_municipio
-    return entidad, departamento, municipio
-
-
 def _build_where(
     anno: Optional[int],
     anno_min: Optional[int],
@@ -46,6 +38,7 @@ def _build_where(
     bpin: Optional[str],
     estado: Optional[str],
     q: Optional[str],
+    text: Optional[str] = None,
 ):
     return qlib._build_filters(
         anno,
@@ -62,6 +55,7 @@ def _build_where(
         bpin,
         estado,
         q,
+        text,
     )
 
 
@@ -75,7 +69,9 @@ def _parse_cols(cols: Optional[str]) -> Optional[List[str]]:
 
 
 def _get_available_columns(conn) -> List[str]:
-    return [r[1] for r in conn.execute("PRAGMA table_info('procesos_secop1')").fetchall()]
+    # Derived shadow columns and partition keys are internal filtering aids, not exportable data.
+    rows = conn.execute("PRAGMA table_info('procesos_secop1')").fetchall()
+    return [r[1] for r in rows if r[1] not in DERIVED_COLUMNS and r[1] not in PARTITION_COLUMNS]
 
 
 def _get_excluded_columns() -> set:
@@ -98,25 +94,103 @@ def _validate_cols(conn, cols: Optional[List[str]]) -> List[str]:
     return cols
 
 
-@router.get("/csv")
-def export_csv(
-    background_tasks: BackgroundTasks,
-    anno: Optional[int] = None,
-    anno_min: Optional[int] = None,
-    anno_max: Optional[int] = None,
-    modalidad: Optional[str] = None,
-    destino: Optional[str] = None,
-    entidad: Optional[str] = None,
-    departamento: Optional[str] = None,
-    municipio: Optional[str] = None,
-    cuantia_min: Optional[float] = None,
-    cuantia_max: Optional[float] = None,
-    bpin: Optional[str] = None,
-    estado: Optional[str] = None,
-    q: Optional[str] = None,
-    cols: Optional[str] = None,
+EXPORT_BATCH_ROWS = 10000
+# Matches DuckDB's default row group size so Parquet row groups stay useful.
+PARQUET_BATCH_ROWS = 122880
+
+
+def _iter_record_batches(sql: str, params: list, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """Yield the query result as Arrow record batches, starting with an empty one.
+
+    Streaming bodies are consumed after the request dependencies have exited,
+    so the generator holds its own pooled cursor for as long as it runs. The
+    leading empty batch carries the schema so writers can emit headers even
+    when nothing matches. Only the time spent in DuckDB is recorded as the
+    ``export`` query; exports are expected to be slow, so they stay out of
+    the slow-query log.
+    """
+    with pooled_cursor() as cur:
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        reader = cur.fetch_record_batch(batch_rows)
+        elapsed = time.perf_counter() - start
+        yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+        rows = 0
+        batches = iter(reader)
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            elapsed += time.perf_counter() - start
+            if batch is None:
+                break
+            if batch.num_rows:
+                rows += batch.num_rows
+                yield batch
+        QUERY_LATENCY.observe(elapsed, query="export")
+        QUERY_ROWS.inc(rows, query="export")
+
+
+def _iter_csv(sql: str, params: list, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    batches = _iter_record_batches(sql, params, batch_rows)
+    header = io.StringIO()
+    csv.writer(header, lineterminator="\n").writerow(next(batches).schema.names)
+    yield header.getvalue().encode("utf-8")
+    options = pacsv.WriteOptions(include_header=False, quoting_style="needed")
+    for batch in batches:
+        buf = io.BytesIO()
+        pacsv.write_csv(batch, buf, options)
+        yield buf.getvalue()
+
+
+def _iter_parquet(sql: str, params: list) -> Iterator[bytes]:
+    batches = _iter_record_batches(sql, params, PARQUET_BATCH_ROWS)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, next(batches).schema, compression="zstd")
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _iter_arrow(sql: str, params: list) -> Iterator[bytes]:
+    batches = _iter_record_batches(sql, params)
+    sink = ChunkSink()
+    options = paipc.IpcWriteOptions(compression="zstd")
+    writer = paipc.new_stream(sink, next(batches).schema, options=options)
+    yield sink.drain()
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _export_sql(
+    conn: duckdb.DuckDBPyConnection,
+    cols: Optional[str],
+    anno: Optional[int],
+    anno_min: Optional[int],
+    anno_max: Optional[int],
+    modalidad: Optional[str],
+    destino: Optional[str],
+    entidad: Optional[str],
+    departamento: Optional[str],
+    municipio: Optional[str],
+    cuantia_min: Optional[float],
+    cuantia_max: Optional[float],
+    bpin: Optional[str],
+    estado: Optional[str],
+    q: Optional[str],
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
 ):
-    entidad, departamento, municipio = _apply_permanent_filters(entidad, departamento, municipio)
+    try:
+        entidad, entidad_exact, departamento, municipio = qlib.apply_profile(
+            profile, entidad, departamento, municipio,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     where_clause, params = _build_where(
         anno,
         anno_min,
@@ -124,7 +198,7 @@ def export_csv(
         modalidad,
         destino,
         entidad,
-        bool(get_settings().filter_entidad),
+        entidad_exact,
         departamento,
         municipio,
         cuantia_min,
@@ -132,30 +206,50 @@ def export_csv(
         bpin,
         estado,
         q,
+        text,
     )
-
-    conn = get_conn()
     try:
         sel_cols = _validate_cols(conn, _parse_cols(cols))
     except ValueError as exc:
-        conn.close()
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-        path = tmp.name
+    select_list = ", ".join(sel_cols)
+    sql = f"SELECT {select_list} FROM procesos_secop1 {where_clause} ORDER BY dataset_updated_at DESC"
+    return sql, params
 
-    try:
-        select_list = ", ".join(sel_cols)
-        sql = f"SELECT {select_list} FROM procesos_secop1 {where_clause} ORDER BY dataset_updated_at DESC"
-        conn.execute(f"COPY ({sql}) TO '{path}' (HEADER, DELIMITER ',')", params)
-    finally:
-        conn.close()
-    background_tasks.add_task(os.remove, path)
-    return FileResponse(path, filename="procesos_export.csv", media_type="text/csv", background=background_tasks)
+
+@router.get("/csv")
+def export_csv(
+    anno: Optional[int] = None,
+    anno_min: Optional[int] = None,
+    anno_max: Optional[int] = None,
+    modalidad: Optional[str] = None,
+    destino: Optional[str] = None,
+    entidad: Optional[str] = None,
+    departamento: Optional[str] = None,
+    municipio: Optional[str] = None,
+    cuantia_min: Optional[float] = None,
+    cuantia_max: Optional[float] = None,
+    bpin: Optional[str] = None,
+    estado: Optional[str] = None,
+    q: Optional[str] = None,
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
+    cols: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
+):
+    sql, params = _export_sql(
+        conn, cols, anno, anno_min, anno_max, modalidad, destino, entidad,
+        departamento, municipio, cuantia_min, cuantia_max, bpin, estado, q, text, profile,
+    )
+    return StreamingResponse(
+        _iter_csv(sql, params),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="procesos_export.csv"'},
+    )
 
 
 @router.get("/xlsx")
 def export_xlsx(
-    background_tasks: BackgroundTasks,
     anno: Optional[int] = None,
     anno_min: Optional[int] = None,
     anno_max: Optional[int] = None,
@@ -169,63 +263,83 @@ def export_xlsx(
     bpin: Optional[str] = None,
     estado: Optional[str] = None,
     q: Optional[str] = None,
-    limit: int = Query(20000, ge=1, le=200000),
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
     cols: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
 ):
-    entidad, departamento, municipio = _apply_permanent_filters(entidad, departamento, municipio)
-    where_clause, params = _build_where(
-        anno,
-        anno_min,
-        anno_max,
-        modalidad,
-        destino,
-        entidad,
-        bool(get_settings().filter_entidad),
-        departamento,
-        municipio,
-        cuantia_min,
-        cuantia_max,
-        bpin,
-        estado,
-        q,
+    sql, params = _export_sql(
+        conn, cols, anno, anno_min, anno_max, modalidad, destino, entidad,
+        departamento, municipio, cuantia_min, cuantia_max, bpin, estado, q, text, profile,
     )
-
-    conn = get_conn()
-    try:
-        sel_cols = _validate_cols(conn, _parse_cols(cols))
-    except ValueError as exc:
-        conn.close()
-        raise HTTPException(status_code=400, detail=str(exc)) from exc
-    try:
-        select_list = ", ".join(sel_cols)
-        sql = f"SELECT {select_list} FROM procesos_secop1 {where_clause} ORDER BY dataset_updated_at DESC LIMIT ?"
+    if limit is not None:
+        sql += " LIMIT ?"
         params = params + [limit]
-        cur = conn.execute(sql, params)
-        rows = cur.fetchall()
-        cols = [c[0] for c in cur.description]
-    finally:
-        conn.close()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "procesos"
-    ws.append(cols)
-    for row in rows:
-        cleaned = []
-        for val in row:
-            if isinstance(val, str):
-                cleaned.append(ILLEGAL_CHARACTERS_RE.sub("", val))
-            else:
-                cleaned.append(val)
-        ws.append(cleaned)
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-        path = tmp.name
-    wb.save(path)
-    background_tasks.add_task(os.remove, path)
-    return FileResponse(
-        path,
-        filename="procesos_export.xlsx",
+    return StreamingResponse(
+        iter_xlsx(_iter_record_batches(sql, params)),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        background=background_tasks,
+        headers={"Content-Disposition": 'attachment; filename="procesos_export.xlsx"'},
+    )
+
+
+@router.get("/parquet")
+def export_parquet(
+    anno: Optional[int] = None,
+    anno_min: Optional[int] = None,
+    anno_max: Optional[int] = None,
+    modalidad: Optional[str] = None,
+    destino: Optional[str] = None,
+    entidad: Optional[str] = None,
+    departamento: Optional[str] = None,
+    municipio: Optional[str] = None,
+    cuantia_min: Optional[float] = None,
+    cuantia_max: Optional[float] = None,
+    bpin: Optional[str] = None,
+    estado: Optional[str] = None,
+    q: Optional[str] = None,
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
+    cols: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
+):
+    sql, params = _export_sql(
+        conn, cols, anno, anno_min, anno_max, modalidad, destino, entidad,
+        departamento, municipio, cuantia_min, cuantia_max, bpin, estado, q, text, profile,
+    )
+    return StreamingResponse(
+        _iter_parquet(sql, params),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": 'attachment; filename="procesos_export.parquet"'},
+    )
+
+
+@router.get("/arrow")
+def export_arrow(
+    anno: Optional[int] = None,
+    anno_min: Optional[int] = None,
+    anno_max: Optional[int] = None,
+    modalidad: Optional[str] = None,
+    destino: Optional[str] = None,
+    entidad: Optional[str] = None,
+    departamento: Optional[str] = None,
+    municipio: Optional[str] = None,
+    cuantia_min: Optional[float] = None,
+    cuantia_max: Optional[float] = None,
+    bpin: Optional[str] = None,
+    estado: Optional[str] = None,
+    q: Optional[str] = None,
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
+    cols: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
+):
+    sql, params = _export_sql(
+        conn, cols, anno, anno_min, anno_max, modalidad, destino, entidad,
+        departamento, municipio, cuantia_min, cuantia_max, bpin, estado, q, text, profile,
+    )
+    return StreamingResponse(
+        _iter_arrow(sql, params),
+        media_type="application/vnd.apache.arrow.stream",
+        headers={"Content-Disposition": 'attachment; filename="procesos_export.arrows"'},
     )
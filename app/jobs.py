@@ -0,0 +1,182 @@
+"""Background sync jobs.
+
+``POST /sync/run`` submits a job and returns at once; the sync runs on its own
+thread and connection. Only one job per dataset may be queued or running at a
+time, and cancellation is cooperative: it takes effect after the page being
+written. The single-flight check only covers the current process, so scripts
+go through the API when it is running (see ``scripts/run_sync.py``).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .db import get_conn
+from .sync import SyncCancelled, rollback_database, run_incremental, run_rebuild, run_snapshot
+
+logger = logging.getLogger(__name__)
+
+JOB_HISTORY = 50
+_RUNNERS = {
+    "snapshot": run_snapshot,
+    "incremental": run_incremental,
+    "rebuild": run_rebuild,
+    "rollback": rollback_database,
+}
+_ACTIVE_STATES = ("queued", "running")
+
+
+class JobConflict(Exception):
+    """A sync for the same dataset is already queued or running."""
+
+    def __init__(self, job: "SyncJob"):
+        super().__init__(f"Sync job {job.id} is already {job.status} for {job.dataset_id}")
+        self.job = job
+
+
+@dataclass
+class SyncJob:
+    id: str
+    dataset_id: str
+    mode: str
+    status: str = "queued"
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    pages: int = 0
+    rows: int = 0
+    expected_rows: Optional[int] = None
+    error: Optional[str] = None
+    _started: Optional[float] = field(default=None, repr=False)
+    _elapsed: Optional[float] = field(default=None, repr=False)
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _thread: Optional[threading.Thread] = field(default=None, repr=False)
+
+    # Progress protocol used by run_snapshot / run_incremental.
+    def start(self, expected_rows: Optional[int]) -> None:
+        self.expected_rows = expected_rows
+        self._check_cancel()
+
+    def page_done(self, rows: int) -> None:
+        self.pages += 1
+        self.rows += rows
+        self._check_cancel()
+
+    def _check_cancel(self) -> None:
+        if self._cancel.is_set():
+            raise SyncCancelled()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes; False if ``timeout`` expired first."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.active
+
+    @property
+    def active(self) -> bool:
+        return self.status in _ACTIVE_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self._elapsed
+        if elapsed is None and self._started is not None:
+            elapsed = time.monotonic() - self._started
+        rows_per_sec = self.rows / elapsed if elapsed else None
+        eta_s = None
+        if self.status == "running" and rows_per_sec and self.expected_rows is not None:
+            eta_s = round(max(self.expected_rows - self.rows, 0) / rows_per_sec, 1)
+        return {
+            "id": self.id,
+            "dataset_id": self.dataset_id,
+            "mode": self.mode,
+            "status": self.status,
+            "cancel_requested": self._cancel.is_set(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pages": self.pages,
+            "rows": self.rows,
+            "expected_rows": self.expected_rows,
+            "elapsed_s": round(elapsed, 2) if elapsed is not None else None,
+            "rows_per_sec": round(rows_per_sec, 1) if rows_per_sec is not None else None,
+            "eta_s": eta_s,
+            "error": self.error,
+        }
+
+
+_JOBS: "OrderedDict[str, SyncJob]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _run(job: SyncJob) -> None:
+    job.status = "running"
+    job.started_at = datetime.now()
+    job._started = time.monotonic()
+    conn = None
+    try:
+        job._check_cancel()
+        conn = get_conn()
+        _RUNNERS[job.mode](conn, progress=job)
+        job.status = "succeeded"
+    except SyncCancelled:
+        job.status = "cancelled"
+    except Exception as exc:
+        logger.exception("Sync job failed", extra={"job_id": job.id, "dataset_id": job.dataset_id})
+        job.status = "failed"
+        job.error = str(exc)
+    finally:
+        if conn is not None:
+            conn.close()
+        job._elapsed = time.monotonic() - job._started
+        job.finished_at = datetime.now()
+
+
+def submit(mode: str, dataset_id: str) -> SyncJob:
+    """Start a sync job for ``dataset_id``, or raise :class:`JobConflict`.
+
+    Jobs are tracked in this process only; another process syncing the same
+    database is not detected.
+    """
+    if mode not in _RUNNERS:
+        raise ValueError(f"Invalid sync mode: {mode}")
+    with _LOCK:
+        for job in _JOBS.values():
+            if job.dataset_id == dataset_id and job.active:
+                raise JobConflict(job)
+        job = SyncJob(id=uuid.uuid4().hex, dataset_id=dataset_id, mode=mode)
+        _JOBS[job.id] = job
+        finished = [k for k, j in _JOBS.items() if not j.active]
+        for k in finished[: max(len(_JOBS) - JOB_HISTORY, 0)]:
+            del _JOBS[k]
+        job._thread = threading.Thread(target=_run, args=(job,), name=f"sync-{job.id[:8]}", daemon=True)
+        job._thread.start()
+    return job
+
+
+def get_job(job_id: str) -> Optional[SyncJob]:
+    with _LOCK:
+        return _JOBS.get(job_id)
+
+
+def list_jobs() -> List[SyncJob]:
+    with _LOCK:
+        return list(reversed(_JOBS.values()))
+
+
+def shutdown(timeout: float = 30.0) -> None:
+    """Cancel active jobs and wait for them to stop at a page boundary."""
+    with _LOCK:
+        active = [j for j in _JOBS.values() if j.active]
+    for job in active:
+        job.cancel()
+    for job in active:
+        if job._thread is not None:
+            job._thread.join(timeout)
@@ -1,14 +1,29 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from .routers import procesos, sync
-from . import exports
+from .routers import metrics as metrics_router, procesos, sync
+from . import exports, jobs
+from .db import close_db, get_pool
+from .metrics import MetricsMiddleware
 
-app = FastAPI(title="SECOP I Local Explorer", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Open the database and check the schema once, before serving requests.
+    get_pool()
+    yield
+    jobs.shutdown()
+    close_db()
+
+
+app = FastAPI(title="SECOP I Local Explorer", version="0.1.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 app.include_router(procesos.router, tags=["Procesos"])
 app.include_router(sync.router, prefix="/sync", tags=["Sync"])
 app.include_router(exports.router, prefix="/export", tags=["Export"])
+app.include_router(metrics_router.router, tags=["Metrics"])
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -0,0 +1,340 @@
+"""Process-wide metrics, served in the Prometheus text format at ``/metrics``.
+
+Counters and histograms are kept in memory per label set; they reset when
+the process restarts. Read queries go through :func:`timed_fetchall`, which
+records their latency and rows returned and keeps the slowest ones in a ring
+buffer for ``/debug/slow-queries``. Rows scanned are only known for slow
+queries re-run with ``SLOW_QUERY_PROFILE``, and are counted from those.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import duckdb
+
+from .settings import get_settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_METRICS: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        _METRICS.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _samples(self, key, value):
+        counts, total, n = value
+        lines, cumulative = [], 0
+        for bound, c in zip(self.buckets, counts):
+            cumulative += c
+            le = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        inf = _format_labels(self.labels, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{inf} {n}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {n}")
+        return lines
+
+
+HTTP_LATENCY = Histogram(
+    "secop_http_request_duration_seconds", "Request latency by route template, including streamed bodies.",
+    ["method", "route", "status"],
+)
+QUERY_LATENCY = Histogram(
+    "secop_db_query_duration_seconds", "Read query latency in DuckDB, fetch included.", ["query"],
+)
+QUERY_ROWS = Counter("secop_db_query_rows_returned_total", "Rows returned by read queries.", ["query"])
+SLOW_QUERIES = Counter("secop_db_slow_queries_total", "Read queries slower than SLOW_QUERY_MS.", ["query"])
+SLOW_QUERY_ROWS_SCANNED = Counter(
+    "secop_db_slow_query_rows_scanned_total",
+    "Rows produced by table scans of slow queries profiled with SLOW_QUERY_PROFILE.",
+    ["query"],
+)
+SYNC_PAGES = Counter("secop_sync_pages_total", "Pages written by syncs.", ["mode"])
+SYNC_ROWS = Counter("secop_sync_rows_upserted_total", "Rows upserted by syncs.", ["mode"])
+SYNC_FETCH_SECONDS = Counter(
+    "secop_sync_fetch_wait_seconds_total", "Time the sync writer waited for the next page.", ["mode"],
+)
+SYNC_UPSERT_SECONDS = Counter(
+    "secop_sync_upsert_seconds_total", "Time spent writing pages (upsert, derived tables, commit).", ["mode"],
+)
+SYNC_KEY_SCAN_ROWS = Counter(
+    "secop_sync_key_scan_rows_total",
+    "Rows seen by the incremental key scan, by whether the full row was fetched.",
+    ["result"],
+)
+SYNC_RUNS = Counter("secop_sync_runs_total", "Finished syncs by final status.", ["status"])
+SOCRATA_REQUESTS = Counter("secop_socrata_requests_total", "Successful requests to Socrata.")
+SOCRATA_RETRIES = Counter("secop_socrata_retries_total", "Socrata requests retried.")
+SOCRATA_FAILURES = Counter("secop_socrata_failures_total", "Socrata requests that exhausted their retries.")
+SOCRATA_SECONDS = Counter("secop_socrata_request_seconds_total", "Time waiting on Socrata responses.")
+SOCRATA_BYTES = Counter("secop_socrata_bytes_total", "Response bytes received from Socrata (on the wire).")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    for metric in _METRICS:
+        metric.reset()
+    with _SLOW_LOCK:
+        if _SLOW is not None:
+            _SLOW.clear()
+
+
+def record_sync_page(mode: str, rows: int, upsert_s: float) -> None:
+    SYNC_PAGES.inc(mode=mode)
+    SYNC_ROWS.inc(rows, mode=mode)
+    SYNC_UPSERT_SECONDS.inc(upsert_s, mode=mode)
+
+
+def metered(pages: Iterable[Any], mode: str) -> Iterable[Any]:
+    """Yield ``pages``, adding the time spent waiting for each to the fetch counter."""
+    it = iter(pages)
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                page = next(it)
+            except StopIteration:
+                return
+            SYNC_FETCH_SECONDS.inc(time.monotonic() - start, mode=mode)
+            yield page
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+
+
+# Slowest read queries, newest last; sized from settings on first use.
+_SLOW: Optional[Deque[Dict[str, Any]]] = None
+_SLOW_LOCK = threading.Lock()
+
+
+def _slow_log() -> Deque[Dict[str, Any]]:
+    global _SLOW
+    if _SLOW is None:
+        with _SLOW_LOCK:
+            if _SLOW is None:
+                _SLOW = deque(maxlen=max(get_settings().slow_query_log_size, 1))
+    return _SLOW
+
+
+def slow_queries(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Recorded slow queries, newest first."""
+    log = _slow_log()
+    with _SLOW_LOCK:
+        entries = list(log)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+def _plan(node: Dict[str, Any], depth: int = 0) -> List[Dict[str, Any]]:
+    out = []
+    if depth:  # the root is the query itself, not an operator
+        out.append({
+            "operator": node.get("name", "").strip(),
+            "rows": node.get("cardinality"),
+            "time_s": node.get("timing"),
+            "depth": depth - 1,
+        })
+    for child in node.get("children", []):
+        out.extend(_plan(child, depth + 1))
+    return out
+
+
+def profile_query(conn: duckdb.DuckDBPyConnection, sql: str, params: Sequence[Any]) -> Dict[str, Any]:
+    """Re-run ``sql`` with DuckDB's JSON profiler on a separate cursor.
+
+    Returns the operator tree (pre-order, with output rows and time per
+    operator) and ``rows_scanned``, the rows produced by table scans after
+    pushed-down filters.
+    """
+    fd, path = tempfile.mkstemp(prefix="duckdb_profile_", suffix=".json")
+    os.close(fd)
+    cur = conn.cursor()
+    try:
+        cur.execute("PRAGMA enable_profiling='json'")
+        cur.execute(f"PRAGMA profiling_output='{path}'")
+        cur.execute(sql, list(params)).fetchall()
+        cur.execute("PRAGMA disable_profiling")
+        with open(path, encoding="utf-8") as fh:
+            profile = json.load(fh)
+    finally:
+        cur.close()
+        os.unlink(path)
+    plan = _plan(profile)
+    scanned = sum(op["rows"] or 0 for op in plan if op["operator"].endswith("_SCAN"))
+    return {"rows_scanned": scanned, "plan": plan}
+
+
+def _record_slow(conn, name: str, sql: str, params: Sequence[Any], elapsed: float, rows: int) -> None:
+    SLOW_QUERIES.inc(query=name)
+    entry: Dict[str, Any] = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "query": name,
+        "duration_ms": round(elapsed * 1000, 1),
+        "rows_returned": rows,
+        "sql": re.sub(r"\s+", " ", sql).strip(),
+        "params": [p if isinstance(p, (int, float)) or p is None else str(p)[:200] for p in params],
+        "rows_scanned": None,
+        "plan": None,
+    }
+    if get_settings().slow_query_profile:
+        try:
+            entry.update(profile_query(conn, sql, params))
+            SLOW_QUERY_ROWS_SCANNED.inc(entry["rows_scanned"], query=name)
+        except (duckdb.Error, OSError, ValueError) as exc:
+            entry["profile_error"] = str(exc)
+    log = _slow_log()
+    with _SLOW_LOCK:
+        log.append(entry)
+
+
+def timed_fetchall(conn: duckdb.DuckDBPyConnection, name: str, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Execute a read query and fetch all rows, recording it under ``name``.
+
+    ``conn.description`` still describes this query afterwards.
+    """
+    start = time.perf_counter()
+    rows = conn.execute(sql, params).fetchall()
+    elapsed = time.perf_counter() - start
+    record_query(conn, name, sql, params, elapsed, len(rows))
+    return rows
+
+
+def record_query(conn, name: str, sql: str, params: Sequence[Any], elapsed: float, rows: int) -> None:
+    QUERY_LATENCY.observe(elapsed, query=name)
+    QUERY_ROWS.inc(rows, query=name)
+    if elapsed * 1000 >= get_settings().slow_query_ms:
+        _record_slow(conn, name, sql, params, elapsed, rows)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request until its body is fully sent.
+
+    Routes are labelled by their template (``/catalogos/{catalogo}``), so
+    path parameters do not multiply the series; unmatched paths share one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_LATENCY.observe(
+                time.perf_counter() - start, method=scope["method"], route=route, status=status[0],
+            )
@@ -0,0 +1,276 @@
+"""Parquet storage for ``procesos_secop1``, partitioned by year and departamento.
+
+With ``STORAGE_BACKEND=parquet`` the rows live in Hive-style directories
+under ``PARQUET_DIR``::
+
+    part_anno=2023/part_departamento=LA_GUAJIRA/data.parquet
+
+and ``procesos_secop1`` becomes a view over those files plus
+``procesos_stage``, the DuckDB table the sync upserts into. Staged rows
+shadow their older versions in the files, so the view is always current.
+:func:`flush` merges the stage into the files, rewriting only the
+partitions that hold staged rows (or held their previous versions), and
+applies the catalog/rollup deltas for them.
+
+Partition values are sanitized keys, not the column values themselves:
+years outside 1000-9999 (or missing) share the ``_`` partition and
+departamentos keep only ``A-Z0-9``. A key can therefore hold several
+values; the query layer adds partition predicates next to the regular
+filters (:func:`partition_filters`) so DuckDB skips the other directories.
+"""
+from __future__ import annotations
+
+import glob
+import logging
+import os
+import re
+from typing import Any, List, Optional, Tuple
+
+import duckdb
+
+from .db import (
+    CATALOG_COLUMNS,
+    ROLLUP_DIMENSIONS,
+    apply_catalog_delta,
+    apply_rollup_delta,
+    create_procesos_table,
+    is_view,
+)
+
+logger = logging.getLogger(__name__)
+
+STAGE_TABLE = "procesos_stage"
+PARTITION_COLUMNS = ["part_anno", "part_departamento"]
+OTHER = "_"
+_KEY_LENGTH = 60
+
+# SQL for the partition keys of a procesos row; must match anno_key/departamento_key.
+ANNO_KEY_SQL = (
+    f"CASE WHEN anno_firma_int BETWEEN 1000 AND 9999 THEN CAST(anno_firma_int AS VARCHAR) ELSE '{OTHER}' END"
+)
+DEPARTAMENTO_KEY_SQL = (
+    f"COALESCE(NULLIF(left(regexp_replace(departamento_entidad_norm, '[^A-Z0-9]', '_', 'g'), {_KEY_LENGTH}), ''), "
+    f"'{OTHER}')"
+)
+
+_NON_KEY = re.compile(r"[^A-Z0-9]")
+
+
+def anno_key(anno: Optional[int]) -> str:
+    return str(anno) if anno is not None and 1000 <= anno <= 9999 else OTHER
+
+
+def departamento_key(departamento_norm: Optional[str]) -> str:
+    return _NON_KEY.sub("_", departamento_norm or "")[:_KEY_LENGTH] or OTHER
+
+
+def partition_filters(
+    anno: Optional[int],
+    anno_min: Optional[int],
+    anno_max: Optional[int],
+    departamento_norm: Optional[str],
+) -> Tuple[List[str], List[Any]]:
+    """Clauses on the partition columns implied by the year/departamento filters.
+
+    They never exclude a matching row, so they are added alongside (not
+    instead of) the clauses on the real columns. ``_`` sorts after digits,
+    which keeps the odd-years partition in every ``>=`` range.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    if anno is not None:
+        clauses.append("part_anno = ?")
+        params.append(anno_key(anno))
+    if anno_min is not None and 1000 <= anno_min <= 9999:
+        clauses.append("part_anno >= ?")
+        params.append(str(anno_min))
+    if anno_max is not None and 1000 <= anno_max <= 9999:
+        clauses.append(f"(part_anno <= ? OR part_anno = '{OTHER}')")
+        params.append(str(anno_max))
+    if departamento_norm:
+        clauses.append("part_departamento = ?")
+        params.append(departamento_key(departamento_norm))
+    return clauses, params
+
+
+def _quote(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _has_files(parquet_dir: str) -> bool:
+    return bool(glob.glob(os.path.join(parquet_dir, "part_anno=*", "part_departamento=*", "*.parquet")))
+
+
+def _scan_sql(parquet_dir: str) -> str:
+    # No union_by_name: it reads every file's schema at bind time, which
+    # defeats pruning. All files are written from procesos_stage.
+    pattern = os.path.join(os.path.abspath(parquet_dir), "part_anno=*", "part_departamento=*", "*.parquet")
+    return (
+        f"read_parquet({_quote(pattern)}, hive_partitioning = true, "
+        "hive_types = {'part_anno': VARCHAR, 'part_departamento': VARCHAR})"
+    )
+
+
+def _create_view(conn: duckdb.DuckDBPyConnection, parquet_dir: str) -> None:
+    sql = f"""
+        SELECT *, {ANNO_KEY_SQL} AS part_anno, {DEPARTAMENTO_KEY_SQL} AS part_departamento
+        FROM {STAGE_TABLE}
+    """
+    if _has_files(parquet_dir):
+        sql += f"""
+        UNION ALL BY NAME
+        SELECT * FROM {_scan_sql(parquet_dir)}
+        WHERE uid NOT IN (SELECT uid FROM {STAGE_TABLE})
+        """
+    conn.execute(f"CREATE OR REPLACE VIEW procesos_secop1 AS {sql}")
+
+
+def _pending(conn: duckdb.DuckDBPyConnection) -> bool:
+    row = conn.execute("SELECT pending FROM partition_flush").fetchone()
+    return bool(row and row[0])
+
+
+def _set_pending(conn: duckdb.DuckDBPyConnection, pending: bool) -> None:
+    conn.execute("DELETE FROM partition_flush")
+    conn.execute("INSERT INTO partition_flush VALUES (?, NOW())", [pending])
+
+
+def attach(conn: duckdb.DuckDBPyConnection, parquet_dir: str) -> None:
+    """Serve ``procesos_secop1`` from partition files, moving a table's rows there once."""
+    os.makedirs(parquet_dir, exist_ok=True)
+    create_procesos_table(conn, STAGE_TABLE)
+    # pending: the staged rows are already counted in catalog_values and
+    # stats_rollup, and only the file rewrite is left.
+    conn.execute("CREATE TABLE IF NOT EXISTS partition_flush (pending BOOLEAN, updated_ts TIMESTAMP)")
+    if not is_view(conn, "procesos_secop1"):
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"INSERT INTO {STAGE_TABLE} BY NAME SELECT * FROM procesos_secop1")
+            conn.execute("DROP TABLE procesos_secop1")
+            _set_pending(conn, True)
+            _create_view(conn, parquet_dir)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    else:
+        _create_view(conn, parquet_dir)
+    if _pending(conn):
+        flush(conn, parquet_dir)
+
+
+def detach(conn: duckdb.DuckDBPyConnection, parquet_dir: str) -> None:
+    """Load the partition files back into a ``procesos_secop1`` table.
+
+    The files are left in place.
+    """
+    flush(conn, parquet_dir)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute("DROP VIEW procesos_secop1")
+        create_procesos_table(conn)
+        if _has_files(parquet_dir):
+            conn.execute(f"""
+                INSERT INTO procesos_secop1 BY NAME
+                SELECT * EXCLUDE ({', '.join(PARTITION_COLUMNS)}) FROM {_scan_sql(parquet_dir)}
+            """)
+        conn.execute(f"DROP TABLE {STAGE_TABLE}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def staged_rows(conn: duckdb.DuckDBPyConnection) -> int:
+    return int(conn.execute(f"SELECT COUNT(*) FROM {STAGE_TABLE}").fetchone()[0])
+
+
+def _rewrite_partition(conn: duckdb.DuckDBPyConnection, parquet_dir: str, anno: str, departamento: str) -> int:
+    directory = os.path.join(parquet_dir, f"part_anno={anno}", f"part_departamento={departamento}")
+    target = os.path.join(directory, "data.parquet")
+    parts = [f"SELECT * FROM {STAGE_TABLE} WHERE {ANNO_KEY_SQL} = ? AND {DEPARTAMENTO_KEY_SQL} = ?"]
+    params: List[Any] = [anno, departamento]
+    if os.path.exists(target):
+        parts.append(
+            f"SELECT * FROM read_parquet({_quote(target)}, hive_partitioning = false) "
+            f"WHERE uid NOT IN (SELECT uid FROM {STAGE_TABLE})"
+        )
+    os.makedirs(directory, exist_ok=True)
+    tmp = target + ".tmp"
+    rows = conn.execute(
+        f"COPY ({' UNION ALL BY NAME '.join(parts)}) TO {_quote(tmp)} (FORMAT parquet, COMPRESSION zstd)",
+        params,
+    ).fetchone()[0]
+    if rows:
+        os.replace(tmp, target)
+    else:
+        os.remove(tmp)
+        if os.path.exists(target):
+            os.remove(target)
+        os.rmdir(directory)
+    return int(rows)
+
+
+def flush(conn: duckdb.DuckDBPyConnection, parquet_dir: str) -> int:
+    """Merge the staged rows into their partition files and empty the stage.
+
+    The catalog/rollup deltas (staged rows against their versions in the
+    files) are committed first together with a pending mark; the files are
+    then rewritten one partition at a time and the stage is cleared. A flush
+    interrupted in between is finished by the next one, and readers see the
+    same rows throughout because staged rows shadow the files. Returns the
+    number of rows flushed.
+    """
+    staged = staged_rows(conn)
+    if not staged:
+        if _pending(conn):
+            _set_pending(conn, False)
+        return 0
+    has_files = _has_files(parquet_dir)
+    if not _pending(conn):
+        image_cols = ", ".join(dict.fromkeys(
+            CATALOG_COLUMNS + ROLLUP_DIMENSIONS + ["cuantia_contrato", "cuantia_proceso"]
+        ))
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            before = None
+            if has_files:
+                conn.execute(f"""
+                    CREATE OR REPLACE TEMP TABLE stage_before AS
+                    SELECT {image_cols} FROM {_scan_sql(parquet_dir)}
+                    WHERE uid IN (SELECT uid FROM {STAGE_TABLE})
+                """)
+                before = "stage_before"
+            apply_catalog_delta(conn, before, STAGE_TABLE)
+            apply_rollup_delta(conn, before, STAGE_TABLE)
+            _set_pending(conn, True)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Partitions of the staged rows, plus those holding their old versions
+    # (a row moves when its year or departamento changes).
+    affected_sql = f"SELECT DISTINCT {ANNO_KEY_SQL}, {DEPARTAMENTO_KEY_SQL} FROM {STAGE_TABLE}"
+    if has_files:
+        affected_sql += f"""
+            UNION
+            SELECT DISTINCT part_anno, part_departamento FROM {_scan_sql(parquet_dir)}
+            WHERE uid IN (SELECT uid FROM {STAGE_TABLE})
+        """
+    affected = conn.execute(affected_sql).fetchall()
+    for anno, departamento in affected:
+        _rewrite_partition(conn, parquet_dir, anno, departamento)
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"DELETE FROM {STAGE_TABLE}")
+        _set_pending(conn, False)
+        # The view only reads the files once there are some.
+        _create_view(conn, parquet_dir)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info("Flushed staged rows to partitions", extra={"rows": staged, "partitions": len(affected)})
+    return staged
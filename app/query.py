@@ -1,18 +1,19 @@
+import base64
+import binascii
+import json
+import re
+import unicodedata
+from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 import duckdb
 
+from .cache import LRUCache, clear_all
+from .db import CATALOG_COLUMNS, TEXT_STOPWORDS, get_data_generation
+from .metrics import timed_fetchall
+from .partitions import partition_filters
 from .settings import get_settings
 
-ALLOWED_CATALOG_COLUMNS = {
-    "anno_firma_contrato",
-    "modalidad_de_contratacion",
-    "destino_gasto",
-    "nombre_entidad",
-    "departamento_entidad",
-    "municipio_entidad",
-    "estado_del_proceso",
-    "codigo_bpin",
-}
+ALLOWED_CATALOG_COLUMNS = set(CATALOG_COLUMNS)
 
 SELECT_COLUMNS = [
     "uid",
@@ -34,17 +35,87 @@ SELECT_COLUMNS = [
     "dataset_updated_at",
 ]
 
+# Totals per (filters, data generation): paging through one filter set
+# counts once, and any sync invalidates by bumping the generation.
+_TOTALS = LRUCache(512)
+
+# Catalog listings per (generation, column, departamento, municipio), read
+# from the materialized catalog_values table.
+_CATALOGS = LRUCache(256)
+
+
+def clear_caches() -> None:
+    clear_all()
+
 
 def _get_preview_columns() -> List[str]:
     excluded = set(get_settings().export_exclude or [])
     return [c for c in SELECT_COLUMNS if c not in excluded]
 
-def _normalize_sql(expr: str) -> str:
-    return (
-        "UPPER(translate("
-        + expr
-        + ", 'ÁÉÍÓÚÜÑáéíóúüñ', 'AEIOUUNaeiouun'))"
-    )
+def apply_profile(
+    profile: Optional[str],
+    entidad: Optional[str],
+    departamento: Optional[str],
+    municipio: Optional[str],
+) -> Tuple[Optional[str], bool, Optional[str], Optional[str]]:
+    """Overlay a filter profile's permanent filters on the request's.
+
+    Returns ``(entidad, entidad_exact, departamento, municipio)``; a profile's
+    entidad matches exactly. ``None`` selects the default profile and an
+    unknown name raises ``ValueError``.
+    """
+    p = get_settings().get_profile(profile)
+    entidad_exact = False
+    if p.entidad:
+        entidad = p.entidad
+        entidad_exact = True
+    if p.departamento:
+        departamento = p.departamento
+    if p.municipio:
+        municipio = p.municipio
+    return entidad, entidad_exact, departamento, municipio
+
+_FOLD_ACCENTS = str.maketrans("ÁÉÍÓÚÜÑáéíóúüñ", "AEIOUUNaeiouun")
+
+
+def _normalize_value(value: str) -> str:
+    """Python counterpart of ``db.normalize_sql`` for filter parameters."""
+    return value.translate(_FOLD_ACCENTS).upper()
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Query-side tokenizer matching ``db.refresh_text_index``."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    tokens = []
+    for token in _TOKEN_SPLIT.split(folded):
+        if len(token) >= 2 and token not in TEXT_STOPWORDS and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def _text_match_sql(tokens: List[str]) -> Tuple[str, List[Any]]:
+    """Subquery of ``(uid, score)`` for rows containing every token.
+
+    The score is a TF-IDF sum over the query tokens, with document
+    frequencies taken from the index itself.
+    """
+    placeholders = ", ".join(["?"] * len(tokens))
+    sql = f"""
+        SELECT t.uid, SUM(t.tf * ln(1 + n.total / d.df)) AS score
+        FROM procesos_tokens t
+        JOIN (
+            SELECT token, COUNT(*) AS df FROM procesos_tokens WHERE token IN ({placeholders}) GROUP BY token
+        ) d USING (token)
+        CROSS JOIN (SELECT COUNT(*) AS total FROM procesos_secop1) n
+        WHERE t.token IN ({placeholders})
+        GROUP BY t.uid
+        HAVING COUNT(*) = ?
+    """
+    return sql, tokens + tokens + [len(tokens)]
+
 
 def _build_filters(
     anno: Optional[int],
@@ -61,18 +132,25 @@ def _build_filters(
     bpin: Optional[str],
     estado: Optional[str],
     q: Optional[str],
+    text: Optional[str] = None,
+    prune: bool = True,
 ) -> Tuple[str, List[Any]]:
+    """WHERE clause for ``procesos_secop1`` (and ``stats_rollup`` with ``prune=False``).
+
+    With the parquet backend, ``prune`` adds the partition predicates for
+    the year and departamento filters.
+    """
     clauses = []
     params: List[Any] = []
 
     if anno is not None:
-        clauses.append("TRY_CAST(anno_firma_contrato AS INTEGER) = ?")
+        clauses.append("anno_firma_int = ?")
         params.append(anno)
     if anno_min is not None:
-        clauses.append("TRY_CAST(anno_firma_contrato AS INTEGER) >= ?")
+        clauses.append("anno_firma_int >= ?")
         params.append(anno_min)
     if anno_max is not None:
-        clauses.append("TRY_CAST(anno_firma_contrato AS INTEGER) <= ?")
+        clauses.append("anno_firma_int <= ?")
         params.append(anno_max)
     if modalidad:
         clauses.append("modalidad_de_contratacion = ?")
@@ -82,13 +160,13 @@ def _build_filters(
         params.append(destino)
     if entidad:
         if entidad_exact:
-            clauses.append(f"{_normalize_sql('nombre_entidad')} = {_normalize_sql('?')}")
-            params.append(entidad)
+            clauses.append("nombre_entidad_norm = ?")
+            params.append(_normalize_value(entidad))
         else:
             clauses.append("nombre_entidad ILIKE ?")
             params.append(f"%{entidad}%")
-    _add_case_insensitive_filter(clauses, params, "departamento_entidad", departamento)
-    _add_case_insensitive_filter(clauses, params, "municipio_entidad", municipio)
+    _add_normalized_filter(clauses, params, "departamento_entidad_norm", departamento)
+    _add_normalized_filter(clauses, params, "municipio_entidad_norm", municipio)
     if cuantia_min is not None:
         clauses.append("cuantia_contrato >= ?")
         params.append(cuantia_min)
@@ -105,6 +183,18 @@ def _build_filters(
         clauses.append("(nombre_entidad ILIKE ? OR municipio_entidad ILIKE ? OR departamento_entidad ILIKE ?)")
         like = f"%{q}%"
         params.extend([like, like, like])
+    if text:
+        tokens = _tokenize(text)
+        if tokens:
+            match_sql, match_params = _text_match_sql(tokens)
+            clauses.append(f"uid IN (SELECT uid FROM ({match_sql}))")
+            params.extend(match_params)
+    if prune and get_settings().storage_backend == "parquet":
+        part_clauses, part_params = partition_filters(
+            anno, anno_min, anno_max, _normalize_value(departamento) if departamento else None,
+        )
+        clauses.extend(part_clauses)
+        params.extend(part_params)
 
     if not clauses:
         return "", params
@@ -112,15 +202,15 @@ def _build_filters(
     return "WHERE " + " AND ".join(clauses), params
 
 
-def _add_case_insensitive_filter(
+def _add_normalized_filter(
     clauses: List[str],
     params: List[Any],
     column: str,
     value: Optional[str],
 ) -> None:
     if value:
-        clauses.append(f"UPPER({column}) = UPPER(?)")
-        params.append(value)
+        clauses.append(f"{column} = ?")
+        params.append(_normalize_value(value))
 
 
 def _rows_to_dicts(cursor: duckdb.DuckDBPyConnection, rows: List[tuple]) -> List[Dict[str, Any]]:
@@ -128,7 +218,38 @@ def _rows_to_dicts(cursor: duckdb.DuckDBPyConnection, rows: List[tuple]) -> List
     return [dict(zip(cols, row)) for row in rows]
 
 
-def list_procesos(
+def _encode_cursor(direction: str, updated_at: Optional[datetime], uid: str) -> str:
+    payload = [direction, updated_at.isoformat() if updated_at else None, uid]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, Optional[datetime], str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, updated_at, uid = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ("next", "prev") or not isinstance(uid, str):
+            raise ValueError
+        return direction, datetime.fromisoformat(updated_at) if updated_at else None, uid
+    except (ValueError, TypeError, binascii.Error) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _keyset_clause(direction: str, updated_at: Optional[datetime], uid: str) -> Tuple[str, List[Any]]:
+    """Rows after (``next``) or before (``prev``) a key in the listing order
+    ``dataset_updated_at DESC NULLS LAST, uid DESC``."""
+    if direction == "next":
+        if updated_at is None:
+            return "(dataset_updated_at IS NULL AND uid < ?)", [uid]
+        return (
+            "(dataset_updated_at < ? OR dataset_updated_at IS NULL OR (dataset_updated_at = ? AND uid < ?))",
+            [updated_at, updated_at, uid],
+        )
+    if updated_at is None:
+        return "(dataset_updated_at IS NOT NULL OR uid > ?)", [uid]
+    return "(dataset_updated_at > ? OR (dataset_updated_at = ? AND uid > ?))", [updated_at, updated_at, uid]
+
+
+def list_procesos_page(
     conn: duckdb.DuckDBPyConnection,
     anno: Optional[int],
     anno_min: Optional[int],
@@ -146,7 +267,15 @@ def list_procesos(
     q: Optional[str],
     limit: int,
     offset: int,
-) -> List[Dict[str, Any]]:
+    text: Optional[str] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """One page of procesos plus opaque ``next_cursor``/``prev_cursor``.
+
+    With a cursor the page is located by keyset on
+    ``(dataset_updated_at, uid)`` and ``offset`` is ignored, so every page
+    costs the same as the first. Text-ranked listings only page by offset.
+    """
     where_clause, params = _build_filters(
         anno,
         anno_min,
@@ -165,11 +294,96 @@ def list_procesos(
     )
 
     preview_columns = _get_preview_columns()
-    sql = f"SELECT {', '.join(preview_columns)} FROM procesos_secop1 {where_clause} ORDER BY dataset_updated_at DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
-    cur = conn.execute(sql, params)
-    rows = cur.fetchall()
-    return _rows_to_dicts(cur, rows)
+    tokens = _tokenize(text) if text else []
+    if tokens:
+        if cursor:
+            raise ValueError("cursor cannot be combined with text search")
+        # Ranked search: join the match scores instead of filtering with IN.
+        match_sql, match_params = _text_match_sql(tokens)
+        sql = (
+            f"SELECT {', '.join(preview_columns)} FROM procesos_secop1 JOIN ({match_sql}) m USING (uid) "
+            f"{where_clause} ORDER BY m.score DESC, dataset_updated_at DESC, uid DESC LIMIT ? OFFSET ?"
+        )
+        params = match_params + params + [limit, offset]
+        rows = timed_fetchall(conn, "procesos_search", sql, params)
+        return {"items": _rows_to_dicts(conn, rows), "next_cursor": None, "prev_cursor": None}
+
+    direction = "next"
+    if cursor:
+        direction, key_ts, key_uid = _decode_cursor(cursor)
+        key_sql, key_params = _keyset_clause(direction, key_ts, key_uid)
+        where_clause = f"{where_clause} AND {key_sql}" if where_clause else f"WHERE {key_sql}"
+        params.extend(key_params)
+        offset = 0
+    order = "dataset_updated_at DESC NULLS LAST, uid DESC"
+    if direction == "prev":
+        order = "dataset_updated_at ASC NULLS FIRST, uid ASC"
+
+    # Key columns ride along for the cursors and are dropped from the items.
+    select_cols = preview_columns + [c for c in ("dataset_updated_at", "uid") if c not in preview_columns]
+    sql = f"SELECT {', '.join(select_cols)} FROM procesos_secop1 {where_clause} ORDER BY {order} LIMIT ? OFFSET ?"
+    params.extend([limit + 1, offset])
+    rows = _rows_to_dicts(conn, timed_fetchall(conn, "procesos_page", sql, params))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "prev":
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if direction == "next":
+            next_more, prev_more = has_more, bool(cursor) or offset > 0
+        else:
+            next_more, prev_more = True, has_more
+        if next_more:
+            next_cursor = _encode_cursor("next", last["dataset_updated_at"], last["uid"])
+        if prev_more:
+            prev_cursor = _encode_cursor("prev", first["dataset_updated_at"], first["uid"])
+    items = [{c: row[c] for c in preview_columns} for row in rows]
+    return {"items": items, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+
+def list_procesos(
+    conn: duckdb.DuckDBPyConnection,
+    anno: Optional[int],
+    anno_min: Optional[int],
+    anno_max: Optional[int],
+    modalidad: Optional[str],
+    destino: Optional[str],
+    entidad: Optional[str],
+    entidad_exact: bool,
+    departamento: Optional[str],
+    municipio: Optional[str],
+    cuantia_min: Optional[float],
+    cuantia_max: Optional[float],
+    bpin: Optional[str],
+    estado: Optional[str],
+    q: Optional[str],
+    limit: int,
+    offset: int,
+    text: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    return list_procesos_page(
+        conn,
+        anno,
+        anno_min,
+        anno_max,
+        modalidad,
+        destino,
+        entidad,
+        entidad_exact,
+        departamento,
+        municipio,
+        cuantia_min,
+        cuantia_max,
+        bpin,
+        estado,
+        q,
+        limit,
+        offset,
+        text,
+    )["items"]
 
 
 def count_procesos(
@@ -188,6 +402,7 @@ def count_procesos(
     bpin: Optional[str],
     estado: Optional[str],
     q: Optional[str],
+    text: Optional[str] = None,
 ) -> int:
     where_clause, params = _build_filters(
         anno,
@@ -204,41 +419,66 @@ def count_procesos(
         bpin,
         estado,
         q,
+        text,
     )
 
+    key = (where_clause, tuple(params), get_data_generation(conn))
+    cached = _TOTALS.get(key)
+    if cached is not None:
+        return cached
+
     sql = f"SELECT COUNT(*) FROM procesos_secop1 {where_clause}"
-    row = conn.execute(sql, params).fetchone()
-    return int(row[0]) if row else 0
+    rows = timed_fetchall(conn, "count_procesos", sql, params)
+    total = int(rows[0][0]) if rows else 0
+    _TOTALS.put(key, total)
+    return total
 
 
-def list_catalog(
+def list_catalog_counts(
     conn: duckdb.DuckDBPyConnection,
     column: str,
     limit: int,
     q: Optional[str],
     departamento: Optional[str],
     municipio: Optional[str],
-) -> List[Any]:
+) -> List[Dict[str, Any]]:
     if column not in ALLOWED_CATALOG_COLUMNS:
         raise ValueError("Invalid catalog column")
 
-    params: List[Any] = []
-    sql = f"SELECT DISTINCT {column} AS value FROM procesos_secop1 WHERE {column} IS NOT NULL"
+    dep = _normalize_value(departamento) if departamento else None
+    mun = _normalize_value(municipio) if municipio else None
+    generation = get_data_generation(conn)
+    key = (generation, column, dep, mun)
+    entries = _CATALOGS.get(key)
+
+    if entries is None:
+        params: List[Any] = [column]
+        sql = "SELECT value, SUM(n)::BIGINT FROM catalog_values WHERE column_name = ?"
+        if dep:
+            sql += " AND departamento_norm = ?"
+            params.append(dep)
+        if mun:
+            sql += " AND municipio_norm = ?"
+            params.append(mun)
+        sql += " GROUP BY value ORDER BY value"
+        entries = [(r[0], int(r[1])) for r in timed_fetchall(conn, "catalog", sql, params)]
+        _CATALOGS.put(key, entries)
 
     if q:
-        sql += f" AND CAST({column} AS VARCHAR) ILIKE ?"
-        params.append(f"%{q}%")
-    extra_clauses: List[str] = []
-    _add_case_insensitive_filter(extra_clauses, params, "departamento_entidad", departamento)
-    _add_case_insensitive_filter(extra_clauses, params, "municipio_entidad", municipio)
-    if extra_clauses:
-        sql += " AND " + " AND ".join(extra_clauses)
+        needle = q.lower()
+        entries = [e for e in entries if needle in str(e[0]).lower()]
+    return [{"value": value, "count": count} for value, count in entries[:limit]]
 
-    sql += " ORDER BY value LIMIT ?"
-    params.append(limit)
 
-    rows = conn.execute(sql, params).fetchall()
-    return [r[0] for r in rows]
+def list_catalog(
+    conn: duckdb.DuckDBPyConnection,
+    column: str,
+    limit: int,
+    q: Optional[str],
+    departamento: Optional[str],
+    municipio: Optional[str],
+) -> List[Any]:
+    return [e["value"] for e in list_catalog_counts(conn, column, limit, q, departamento, municipio)]
 
 
 def get_stats(
@@ -257,7 +497,13 @@ def get_stats(
     bpin: Optional[str],
     estado: Optional[str],
     q: Optional[str],
+    text: Optional[str] = None,
 ) -> Dict[str, Any]:
+    # entidad only maps to a rollup dimension in exact mode; the other
+    # filters listed here have no dimension and need the base table.
+    rollup_ok = (entidad is None or entidad_exact) and not any(
+        [cuantia_min is not None, cuantia_max is not None, bpin, q, text]
+    )
     where_clause, params = _build_filters(
         anno,
         anno_min,
@@ -273,21 +519,40 @@ def get_stats(
         bpin,
         estado,
         q,
+        text,
+        prune=not rollup_ok,
     )
+    if rollup_ok:
+        sql = f"""
+            SELECT
+                SUM(n) AS total,
+                SUM(cc) AS total_cuantia_contrato,
+                SUM(cp) AS total_cuantia_proceso,
+                MIN(anno_firma_int) AS min_anno_firma_contrato,
+                MAX(anno_firma_int) AS max_anno_firma_contrato
+            FROM (
+                SELECT anno_firma_int, SUM(n) AS n, SUM(sum_cuantia_contrato) AS cc,
+                       SUM(sum_cuantia_proceso) AS cp
+                FROM stats_rollup {where_clause}
+                GROUP BY anno_firma_int
+                HAVING SUM(n) > 0
+            )
+        """
+    else:
+        sql = f"""
+            SELECT
+                COUNT(*) AS total,
+                SUM(cuantia_contrato) AS total_cuantia_contrato,
+                SUM(cuantia_proceso) AS total_cuantia_proceso,
+                MIN(anno_firma_int) AS min_anno_firma_contrato,
+                MAX(anno_firma_int) AS max_anno_firma_contrato
+            FROM procesos_secop1 {where_clause}
+        """
 
-    sql = f"""
-        SELECT
-            COUNT(*) AS total,
-            SUM(cuantia_contrato) AS total_cuantia_contrato,
-            SUM(cuantia_proceso) AS total_cuantia_proceso,
-            MIN(anno_firma_contrato) AS min_anno_firma_contrato,
-            MAX(anno_firma_contrato) AS max_anno_firma_contrato
-        FROM procesos_secop1 {where_clause}
-    """
-
-    row = conn.execute(sql, params).fetchone()
-    if not row:
+    rows = timed_fetchall(conn, "stats", sql, params)
+    if not rows:
         return {"total": 0}
+    row = rows[0]
 
     return {
         "total": int(row[0]) if row[0] is not None else 0,
@@ -296,3 +561,109 @@ def get_stats(
         "min_anno_firma_contrato": int(row[3]) if row[3] is not None else None,
         "max_anno_firma_contrato": int(row[4]) if row[4] is not None else None,
     }
+
+
+GROUP_METRICS = {
+    "count": "n",
+    "cuantia_contrato": "cc",
+    "cuantia_proceso": "cp",
+}
+
+
+def group_stats(
+    conn: duckdb.DuckDBPyConnection,
+    dimensions: List[str],
+    top: int,
+    order: str,
+    anno: Optional[int],
+    anno_min: Optional[int],
+    anno_max: Optional[int],
+    modalidad: Optional[str],
+    destino: Optional[str],
+    entidad: Optional[str],
+    entidad_exact: bool,
+    departamento: Optional[str],
+    municipio: Optional[str],
+    cuantia_min: Optional[float],
+    cuantia_max: Optional[float],
+    bpin: Optional[str],
+    estado: Optional[str],
+    q: Optional[str],
+    text: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Count and cuantia sums per group of one or two catalog columns.
+
+    The ``top`` groups by ``order`` are returned individually and the rest
+    are folded into an ``others`` bucket, all in a single query.
+    """
+    if not 1 <= len(dimensions) <= 2 or len(set(dimensions)) != len(dimensions):
+        raise ValueError("Provide one or two distinct dimensions")
+    invalid = [d for d in dimensions if d not in ALLOWED_CATALOG_COLUMNS]
+    if invalid:
+        raise ValueError(f"Invalid dimensions: {', '.join(invalid)}")
+    if order not in GROUP_METRICS:
+        raise ValueError("Invalid order")
+
+    where_clause, params = _build_filters(
+        anno,
+        anno_min,
+        anno_max,
+        modalidad,
+        destino,
+        entidad,
+        entidad_exact,
+        departamento,
+        municipio,
+        cuantia_min,
+        cuantia_max,
+        bpin,
+        estado,
+        q,
+        text,
+    )
+
+    dims = ", ".join(dimensions)
+    bucketed = ", ".join(f"CASE WHEN rn <= ? THEN {d} END AS {d}" for d in dimensions)
+    sql = f"""
+        WITH g AS (
+            SELECT {dims}, COUNT(*) AS n, SUM(cuantia_contrato) AS cc, SUM(cuantia_proceso) AS cp
+            FROM procesos_secop1 {where_clause}
+            GROUP BY {dims}
+        ), r AS (
+            SELECT *, ROW_NUMBER() OVER (ORDER BY {GROUP_METRICS[order]} DESC NULLS LAST, {dims}) AS rn,
+                   COUNT(*) OVER () AS total_groups
+            FROM g
+        )
+        SELECT rn > ? AS is_other, {bucketed},
+               SUM(n) AS n, SUM(cc) AS cc, SUM(cp) AS cp, MAX(total_groups) AS total_groups
+        FROM r
+        GROUP BY ALL
+        ORDER BY MIN(rn)
+    """
+    params = params + [top] + [top] * len(dimensions)
+    rows = timed_fetchall(conn, "group_stats", sql, params)
+
+    groups: List[Dict[str, Any]] = []
+    others = None
+    total_groups = 0
+    for row in rows:
+        entry = dict(zip(dimensions, row[1:1 + len(dimensions)]))
+        n, cc, cp, total_groups = row[1 + len(dimensions):]
+        entry.update({
+            "count": int(n),
+            "sum_cuantia_contrato": float(cc) if cc is not None else 0.0,
+            "sum_cuantia_proceso": float(cp) if cp is not None else 0.0,
+        })
+        if row[0]:
+            others = {k: entry[k] for k in ("count", "sum_cuantia_contrato", "sum_cuantia_proceso")}
+            others["groups"] = int(total_groups) - top
+        else:
+            groups.append(entry)
+
+    return {
+        "dimensions": dimensions,
+        "order": order,
+        "total_groups": int(total_groups),
+        "groups": groups,
+        "others": others,
+    }
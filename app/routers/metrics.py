@@ -0,0 +1,16 @@
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+
+from .. import metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/debug/slow-queries")
+def get_slow_queries(limit: Optional[int] = Query(None, ge=1)):
+    return {"items": metrics.slow_queries(limit)}
@@ -1,12 +1,21 @@
 from typing import Optional
-from fastapi import APIRouter, Query
-from ..db import get_conn
+import duckdb
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from ..cache import cached_json
+from ..db import get_cursor
 from .. import query as qlib
 
 router = APIRouter()
 
+def _profile_filters(profile, entidad, departamento, municipio):
+    try:
+        return qlib.apply_profile(profile, entidad, departamento, municipio)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
 @router.get("/procesos")
 def get_procesos(
+    request: Request,
     anno: Optional[int] = None,
     anno_min: Optional[int] = None,
     anno_max: Optional[int] = None,
@@ -20,85 +29,152 @@ def get_procesos(
     bpin: Optional[str] = None,
     estado: Optional[str] = None,
     q: Optional[str] = None,
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
 ):
-    conn = get_conn()
-    try:
-        from ..settings import get_settings
-        s = get_settings()
-        entidad_exact = False
-        if s.filter_entidad:
-            entidad = s.filter_entidad
-            entidad_exact = True
-        if s.filter_departamento:
-            departamento = s.filter_departamento
-        if s.filter_municipio:
-            municipio = s.filter_municipio
-        items = qlib.list_procesos(
-            conn,
-            anno,
-            anno_min,
-            anno_max,
-            modalidad,
-            destino,
-            entidad,
-            entidad_exact,
-            departamento,
-            municipio,
-            cuantia_min,
-            cuantia_max,
-            bpin,
-            estado,
-            q,
-            limit,
-            offset,
-        )
-        total = qlib.count_procesos(
-            conn,
-            anno,
-            anno_min,
-            anno_max,
-            modalidad,
-            destino,
-            entidad,
-            entidad_exact,
-            departamento,
-            municipio,
-            cuantia_min,
-            cuantia_max,
-            bpin,
-            estado,
-            q,
-        )
-        return {"total": total, "limit": limit, "offset": offset, "items": items}
-    finally:
-        conn.close()
+    entidad, entidad_exact, departamento, municipio = _profile_filters(profile, entidad, departamento, municipio)
+
+    def _compute():
+        try:
+            page = qlib.list_procesos_page(
+                conn,
+                anno,
+                anno_min,
+                anno_max,
+                modalidad,
+                destino,
+                entidad,
+                entidad_exact,
+                departamento,
+                municipio,
+                cuantia_min,
+                cuantia_max,
+                bpin,
+                estado,
+                q,
+                limit,
+                offset,
+                text=text,
+                cursor=cursor,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        total = None
+        if include_total:
+            total = qlib.count_procesos(
+                conn,
+                anno,
+                anno_min,
+                anno_max,
+                modalidad,
+                destino,
+                entidad,
+                entidad_exact,
+                departamento,
+                municipio,
+                cuantia_min,
+                cuantia_max,
+                bpin,
+                estado,
+                q,
+                text=text,
+            )
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "items": page["items"],
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+        }
+
+    return cached_json(
+        request,
+        conn,
+        "procesos",
+        {
+            "anno": anno,
+            "anno_min": anno_min,
+            "anno_max": anno_max,
+            "modalidad": modalidad,
+            "destino": destino,
+            "entidad": entidad,
+            "departamento": departamento,
+            "municipio": municipio,
+            "cuantia_min": cuantia_min,
+            "cuantia_max": cuantia_max,
+            "bpin": bpin,
+            "estado": estado,
+            "q": q,
+            "text": text,
+            "profile": profile,
+            "limit": limit,
+            "offset": offset,
+            "cursor": cursor,
+            "include_total": include_total,
+        },
+        _compute,
+    )
+
+@router.get("/profiles")
+def get_profiles():
+    from ..settings import get_settings
+    s = get_settings()
+    profiles = s.filter_profiles()
+    return {
+        "default": s.get_profile().name,
+        "items": [
+            {"name": p.name, "departamento": p.departamento, "municipio": p.municipio, "entidad": p.entidad}
+            for p in profiles.values()
+        ],
+    }
 
 @router.get("/catalogos/{catalogo}")
 def get_catalogo(
+    request: Request,
     catalogo: str,
     q: Optional[str] = None,
     limit: int = Query(200, ge=1, le=2000),
+    profile: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
 ):
-    conn = get_conn()
-    try:
-        from ..settings import get_settings
-        s = get_settings()
-        values = qlib.list_catalog(
-            conn,
-            catalogo,
-            limit,
-            q,
-            s.filter_departamento,
-            s.filter_municipio,
-        )
-        return {"catalogo": catalogo, "items": values}
-    finally:
-        conn.close()
+    _, _, departamento, municipio = _profile_filters(profile, None, None, None)
+
+    def _compute():
+        try:
+            counts = qlib.list_catalog_counts(
+                conn,
+                catalogo,
+                limit,
+                q,
+                departamento,
+                municipio,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        return {"catalogo": catalogo, "items": [c["value"] for c in counts], "counts": counts}
+
+    return cached_json(
+        request,
+        conn,
+        "catalogos",
+        {
+            "catalogo": catalogo,
+            "q": q,
+            "limit": limit,
+            "profile": profile,
+        },
+        _compute,
+    )
 
 @router.get("/stats/resumen")
 def get_stats(
+    request: Request,
     anno: Optional[int] = None,
     anno_min: Optional[int] = None,
     anno_max: Optional[int] = None,
@@ -112,19 +188,13 @@ def get_stats(
     bpin: Optional[str] = None,
     estado: Optional[str] = None,
     q: Optional[str] = None,
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
 ):
-    conn = get_conn()
-    try:
-        from ..settings import get_settings
-        s = get_settings()
-        entidad_exact = False
-        if s.filter_entidad:
-            entidad = s.filter_entidad
-            entidad_exact = True
-        if s.filter_departamento:
-            departamento = s.filter_departamento
-        if s.filter_municipio:
-            municipio = s.filter_municipio
+    entidad, entidad_exact, departamento, municipio = _profile_filters(profile, entidad, departamento, municipio)
+
+    def _compute():
         return qlib.get_stats(
             conn,
             anno,
@@ -141,6 +211,108 @@ def get_stats(
             bpin,
             estado,
             q,
+            text=text,
         )
-    finally:
-        conn.close()
+
+    return cached_json(
+        request,
+        conn,
+        "stats_resumen",
+        {
+            "anno": anno,
+            "anno_min": anno_min,
+            "anno_max": anno_max,
+            "modalidad": modalidad,
+            "destino": destino,
+            "entidad": entidad,
+            "departamento": departamento,
+            "municipio": municipio,
+            "cuantia_min": cuantia_min,
+            "cuantia_max": cuantia_max,
+            "bpin": bpin,
+            "estado": estado,
+            "q": q,
+            "text": text,
+            "profile": profile,
+        },
+        _compute,
+    )
+
+@router.get("/stats/group")
+def get_group_stats(
+    request: Request,
+    by: str = Query(..., description="One or two catalog columns, comma separated"),
+    top: int = Query(10, ge=1, le=1000),
+    order: str = Query("count", pattern="^(count|cuantia_contrato|cuantia_proceso)$"),
+    anno: Optional[int] = None,
+    anno_min: Optional[int] = None,
+    anno_max: Optional[int] = None,
+    modalidad: Optional[str] = None,
+    destino: Optional[str] = None,
+    entidad: Optional[str] = None,
+    departamento: Optional[str] = None,
+    municipio: Optional[str] = None,
+    cuantia_min: Optional[float] = None,
+    cuantia_max: Optional[float] = None,
+    bpin: Optional[str] = None,
+    estado: Optional[str] = None,
+    q: Optional[str] = None,
+    text: Optional[str] = None,
+    profile: Optional[str] = None,
+    conn: duckdb.DuckDBPyConnection = Depends(get_cursor),
+):
+    entidad, entidad_exact, departamento, municipio = _profile_filters(profile, entidad, departamento, municipio)
+
+    def _compute():
+        dimensions = [d.strip() for d in by.split(",") if d.strip()]
+        try:
+            return qlib.group_stats(
+                conn,
+                dimensions,
+                top,
+                order,
+                anno,
+                anno_min,
+                anno_max,
+                modalidad,
+                destino,
+                entidad,
+                entidad_exact,
+                departamento,
+                municipio,
+                cuantia_min,
+                cuantia_max,
+                bpin,
+                estado,
+                q,
+                text=text,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    return cached_json(
+        request,
+        conn,
+        "stats_group",
+        {
+            "by": by,
+            "top": top,
+            "order": order,
+            "anno": anno,
+            "anno_min": anno_min,
+            "anno_max": anno_max,
+            "modalidad": modalidad,
+            "destino": destino,
+            "entidad": entidad,
+            "departamento": departamento,
+            "municipio": municipio,
+            "cuantia_min": cuantia_min,
+            "cuantia_max": cuantia_max,
+            "bpin": bpin,
+            "estado": estado,
+            "q": q,
+            "text": text,
+            "profile": profile,
+        },
+        _compute,
+    )
@@ -1,71 +1,108 @@
-from fastapi import APIRouter, Query
-from ..db import get_conn
+import os
+
+import duckdb
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .. import jobs
+from ..db import get_cursor, previous_path
 from ..settings import get_settings
-from ..sync import run_snapshot, run_incremental
 
 router = APIRouter()
 
-@router.post("/run")
-def run_sync(mode: str = Query("incremental", pattern="^(snapshot|incremental)$")):
-    conn = get_conn()
+@router.post("/run", status_code=202)
+def run_sync(mode: str = Query("incremental", pattern="^(snapshot|incremental|rebuild)$")):
+    s = get_settings()
+    if mode == "rebuild" and s.storage_backend == "parquet":
+        raise HTTPException(status_code=400, detail="Rebuild only supports STORAGE_BACKEND=duckdb")
     try:
-        if mode == "snapshot":
-            rows = run_snapshot(conn)
-        else:
-            rows = run_incremental(conn)
-        return {"mode": mode, "rows": rows}
-    finally:
-        conn.close()
+        job = jobs.submit(mode, s.dataset_id)
+    except jobs.JobConflict as exc:
+        raise HTTPException(status_code=409, detail={"message": str(exc), "job_id": exc.job.id}) from exc
+    return job.to_dict()
 
-@router.get("/status")
-def get_status():
-    conn = get_conn()
+@router.post("/rollback", status_code=202)
+def rollback_sync():
+    s = get_settings()
+    if not os.path.exists(previous_path()):
+        raise HTTPException(status_code=404, detail="No previous database to roll back to")
     try:
-        s = get_settings()
-        row = conn.execute(
-            """
-            SELECT dataset_id, last_dataset_updated_at, last_run_ts, last_run_status, rows_upserted, last_error
-            FROM sync_state
-            WHERE dataset_id=?
-            """,
-            [s.dataset_id],
-        ).fetchone()
+        job = jobs.submit("rollback", s.dataset_id)
+    except jobs.JobConflict as exc:
+        raise HTTPException(status_code=409, detail={"message": str(exc), "job_id": exc.job.id}) from exc
+    return job.to_dict()
+
+@router.get("/jobs")
+def list_sync_jobs():
+    return {"items": [job.to_dict() for job in jobs.list_jobs()]}
 
-        if not row:
-            return {"dataset_id": s.dataset_id, "status": "MISSING"}
+@router.get("/jobs/{job_id}")
+def get_sync_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-        return {
-            "dataset_id": row[0],
-            "last_dataset_updated_at": row[1],
-            "last_run_ts": row[2],
-            "last_run_status": row[3],
-            "rows_upserted": row[4],
-            "last_error": row[5],
-        }
-    finally:
-        conn.close()
+@router.post("/jobs/{job_id}/cancel", status_code=202)
+def cancel_sync_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return job.to_dict()
+
+@router.get("/status")
+def get_status(conn: duckdb.DuckDBPyConnection = Depends(get_cursor)):
+    s = get_settings()
+    row = conn.execute(
+        """
+        SELECT dataset_id, last_dataset_updated_at, last_run_ts, last_run_status, rows_upserted, last_error
+        FROM sync_state
+        WHERE dataset_id=?
+        """,
+        [s.dataset_id],
+    ).fetchone()
+
+    if not row:
+        return {"dataset_id": s.dataset_id, "status": "MISSING"}
+
+    profiles = conn.execute(
+        """
+        SELECT profile, last_dataset_updated_at, last_run_ts, last_run_status, rows_upserted, last_error
+        FROM sync_profile_state
+        WHERE dataset_id=?
+        ORDER BY profile
+        """,
+        [s.dataset_id],
+    ).fetchall()
+    cols = ["profile", "last_dataset_updated_at", "last_run_ts", "last_run_status", "rows_upserted", "last_error"]
+
+    return {
+        "dataset_id": row[0],
+        "last_dataset_updated_at": row[1],
+        "last_run_ts": row[2],
+        "last_run_status": row[3],
+        "rows_upserted": row[4],
+        "last_error": row[5],
+        "rollback_available": os.path.exists(previous_path()),
+        "profiles": [dict(zip(cols, p)) for p in profiles],
+    }
 
 @router.get("/health")
-def healthcheck():
-    conn = get_conn()
-    try:
-        s = get_settings()
-        conn.execute("SELECT 1").fetchone()
-        row = conn.execute(
-            """
-            SELECT last_run_status, last_run_ts, last_error
-            FROM sync_state
-            WHERE dataset_id=?
-            """,
-            [s.dataset_id],
-        ).fetchone()
+def healthcheck(conn: duckdb.DuckDBPyConnection = Depends(get_cursor)):
+    s = get_settings()
+    conn.execute("SELECT 1").fetchone()
+    row = conn.execute(
+        """
+        SELECT last_run_status, last_run_ts, last_error
+        FROM sync_state
+        WHERE dataset_id=?
+        """,
+        [s.dataset_id],
+    ).fetchone()
 
-        return {
-            "status": "ok",
-            "dataset_id": s.dataset_id,
-            "last_run_status": row[0] if row else None,
-            "last_run_ts": row[1] if row else None,
-            "last_error": row[2] if row else None,
-        }
-    finally:
-        conn.close()
+    return {
+        "status": "ok",
+        "dataset_id": s.dataset_id,
+        "last_run_status": row[0] if row else None,
+        "last_run_ts": row[1] if row else None,
+        "last_error": row[2] if row else None,
+    }
@@ -5,6 +5,16 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+DEFAULT_PROFILE = "default"
+
+@dataclass(frozen=True)
+class FilterProfile:
+    """Named set of permanent filters: what a sync downloads and what the API serves."""
+    name: str
+    departamento: str | None = None
+    municipio: str | None = None
+    entidad: str | None = None
+
 @dataclass
 class Settings:
     socrata_domain: str
@@ -12,12 +22,31 @@ class Settings:
     socrata_app_token: str | None
     socrata_username: str | None
     socrata_password: str | None
+    socrata_timeout: int
+    socrata_max_retries: int
     duckdb_path: str
+    duckdb_pool_size: int
+    storage_backend: str
+    parquet_dir: str
+    parquet_flush_rows: int
+    swap_drain_timeout: float
+    response_cache_size: int
+    slow_query_ms: float
+    slow_query_log_size: int
+    slow_query_profile: bool
     default_snapshot_years: int
     page_limit: int
+    pagination: str
+    fetch_workers: int
+    prefetch_pages: int
+    incremental_key_scan: bool
+    key_scan_columns: list
+    key_scan_batch: int
     filter_departamento: str | None
     filter_municipio: str | None
     filter_entidad: str | None
+    profiles: dict
+    default_profile: str | None
     primary_key: str
     fields: dict
     system_fields: dict
@@ -25,6 +54,42 @@ class Settings:
     select_str: str
     export_exclude: list
 
+    def filter_profiles(self) -> dict:
+        """Configured profiles, or a single ``default`` one from the FILTER_* variables."""
+        if self.profiles:
+            return self.profiles
+        return {
+            DEFAULT_PROFILE: FilterProfile(
+                DEFAULT_PROFILE, self.filter_departamento, self.filter_municipio, self.filter_entidad,
+            )
+        }
+
+    def get_profile(self, name: str | None = None) -> FilterProfile:
+        profiles = self.filter_profiles()
+        name = name or self.default_profile or next(iter(profiles))
+        if name not in profiles:
+            raise ValueError(f"Unknown profile: {name}")
+        return profiles[name]
+
+def _load_profiles(path: str) -> tuple[dict, str | None]:
+    if not os.path.exists(path):
+        return {}, None
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    profiles = {}
+    for name, filters in (cfg.get("profiles") or {}).items():
+        filters = filters or {}
+        unknown = set(filters) - {"departamento", "municipio", "entidad"}
+        if unknown:
+            raise ValueError(f"Profile {name}: unknown keys {', '.join(sorted(unknown))}")
+        profiles[str(name)] = FilterProfile(
+            str(name),
+            filters.get("departamento") or None,
+            filters.get("municipio") or None,
+            filters.get("entidad") or None,
+        )
+    return profiles, cfg.get("default")
+
 _SETTINGS: Settings | None = None
 
 def get_settings() -> Settings:
@@ -37,13 +102,38 @@ def get_settings() -> Settings:
     app_token = os.getenv("SOCRATA_APP_TOKEN") or None
     user = os.getenv("SOCRATA_USERNAME") or None
     pwd = os.getenv("SOCRATA_PASSWORD") or None
+    socrata_timeout = int(os.getenv("SOCRATA_TIMEOUT", "60"))
+    socrata_max_retries = int(os.getenv("SOCRATA_MAX_RETRIES", "5"))
 
     duckdb_path = os.getenv("DUCKDB_PATH", "./data/secop1.duckdb")
+    duckdb_pool_size = int(os.getenv("DUCKDB_POOL_SIZE", "8"))
+    storage_backend = os.getenv("STORAGE_BACKEND", "duckdb").lower()
+    if storage_backend not in ("duckdb", "parquet"):
+        raise ValueError("STORAGE_BACKEND must be 'duckdb' or 'parquet'")
+    parquet_dir = os.getenv("PARQUET_DIR", "./data/procesos_parquet")
+    parquet_flush_rows = int(os.getenv("PARQUET_FLUSH_ROWS", "500000"))
+    swap_drain_timeout = float(os.getenv("SWAP_DRAIN_TIMEOUT", "30"))
+    response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+    slow_query_ms = float(os.getenv("SLOW_QUERY_MS", "500"))
+    slow_query_log_size = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+    slow_query_profile = os.getenv("SLOW_QUERY_PROFILE", "false").lower() in ("1", "true", "yes")
     default_snapshot_years = int(os.getenv("DEFAULT_SNAPSHOT_YEARS", "5"))
     page_limit = int(os.getenv("PAGE_LIMIT", "50000"))
+    pagination = os.getenv("PAGINATION", "keyset").lower()
+    if pagination not in ("keyset", "offset"):
+        raise ValueError("PAGINATION must be 'keyset' or 'offset'")
+    fetch_workers = int(os.getenv("FETCH_WORKERS", "2"))
+    prefetch_pages = int(os.getenv("PREFETCH_PAGES", "2"))
+    incremental_key_scan = os.getenv("INCREMENTAL_KEY_SCAN", "false").lower() in ("1", "true", "yes")
+    key_scan_columns = [
+        c.strip() for c in os.getenv("KEY_SCAN_COLUMNS", "ultima_actualizacion").split(",") if c.strip()
+    ]
+    key_scan_batch = int(os.getenv("KEY_SCAN_BATCH", "100"))
     filter_departamento = os.getenv("FILTER_DEPARTAMENTO") or None
     filter_municipio = os.getenv("FILTER_MUNICIPIO") or None
     filter_entidad = os.getenv("FILTER_ENTIDAD", "LA GUAJIRA - ALCALDiA MUNICIPIO DE ALBANIA") or None
+    profiles, default_profile = _load_profiles(os.getenv("PROFILES_PATH", "./config/profiles.yml"))
+    default_profile = os.getenv("DEFAULT_PROFILE") or default_profile
 
     with open("./config/dataset.yml", "r", encoding="utf-8") as f:
         cfg = yaml.safe_load(f)
@@ -52,18 +142,37 @@ def get_settings() -> Settings:
     select_str = ",".join(select)
     export_exclude = cfg.get("export_exclude", []) or []
 
-    _SETTINGS = Settings(
+    settings = Settings(
         socrata_domain=socrata_domain,
         dataset_id=dataset_id,
         socrata_app_token=app_token,
         socrata_username=user,
         socrata_password=pwd,
+        socrata_timeout=socrata_timeout,
+        socrata_max_retries=socrata_max_retries,
         duckdb_path=duckdb_path,
+        duckdb_pool_size=duckdb_pool_size,
+        storage_backend=storage_backend,
+        parquet_dir=parquet_dir,
+        parquet_flush_rows=parquet_flush_rows,
+        swap_drain_timeout=swap_drain_timeout,
+        response_cache_size=response_cache_size,
+        slow_query_ms=slow_query_ms,
+        slow_query_log_size=slow_query_log_size,
+        slow_query_profile=slow_query_profile,
         default_snapshot_years=default_snapshot_years,
         page_limit=page_limit,
+        pagination=pagination,
+        fetch_workers=fetch_workers,
+        prefetch_pages=prefetch_pages,
+        incremental_key_scan=incremental_key_scan,
+        key_scan_columns=key_scan_columns,
+        key_scan_batch=key_scan_batch,
         filter_departamento=filter_departamento,
         filter_municipio=filter_municipio,
         filter_entidad=filter_entidad,
+        profiles=profiles,
+        default_profile=default_profile,
         primary_key=cfg["primary_key"],
         fields=cfg["fields"],
         system_fields=cfg["system_fields"],
@@ -71,4 +180,9 @@ def get_settings() -> Settings:
         select_str=select_str,
         export_exclude=export_exclude,
     )
+    # Without a profiles file the only profile is the implicit default one, so
+    # check against filter_profiles() to fail here rather than on every request.
+    if default_profile and default_profile not in settings.filter_profiles():
+        raise ValueError(f"DEFAULT_PROFILE {default_profile} is not a configured profile")
+    _SETTINGS = settings
     return _SETTINGS
@@ -1,35 +1,407 @@
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
 import requests
-from typing import Dict, Any, Iterator, List, Optional
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+K = TypeVar("K")
+
+_DONE = object()
+
+
+def prefetch(items: Iterable[T], depth: int = 2) -> Iterator[T]:
+    """Consume ``items`` in a background thread, keeping up to ``depth`` ahead.
+
+    The bounded queue gives backpressure: the producer blocks once ``depth``
+    items are waiting, so a slow consumer never buffers the whole result set.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    for _, item in interleave({None: items}, depth):
+        yield item
+
+def interleave(streams: Dict[K, Iterable[T]], depth: int = 2) -> Iterator[Tuple[K, T]]:
+    """Consume every stream on its own thread, yielding ``(key, item)`` as items arrive.
+
+    Items of one stream keep their order. All streams share one bounded queue
+    of ``depth`` items, as in :func:`prefetch`, and the first producer error
+    is re-raised in the consumer.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(key: K, items: Iterable[T]):
+        try:
+            for item in items:
+                if not _put((key, item, None)):
+                    return
+            _put((key, _DONE, None))
+        except BaseException as exc:
+            _put((key, _DONE, exc))
+
+    workers = [
+        threading.Thread(target=_produce, args=(key, items), name="socrata-prefetch", daemon=True)
+        for key, items in streams.items()
+    ]
+    for worker in workers:
+        worker.start()
+    remaining = len(workers)
+    try:
+        while remaining:
+            key, item, exc = q.get()
+            if exc is not None:
+                raise exc
+            if item is _DONE:
+                remaining -= 1
+                continue
+            yield key, item
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5)
+
+def _escape(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def keyset_key(row: Dict[str, Any]) -> Tuple[str, str]:
+    """``(:updated_at, :id)`` of a row, as used by :meth:`SocrataClient.iter_query_keyset`."""
+    return row[":updated_at"], row[":id"]
+
+
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+MAX_BACKOFF_S = 60.0
+MAX_RETRY_AFTER_S = 300.0
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """Seconds requested by a ``Retry-After`` header (delta or HTTP date)."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_S)
+
+
+class PageSizer:
+    """Adaptive ``$limit``: halved on timeouts, doubled back after fast full pages."""
+
+    def __init__(self, maximum: int, minimum: int = 1000, fast_s: float = 15.0):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.fast_s = fast_s
+        self.size = maximum
+
+    def shrink(self) -> None:
+        self.size = max(self.minimum, self.size // 2)
+
+    def observe(self, elapsed: float, rows: int) -> None:
+        if rows >= self.size and elapsed < self.fast_s and self.size < self.maximum:
+            self.size = min(self.maximum, self.size * 2)
+
+
+class TransportStats:
+    """Thread-safe request counters for one client, also added to the process metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rows = 0
+        self.bytes_wire = 0
+        self.bytes_decoded = 0
+        self.latency_total_s = 0.0
+        self.latency_max_s = 0.0
+        self.last_latency_s = 0.0
+        self.parse_total_s = 0.0
+
+    def record(self, elapsed: float, wire: int, decoded: int, rows: int, parse_s: float = 0.0) -> None:
+        with self._lock:
+            self.requests += 1
+            self.parse_total_s += parse_s
+            self.rows += rows
+            self.bytes_wire += wire
+            self.bytes_decoded += decoded
+            self.latency_total_s += elapsed
+            self.latency_max_s = max(self.latency_max_s, elapsed)
+            self.last_latency_s = elapsed
+        metrics.SOCRATA_REQUESTS.inc()
+        metrics.SOCRATA_SECONDS.inc(elapsed)
+        metrics.SOCRATA_BYTES.inc(wire)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+        metrics.SOCRATA_RETRIES.inc()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+        metrics.SOCRATA_FAILURES.inc()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "rows": self.rows,
+                "bytes_wire": self.bytes_wire,
+                "bytes_decoded": self.bytes_decoded,
+                "latency_total_s": round(self.latency_total_s, 3),
+                "latency_avg_s": round(self.latency_total_s / self.requests, 3) if self.requests else None,
+                "latency_max_s": round(self.latency_max_s, 3),
+                "last_latency_s": round(self.last_latency_s, 3),
+                "parse_total_s": round(self.parse_total_s, 3),
+            }
+
 
 class SocrataClient:
     def __init__(self, domain: str, app_token: Optional[str] = None,
                  username: Optional[str] = None, password: Optional[str] = None,
-                 timeout: int = 60):
-        self.base = f"https://{domain}"
+                 timeout: int = 60, max_retries: int = 5, pool_size: int = 10,
+                 backoff_s: float = 1.0):
+        # A full URL (e.g. a local stand-in server) is used as-is.
+        self.base = domain.rstrip("/") if "://" in domain else f"https://{domain}"
         self.session = requests.Session()
         self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.stats = TransportStats()
+        self._sleep = time.sleep
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
         if app_token:
             self.session.headers.update({"X-App-Token": app_token})
         if username and password:
             self.session.auth = (username, password)
 
-    def fetch_page(self, dataset_id: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        url = f"{self.base}/resource/{dataset_id}.json"
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads concurrent retries instead of synchronizing them.
+        return random.uniform(0, min(MAX_BACKOFF_S, self.backoff_s * 2 ** attempt))
+
+    def _get(self, url: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        start = time.monotonic()
         r = self.session.get(url, params=params, timeout=self.timeout)
         r.raise_for_status()
-        return r.json()
+        body = r.content
+        received = time.monotonic()
+        rows = r.json()
+        parse_s = time.monotonic() - received
+        tell = getattr(r.raw, "tell", None)
+        wire = tell() if callable(tell) else 0
+        wire = wire or int(r.headers.get("Content-Length") or len(body))
+        self.stats.record(received - start, wire, len(body), len(rows), parse_s)
+        return rows
+
+    def fetch_page(self, dataset_id: str, params: Dict[str, Any],
+                   page_size: Optional[PageSizer] = None) -> List[Dict[str, Any]]:
+        """GET one page, retrying timeouts, connection errors, 429 and 5xx.
+
+        Retries back off exponentially with jitter, or wait as long as the
+        server's ``Retry-After`` asks. With ``page_size``, a timeout also
+        shrinks ``params["$limit"]`` before retrying, and a fast full page lets
+        it grow again; callers read the limit actually used from ``params``.
+        """
+        url = f"{self.base}/resource/{dataset_id}.json"
+        attempt = 0
+        while True:
+            if page_size is not None:
+                params["$limit"] = page_size.size
+            start = time.monotonic()
+            try:
+                rows = self._get(url, params)
+            except requests.Timeout as exc:
+                if page_size is not None:
+                    page_size.shrink()
+                error, delay = exc, None
+            except requests.ConnectionError as exc:
+                error, delay = exc, None
+            except requests.HTTPError as exc:
+                if exc.response is None or exc.response.status_code not in RETRY_STATUS:
+                    self.stats.record_failure()
+                    raise
+                error, delay = exc, _retry_after(exc.response)
+            else:
+                if page_size is not None:
+                    page_size.observe(time.monotonic() - start, len(rows))
+                return rows
+            if attempt >= self.max_retries:
+                self.stats.record_failure()
+                raise error
+            delay = self._backoff(attempt) if delay is None else delay
+            attempt += 1
+            self.stats.record_retry()
+            logger.warning(
+                "Socrata request failed, retrying",
+                extra={"dataset_id": dataset_id, "attempt": attempt, "delay_s": round(delay, 2),
+                       "limit": params.get("$limit")},
+            )
+            self._sleep(delay)
+
+    def count(self, dataset_id: str, where: Optional[str]) -> int:
+        params = {"$select": "count(*) AS n"}
+        if where:
+            params["$where"] = where
+        rows = self.fetch_page(dataset_id, params)
+        return int(rows[0]["n"]) if rows else 0
 
     def iter_query(self, dataset_id: str, select: str, where: Optional[str],
-                   order: Optional[str], limit: int = 50000) -> Iterator[List[Dict[str, Any]]]:
-        offset = 0
+                   order: Optional[str], limit: int = 50000,
+                   offset: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        page_size = PageSizer(limit, fast_s=self.timeout / 4)
         while True:
-            params = {"$select": select, "$limit": limit, "$offset": offset}
+            params = {"$select": select, "$offset": offset}
             if where:
                 params["$where"] = where
             if order:
                 params["$order"] = order
-            batch = self.fetch_page(dataset_id, params)
+            batch = self.fetch_page(dataset_id, params, page_size=page_size)
+            if not batch:
+                break
+            yield batch
+            offset += len(batch)
+
+    def iter_query_keyset(self, dataset_id: str, select: str, where: Optional[str],
+                          limit: int = 50000,
+                          start_key: Optional[Tuple[str, str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Keyset pagination on ``(:updated_at, :id)``.
+
+        Each page is bounded by the last key of the previous one instead of an
+        ``$offset``, so every request costs the same regardless of depth and
+        rows updated mid-scan move past the cursor rather than shifting pages.
+        Use :func:`keyset_key` on the last row of a page to get the key.
+        """
+        fields = [f.strip() for f in select.split(",")]
+        for system_field in (":updated_at", ":id"):
+            if system_field not in fields:
+                fields.append(system_field)
+        select = ",".join(fields)
+        key = start_key
+        page_size = PageSizer(limit, fast_s=self.timeout / 4)
+        while True:
+            clauses = []
+            if where:
+                clauses.append(f"({where})")
+            if key:
+                ts, row_id = (_escape(v) for v in key)
+                clauses.append(f"(:updated_at > '{ts}' OR (:updated_at = '{ts}' AND :id > '{row_id}'))")
+            params = {"$select": select, "$order": ":updated_at ASC, :id ASC"}
+            if clauses:
+                params["$where"] = " AND ".join(clauses)
+            batch = self.fetch_page(dataset_id, params, page_size=page_size)
             if not batch:
                 break
             yield batch
-            offset += limit
+            if len(batch) < params["$limit"]:
+                break
+            key = keyset_key(batch[-1])
+
+    def iter_query_in(self, dataset_id: str, select: str, column: str, values: List[str],
+                      batch_size: int = 100, workers: int = 1) -> Iterator[List[Dict[str, Any]]]:
+        """Rows whose ``column`` is in ``values``, one ``column IN (...)`` request per batch.
+
+        ``batch_size`` bounds the URL length. Up to ``workers`` batches are in
+        flight and pages are yielded in batch order; ``values`` should be
+        unique so that a batch never has more rows than values.
+        """
+        batch_size = max(1, batch_size)
+        batches = deque(values[i:i + batch_size] for i in range(0, len(values), batch_size))
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="socrata-fetch")
+        pending: deque = deque()
+
+        def _submit():
+            batch = batches.popleft()
+            quoted = ", ".join(f"'{_escape(v)}'" for v in batch)
+            params = {"$select": select, "$where": f"{column} IN ({quoted})", "$limit": len(batch)}
+            pending.append(pool.submit(self.fetch_page, dataset_id, params))
+
+        try:
+            while batches or pending:
+                while batches and len(pending) < max(1, workers):
+                    _submit()
+                page = pending.popleft().result()
+                if page:
+                    yield page
+        finally:
+            for fut in pending:
+                fut.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def iter_query_concurrent(self, dataset_id: str, select: str, where: Optional[str],
+                              order: Optional[str], limit: int = 50000,
+                              workers: int = 2, prefetch_pages: int = 2,
+                              offset: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        """Offset pagination with ``workers`` pages in flight, yielded in order.
+
+        At most ``workers + prefetch_pages`` pages are requested ahead of the
+        consumer. Fetching stops at the first short or empty page. Offsets are
+        planned ahead, so the page size stays fixed (requests still retry).
+        """
+        max_in_flight = max(1, workers) + max(0, prefetch_pages)
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="socrata-fetch")
+        pending: deque = deque()
+        next_offset = offset
+        exhausted = False
+
+        def _submit():
+            nonlocal next_offset
+            params = {"$select": select, "$limit": limit, "$offset": next_offset}
+            if where:
+                params["$where"] = where
+            if order:
+                params["$order"] = order
+            pending.append(pool.submit(self.fetch_page, dataset_id, params))
+            next_offset += limit
+
+        try:
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    _submit()
+                if not pending:
+                    break
+                batch = pending.popleft().result()
+                if len(batch) < limit:
+                    exhausted = True
+                    for fut in pending:
+                        fut.cancel()
+                    pending.clear()
+                if batch:
+                    yield batch
+        finally:
+            for fut in pending:
+                fut.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
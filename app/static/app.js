@@ -13,11 +13,14 @@ const themeToggle = document.getElementById("theme-toggle");
 const loadingSpinner = document.getElementById("loading-spinner");
 const limitError = document.getElementById("limit-error");
 let loadingCount = 0;
+let pageCursor = "";
+let pageCursors = { next: null, prev: null };
 
 const btnPrev = document.getElementById("btn-prev");
 const btnNext = document.getElementById("btn-next");
 
 const fields = {
+  profile: "profile",
   anno: "anno",
   annoMin: "anno-min",
   annoMax: "anno-max",
@@ -28,6 +31,7 @@ const fields = {
   cuantiaMax: "cuantia-max",
   estado: "estado",
   q: "q",
+  text: "text",
   limit: "limit",
   offset: "offset",
   cols: "cols",
@@ -83,11 +87,43 @@ function populateSelect(select, items, allLabel = "Todos") {
   }
 }
 
+function profileQuery() {
+  const profile = val(fields.profile);
+  return profile ? `?profile=${encodeURIComponent(profile)}` : "";
+}
+
+async function loadProfiles() {
+  const select = document.getElementById(fields.profile);
+  if (!select) return;
+  try {
+    const res = await fetch("/profiles");
+    if (!res.ok) return;
+    const data = await res.json();
+    select.innerHTML = "";
+    (Array.isArray(data.items) ? data.items : []).forEach((item) => {
+      const opt = document.createElement("option");
+      opt.value = item.name;
+      opt.textContent = item.name;
+      select.appendChild(opt);
+    });
+    select.value = data.default || "";
+  } catch (_) {
+    showAlert("No se pudo cargar los perfiles.");
+  }
+}
+
+function loadCatalogs() {
+  loadCatalog(fields.estado, "estado_del_proceso");
+  loadCatalog(fields.destino, "destino_gasto");
+  loadCatalog(fields.modalidad, "modalidad_de_contratacion", "Todas");
+  loadYearCatalog([fields.annoMin, fields.annoMax, fields.anno]);
+}
+
 async function loadCatalog(selectId, catalogo, allLabel = "Todos") {
   const select = document.getElementById(selectId);
   if (!select) return;
   try {
-    const res = await fetch(`/catalogos/${catalogo}`);
+    const res = await fetch(`/catalogos/${catalogo}${profileQuery()}`);
     if (!res.ok) return;
     const data = await res.json();
     const items = Array.isArray(data.items) ? data.items : [];
@@ -99,7 +135,7 @@ async function loadCatalog(selectId, catalogo, allLabel = "Todos") {
 
 async function loadYearCatalog(selectIds) {
   try {
-    const res = await fetch("/catalogos/anno_firma_contrato");
+    const res = await fetch(`/catalogos/anno_firma_contrato${profileQuery()}`);
     if (!res.ok) return;
     const data = await res.json();
     const years = (Array.isArray(data.items) ? data.items : [])
@@ -125,6 +161,7 @@ function val(id) {
 function buildQuery() {
   const params = new URLSearchParams();
   const mapping = {
+    profile: val(fields.profile),
     anno: val(fields.anno),
     anno_min: val(fields.annoMin),
     anno_max: val(fields.annoMax),
@@ -135,6 +172,7 @@ function buildQuery() {
     cuantia_max: val(fields.cuantiaMax),
     estado: val(fields.estado),
     q: val(fields.q),
+    text: val(fields.text),
     limit: val(fields.limit) || "25",
     offset: val(fields.offset) || "0",
   };
@@ -230,6 +268,7 @@ async function loadProcesos() {
     return;
   }
   const params = buildQuery();
+  if (pageCursor) params.set("cursor", pageCursor);
   try {
     const res = await fetch(`/procesos?${params.toString()}`);
     if (!res.ok) {
@@ -246,8 +285,10 @@ async function loadProcesos() {
     pagerInfo.textContent = `Pagina ${page} de ${pages}`;
     statTotalTop.textContent = data.total ?? "-";
     statPageTop.textContent = `${page} / ${pages}`;
+    pageCursors = { next: data.next_cursor || null, prev: data.prev_cursor || null };
     btnPrev.disabled = offset <= 0;
-    btnNext.disabled = page >= pages;
+    // Ranked text searches return no cursors and page by offset instead.
+    btnNext.disabled = pageCursors.next ? false : page >= pages;
     renderTable(data.items || []);
     statusLine.textContent = "Estado: listo";
     showAlert("");
@@ -304,6 +345,7 @@ function clearFilters() {
   Object.values(fields).forEach((id) => {
     const el = document.getElementById(id);
     if (!el) return;
+    if (id === fields.profile) return;
     if (id === fields.limit) return;
     if (id === fields.offset) return;
     if (id === fields.xlsxLimit) return;
@@ -333,16 +375,17 @@ function exportXlsx() {
   window.location.href = `/export/xlsx?${params.toString()}`;
 }
 
-function setOffset(newOffset) {
+function setOffset(newOffset, cursor = "") {
   const offsetInput = document.getElementById(fields.offset);
   offsetInput.value = String(Math.max(0, newOffset));
+  pageCursor = newOffset > 0 ? cursor : "";
 }
 
 btnPrev.addEventListener("click", () => {
   const limit = getLimitValue();
   if (!limit) return;
   const offset = Number(val(fields.offset) || 0);
-  setOffset(offset - limit);
+  setOffset(offset - limit, pageCursors.prev || "");
   loadProcesos();
 });
 
@@ -350,7 +393,7 @@ btnNext.addEventListener("click", () => {
   const limit = getLimitValue();
   if (!limit) return;
   const offset = Number(val(fields.offset) || 0);
-  setOffset(offset + limit);
+  setOffset(offset + limit, pageCursors.next || "");
   loadProcesos();
 });
 
@@ -406,6 +449,7 @@ const autoSearchFields = [
   fields.cuantiaMax,
   fields.estado,
   fields.q,
+  fields.text,
   fields.limit,
 ];
 
@@ -425,10 +469,21 @@ if (themeToggle) {
   });
 }
 
-initTheme();
-loadCatalog(fields.estado, "estado_del_proceso");
-loadCatalog(fields.destino, "destino_gasto");
-loadCatalog(fields.modalidad, "modalidad_de_contratacion", "Todas");
-loadYearCatalog([fields.annoMin, fields.annoMax, fields.anno]);
-loadProcesos();
-loadStatus();
+const profileSelect = document.getElementById(fields.profile);
+if (profileSelect) {
+  profileSelect.addEventListener("change", () => {
+    loadCatalogs();
+    setOffset(0);
+    loadProcesos();
+  });
+}
+
+async function init() {
+  initTheme();
+  await loadProfiles();
+  loadCatalogs();
+  loadProcesos();
+  loadStatus();
+}
+
+init();
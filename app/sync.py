@@ -1,13 +1,40 @@
+from dataclasses import dataclass
 from datetime import datetime
+import hashlib
+import json
 import logging
+import os
 import time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import duckdb
-from .socrata import SocrataClient
-from .settings import get_settings
+import pyarrow as pa
+from .socrata import SocrataClient, interleave, keyset_key
+from .cache import clear_all
+from . import metrics, partitions
+from .db import (
+    CATALOG_COLUMNS,
+    DERIVED_COLUMNS,
+    ROLLUP_DIMENSIONS,
+    TEXT_INDEX_COLUMNS,
+    apply_catalog_delta,
+    apply_rollup_delta,
+    compact_rollup,
+    get_data_generation,
+    init_db,
+    pooled_cursor,
+    previous_path,
+    refresh_text_index,
+    remove_database,
+    shadow_path,
+    swap_database,
+)
+from .settings import DEFAULT_PROFILE, FilterProfile, get_settings
 
 logger = logging.getLogger(__name__)
 
+class SyncCancelled(Exception):
+    """Raised between pages when the job running the sync was cancelled."""
+
 def ensure_sync_state(conn: duckdb.DuckDBPyConnection, dataset_id: str):
     conn.execute("""
         INSERT INTO sync_state(dataset_id, last_dataset_updated_at, last_run_ts, last_run_status, rows_upserted, last_error)
@@ -28,88 +55,387 @@ def update_sync_state(conn: duckdb.DuckDBPyConnection, dataset_id: str,
             last_run_ts=NOW(),
             last_run_status=?,
             rows_upserted=?,
-            last_error=?
+            last_error=?,
+            data_generation=COALESCE(data_generation, 0) + 1
         WHERE dataset_id=?
     """, [last_updated_at, status, rows, error, dataset_id])
+    metrics.SYNC_RUNS.inc(status=status)
+    # Reads cached under the previous generation are unreachable now; free them.
+    clear_all()
 
-def _parse_ts(v: Optional[str]) -> Optional[datetime]:
-    if not v:
-        return None
-    return datetime.fromisoformat(v.replace("Z", "+00:00"))
+def bump_data_generation(conn: duckdb.DuckDBPyConnection, dataset_id: str):
+    """Move the generation past a page committed mid-sync.
+
+    Cached reads and ETags computed on the data before the page become
+    unreachable; the entries themselves age out of the LRU.
+    """
+    conn.execute("""
+        UPDATE sync_state SET data_generation=COALESCE(data_generation, 0) + 1 WHERE dataset_id=?
+    """, [dataset_id])
+
+def get_profile_watermark(conn: duckdb.DuckDBPyConnection, dataset_id: str, profile: str) -> Optional[datetime]:
+    row = conn.execute("""
+        SELECT last_dataset_updated_at FROM sync_profile_state WHERE dataset_id=? AND profile=?
+    """, [dataset_id, profile]).fetchone()
+    if row:
+        return row[0]
+    # Before profiles, the only watermark was the dataset's.
+    return get_last_dataset_updated_at(conn, dataset_id) if profile == DEFAULT_PROFILE else None
+
+def update_profile_state(conn: duckdb.DuckDBPyConnection, dataset_id: str, profile: str,
+                         last_updated_at: Optional[datetime], status: str, rows: int, error: Optional[str]):
+    conn.execute("""
+        INSERT INTO sync_profile_state(dataset_id, profile, last_dataset_updated_at, last_run_ts,
+                                       last_run_status, rows_upserted, last_error)
+        VALUES (?, ?, ?, NOW(), ?, ?, ?)
+        ON CONFLICT(dataset_id, profile) DO UPDATE SET
+            last_dataset_updated_at=excluded.last_dataset_updated_at,
+            last_run_ts=excluded.last_run_ts,
+            last_run_status=excluded.last_run_status,
+            rows_upserted=excluded.rows_upserted,
+            last_error=excluded.last_error
+    """, [dataset_id, profile, last_updated_at, status, rows, error])
+
+def _latest(a: Optional[datetime], b: Optional[datetime]) -> Optional[datetime]:
+    if a is None or b is None:
+        return a or b
+    return max(a, b)
 
 def _escape_socrata_value(value: str) -> str:
     return value.replace("'", "''")
 
-def upsert_batch(conn: duckdb.DuckDBPyConnection, rows: List[Dict[str, Any]], field_map: Dict[str, str]) -> int:
+def _target_types(conn: duckdb.DuckDBPyConnection, table: str = "procesos_secop1") -> Dict[str, str]:
+    return {r[1]: r[2] for r in conn.execute(f"PRAGMA table_info('{table}')").fetchall()}
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def _page_to_arrow(rows: List[Dict[str, Any]], field_map: Dict[str, str]) -> pa.Table:
+    # Most values arrive as JSON strings, but URL columns come as objects and
+    # checkbox columns as booleans; those are turned into text first. The page
+    # then converts to one string column per field in a single Arrow call
+    # (missing keys become nulls); typing happens inside DuckDB.
+    api_names = list(dict.fromkeys(field_map.values()))
+    rows = [
+        row if all(v is None or isinstance(v, str) for v in row.values())
+        else {k: _as_text(v) for k, v in row.items()}
+        for row in rows
+    ]
+    page = pa.array(rows, type=pa.struct([(name, pa.string()) for name in api_names]))
+    columns = dict(zip(api_names, page.flatten()))
+    return pa.Table.from_arrays([columns[field_map[c]] for c in field_map], names=list(field_map.keys()))
+
+def upsert_batch(conn: duckdb.DuckDBPyConnection, rows: List[Dict[str, Any]],
+                 field_map: Dict[str, str]) -> Tuple[int, Optional[datetime]]:
+    """Upsert one page and return ``(rows in page, max dataset_updated_at)``.
+
+    Values are coerced to the table types with TRY_CAST once, into a typed
+    temp table that feeds the insert and the watermark.
+    """
     if not rows:
-        return 0
+        return 0, None
 
+    # The parquet backend writes to the stage table and applies the catalog
+    # and rollup deltas when the stage is flushed to the partition files.
+    staged = get_settings().storage_backend == "parquet"
+    table = partitions.STAGE_TABLE if staged else "procesos_secop1"
     cols = list(field_map.keys())
-    values = []
-    for r in rows:
-        row_vals = []
-        for c in cols:
-            api_name = field_map[c]
-            v = r.get(api_name)
-            if api_name == ":updated_at":
-                v = _parse_ts(v)
-            row_vals.append(v)
-        values.append(row_vals)
-
-    conn.execute("CREATE TEMP TABLE IF NOT EXISTS stg (" + ", ".join([f"{c} VARCHAR" for c in cols]) + ");")
-    conn.execute("DELETE FROM stg;")
-    conn.executemany(f"INSERT INTO stg({', '.join(cols)}) VALUES ({', '.join(['?']*len(cols))})", values)
-
-    set_clause = ", ".join([f"{c}=excluded.{c}" for c in cols if c != "uid"])
-    select_cols = ", ".join(cols)
-    conn.execute(f"""
-        WITH ranked AS (
-            SELECT {select_cols},
-                   ROW_NUMBER() OVER (
-                       PARTITION BY uid
-                       ORDER BY TRY_CAST(dataset_updated_at AS TIMESTAMP) DESC NULLS LAST
-                   ) AS rn
-            FROM stg
-        )
-        INSERT INTO procesos_secop1({select_cols})
-        SELECT {select_cols} FROM ranked WHERE rn = 1
-        ON CONFLICT(uid) DO UPDATE SET {set_clause}
-    """)
-    return len(rows)
+    types = _target_types(conn, table)
+    page = _page_to_arrow(rows, field_map)
+
+    typed = ", ".join(
+        [c if types.get(c, "VARCHAR") == "VARCHAR" else f"TRY_CAST({c} AS {types[c]}) AS {c}" for c in cols]
+    )
+    derived = {name: expr for name, (source, _, expr) in DERIVED_COLUMNS.items() if source in field_map}
+    target_cols = cols + list(derived)
+    set_clause = ", ".join([f"{c}=excluded.{c}" for c in target_cols if c != "uid"])
+    select_cols = ", ".join(cols + [f"{expr} AS {name}" for name, expr in derived.items()])
+    # Text columns outside the field map are never written, so cannot change.
+    text_cols = [c for c in TEXT_INDEX_COLUMNS if c in field_map]
+    image_cols = ", ".join(dict.fromkeys(
+        ["uid"] + CATALOG_COLUMNS + ROLLUP_DIMENSIONS + ["cuantia_contrato", "cuantia_proceso"] + text_cols
+    ))
+    text_changed = " OR ".join([f"n.{c} IS DISTINCT FROM b.{c}" for c in text_cols] or ["FALSE"])
+    page_rows = f"SELECT {image_cols} FROM procesos_secop1 WHERE uid IN (SELECT uid FROM stg_page)"
+    dedup_order = "dataset_updated_at DESC NULLS LAST" if "dataset_updated_at" in field_map else "uid"
+    watermark = "MAX(dataset_updated_at)" if "dataset_updated_at" in field_map else "NULL"
+    conn.register("stg_page", page)
+    try:
+        # Before-image of the rows this page replaces, for the derived tables.
+        if not staged:
+            conn.execute(f"CREATE OR REPLACE TEMP TABLE page_before AS {page_rows}")
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE stg_typed AS
+            SELECT {select_cols}
+            FROM (SELECT {typed} FROM stg_page WHERE uid IS NOT NULL)
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY uid ORDER BY {dedup_order}) = 1
+        """)
+        conn.execute(f"""
+            INSERT INTO {table}({', '.join(target_cols)})
+            SELECT * FROM stg_typed
+            ON CONFLICT(uid) DO UPDATE SET {set_clause}
+        """)
+        max_updated = conn.execute(f"SELECT {watermark} FROM stg_typed").fetchone()[0]
+        if staged:
+            refresh_text_index(conn, "stg_page", table)
+        else:
+            # Only new rows and rows whose text changed are reindexed, and only
+            # the latter have postings to delete.
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE page_text AS
+                SELECT n.uid, b.uid IS NOT NULL AS indexed
+                FROM stg_typed n LEFT JOIN page_before b USING (uid)
+                WHERE b.uid IS NULL OR {text_changed}
+            """)
+            refresh_text_index(conn, "page_text", table, "(SELECT uid FROM page_text WHERE indexed)")
+            apply_catalog_delta(conn, "page_before", f"({page_rows})")
+            apply_rollup_delta(conn, "page_before", f"({page_rows})")
+    finally:
+        conn.unregister("stg_page")
+    return len(rows), max_updated
+
+def _flush_partitions(conn: duckdb.DuckDBPyConnection, settings, min_rows: int = 1) -> None:
+    """With the parquet backend, flush the stage once it holds ``min_rows`` rows."""
+    if settings.storage_backend == "parquet" and partitions.staged_rows(conn) >= max(min_rows, 1):
+        partitions.flush(conn, settings.parquet_dir)
 
 def _build_field_map(settings) -> Dict[str, str]:
     field_map = dict(settings.fields)
     field_map["dataset_updated_at"] = ":updated_at"
     return field_map
 
-def run_snapshot(conn: duckdb.DuckDBPyConnection) -> int:
+def _page_source(client: SocrataClient, settings, select: str, where: Optional[str], order: Optional[str],
+                 start_key: Optional[Tuple[str, str]] = None, start_offset: int = 0):
+    """Pages for ``where``; ``order`` only applies to offset mode.
+
+    Keyset pages depend on the previous page's last key, so they are fetched
+    sequentially. ``start_key``/``start_offset`` resume after a checkpointed page.
+    """
+    if settings.pagination == "keyset":
+        return client.iter_query_keyset(
+            settings.dataset_id, select, where, settings.page_limit, start_key=start_key,
+        )
+    if settings.fetch_workers > 1:
+        return client.iter_query_concurrent(
+            settings.dataset_id, select, where, order, settings.page_limit,
+            workers=settings.fetch_workers, prefetch_pages=settings.prefetch_pages, offset=start_offset,
+        )
+    return client.iter_query(
+        settings.dataset_id, select, where, order, settings.page_limit, offset=start_offset,
+    )
+
+def _iter_pages(client: SocrataClient, settings, runs: Dict[str, "_ProfileRun"], order: Optional[str],
+                select: Optional[str] = None):
+    """``(profile, page)`` for every profile's query, fetched ahead of the writer.
+
+    Each profile pages on its own thread, so profiles download concurrently
+    and network overlaps the DuckDB writes; pages of one profile stay in order.
+    ``select`` defaults to every configured field.
+    """
+    select = select or settings.select_str
+    sources = {
+        name: _page_source(
+            client, settings, select, run.where, order, start_key=run.last_key, start_offset=run.next_offset,
+        )
+        for name, run in runs.items()
+    }
+    return interleave(sources, settings.prefetch_pages * len(sources))
+
+def _key_field_map(settings) -> Dict[str, str]:
+    """Fields read by the first phase of a key-scan incremental."""
+    unknown = [c for c in settings.key_scan_columns if c not in settings.fields]
+    if unknown:
+        raise ValueError(f"KEY_SCAN_COLUMNS not in the dataset fields: {', '.join(unknown)}")
+    key_map = {"uid": settings.fields["uid"], "dataset_updated_at": ":updated_at"}
+    key_map.update({c: settings.fields[c] for c in settings.key_scan_columns})
+    return key_map
+
+def _changed_uids(conn: duckdb.DuckDBPyConnection, rows: List[Dict[str, Any]],
+                  key_map: Dict[str, str]) -> Tuple[List[str], Optional[datetime]]:
+    """uids of a key-scan page whose full row must be fetched, and the page's max ``:updated_at``.
+
+    A row is skipped when the stored copy is at least as recent, or when it
+    is only newer in ``:updated_at`` and every compared column is non-null
+    and unchanged (Socrata touched the row without changing it).
+    """
+    types = _target_types(conn)
+    cols = list(key_map)
+    typed = ", ".join(
+        [c if types.get(c, "VARCHAR") == "VARCHAR" else f"TRY_CAST({c} AS {types[c]}) AS {c}" for c in cols]
+    )
+    compared = [c for c in cols if c not in ("uid", "dataset_updated_at")]
+    unchanged = " AND ".join(f"k.{c} IS NOT NULL AND k.{c} = p.{c}" for c in compared) or "FALSE"
+    conn.register("key_page", _page_to_arrow(rows, key_map))
+    try:
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE key_typed AS
+            SELECT {typed} FROM key_page WHERE uid IS NOT NULL
+        """)
+    finally:
+        conn.unregister("key_page")
+    max_updated = conn.execute("SELECT MAX(dataset_updated_at) FROM key_typed").fetchone()[0]
+    changed = conn.execute(f"""
+        SELECT DISTINCT k.uid
+        FROM key_typed k
+        LEFT JOIN procesos_secop1 p ON p.uid = k.uid
+        WHERE p.uid IS NULL
+           OR (NOT COALESCE(k.dataset_updated_at <= p.dataset_updated_at, FALSE) AND NOT ({unchanged}))
+        ORDER BY k.uid
+    """).fetchall()
+    return [r[0] for r in changed], max_updated
+
+def _profile_where(profile: FilterProfile, clauses: List[str]) -> Optional[str]:
+    clauses = list(clauses)
+    if profile.departamento:
+        clauses.append(f"departamento_entidad = '{_escape_socrata_value(profile.departamento)}'")
+    if profile.municipio:
+        clauses.append(f"municipio_entidad = '{_escape_socrata_value(profile.municipio)}'")
+    return " AND ".join(clauses) if clauses else None
+
+@dataclass
+class _ProfileRun:
+    """One profile's query and progress within a sync."""
+    name: str
+    where: Optional[str]
+    since: Optional[datetime] = None
+    where_hash: str = ""
+    rows: int = 0
+    pages: int = 0
+    last_key: Optional[Tuple[str, str]] = None
+    next_offset: int = 0
+    max_updated: Optional[datetime] = None
+
+def _record_runs(conn: duckdb.DuckDBPyConnection, dataset_id: str, runs: Dict[str, _ProfileRun],
+                 status: str, error: Optional[str] = None, keep_watermarks: bool = False) -> Optional[datetime]:
+    """Store each profile's watermark and the dataset's (the latest of them)."""
+    latest = None
+    for run in runs.values():
+        watermark = run.since if keep_watermarks else run.max_updated
+        update_profile_state(conn, dataset_id, run.name, watermark, status, run.rows, error)
+        latest = _latest(latest, watermark)
+    update_sync_state(conn, dataset_id, latest, status, sum(run.rows for run in runs.values()), error)
+    return latest
+
+def _expected_total(client: SocrataClient, dataset_id: str, runs: Dict[str, _ProfileRun]) -> Optional[int]:
+    total = 0
+    for run in runs.values():
+        expected = _expected_rows(client, dataset_id, run.where)
+        if expected is None:
+            return None
+        total += max(expected - run.next_offset, 0)
+    return total
+
+def _snapshot_hash(settings, where: Optional[str], order: Optional[str]) -> str:
+    # A checkpoint is only valid for the exact same query and paging scheme.
+    parts = [settings.pagination, where or "", order or "", settings.select_str]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+def load_checkpoint(conn: duckdb.DuckDBPyConnection, dataset_id: str, where_hash: str,
+                    profile: str = DEFAULT_PROFILE) -> Optional[Dict[str, Any]]:
+    row = conn.execute("""
+        SELECT last_updated_at, last_id, next_offset, pages, rows_upserted, max_updated_at
+        FROM sync_checkpoint
+        WHERE dataset_id=? AND profile=? AND where_hash=?
+    """, [dataset_id, profile, where_hash]).fetchone()
+    if not row:
+        return None
+    return {
+        "last_key": (row[0], row[1]) if row[1] is not None else None,
+        "next_offset": int(row[2] or 0),
+        "pages": int(row[3] or 0),
+        "rows": int(row[4] or 0),
+        "max_updated": row[5],
+    }
+
+def save_checkpoint(conn: duckdb.DuckDBPyConnection, dataset_id: str, where_hash: str, pagination: str,
+                    last_key: Optional[Tuple[str, str]], next_offset: int, pages: int, rows: int,
+                    max_updated: Optional[datetime], profile: str = DEFAULT_PROFILE):
+    last_updated_at, last_id = last_key if last_key else (None, None)
+    conn.execute("""
+        INSERT INTO sync_checkpoint(dataset_id, profile, where_hash, pagination, last_updated_at, last_id,
+                                    next_offset, pages, rows_upserted, max_updated_at, started_ts, updated_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NOW(), NOW())
+        ON CONFLICT(dataset_id, profile) DO UPDATE SET
+            where_hash=excluded.where_hash,
+            pagination=excluded.pagination,
+            last_updated_at=excluded.last_updated_at,
+            last_id=excluded.last_id,
+            next_offset=excluded.next_offset,
+            pages=excluded.pages,
+            rows_upserted=excluded.rows_upserted,
+            max_updated_at=excluded.max_updated_at,
+            updated_ts=excluded.updated_ts
+    """, [dataset_id, profile, where_hash, pagination, last_updated_at, last_id, next_offset, pages, rows,
+          max_updated])
+
+def clear_checkpoint(conn: duckdb.DuckDBPyConnection, dataset_id: str, profile: Optional[str] = None):
+    """Drop the checkpoint of ``profile``, or of every profile."""
+    if profile is None:
+        conn.execute("DELETE FROM sync_checkpoint WHERE dataset_id=?", [dataset_id])
+    else:
+        conn.execute("DELETE FROM sync_checkpoint WHERE dataset_id=? AND profile=?", [dataset_id, profile])
+
+def _client(settings, streams: int = 1) -> SocrataClient:
+    return SocrataClient(
+        settings.socrata_domain, settings.socrata_app_token, settings.socrata_username, settings.socrata_password,
+        timeout=settings.socrata_timeout, max_retries=settings.socrata_max_retries,
+        pool_size=settings.fetch_workers * streams + 2,
+    )
+
+def _expected_rows(client: SocrataClient, dataset_id: str, where: Optional[str]) -> Optional[int]:
+    # Only used for progress/ETA, so a failed count must not fail the sync.
+    try:
+        return client.count(dataset_id, where)
+    except Exception:
+        logger.warning("Could not count rows to sync", extra={"dataset_id": dataset_id}, exc_info=True)
+        return None
+
+def run_snapshot(conn: duckdb.DuckDBPyConnection, progress=None, keep_checkpoint: bool = False) -> int:
+    """Full reload of the configured window, for every filter profile at once.
+
+    ``progress``, when given, is told the expected row count up front and
+    each page as it is written; it may raise :class:`SyncCancelled` to stop
+    between pages. With ``keep_checkpoint`` the checkpoint survives a
+    completed load, so running it again only fetches what came after.
+    """
     s = get_settings()
-    client = SocrataClient(s.socrata_domain, s.socrata_app_token, s.socrata_username, s.socrata_password)
+    profiles = s.filter_profiles()
+    client = _client(s, len(profiles))
 
     dataset_id = s.dataset_id
     ensure_sync_state(conn, dataset_id)
+    # Rows left staged by an interrupted sync are flushed before new ones arrive.
+    _flush_partitions(conn, s)
 
     current_year = datetime.now().year
     from_year = current_year - s.default_snapshot_years
 
-    where_clauses = [
+    window = [
         "anno_firma_contrato IS NOT NULL",
         "anno_firma_contrato <> 'Sin Firma'",
         f"anno_firma_contrato >= '{from_year}'",
     ]
-    if s.filter_departamento:
-        safe_departamento = _escape_socrata_value(s.filter_departamento)
-        where_clauses.append(f"departamento_entidad = '{safe_departamento}'")
-    if s.filter_municipio:
-        safe_municipio = _escape_socrata_value(s.filter_municipio)
-        where_clauses.append(f"municipio_entidad = '{safe_municipio}'")
-    where = " AND ".join(where_clauses) if where_clauses else None
-    order = ":updated_at ASC"
+    order = ":updated_at ASC" if s.pagination == "offset" else ":updated_at ASC, :id ASC"
 
     field_map = _build_field_map(s)
 
-    total = 0
-    max_updated = None
+    runs: Dict[str, _ProfileRun] = {}
+    for name, profile in profiles.items():
+        run = _ProfileRun(name, _profile_where(profile, window))
+        run.where_hash = _snapshot_hash(s, run.where, order)
+        checkpoint = load_checkpoint(conn, dataset_id, run.where_hash, name)
+        if checkpoint:
+            run.rows, run.pages = checkpoint["rows"], checkpoint["pages"]
+            run.last_key, run.next_offset = checkpoint["last_key"], checkpoint["next_offset"]
+            run.max_updated = checkpoint["max_updated"]
+        else:
+            # A checkpoint for a different query cannot be resumed.
+            clear_checkpoint(conn, dataset_id, name)
+        runs[name] = run
     start_time = time.monotonic()
 
     try:
@@ -117,68 +443,115 @@ def run_snapshot(conn: duckdb.DuckDBPyConnection) -> int:
             "Starting snapshot sync",
             extra={
                 "dataset_id": dataset_id,
-                "where": where,
+                "where": {name: run.where for name, run in runs.items()},
                 "order": order,
                 "page_limit": s.page_limit,
+                "pagination": s.pagination,
+                "fetch_workers": s.fetch_workers,
+                "resumed_pages": sum(run.pages for run in runs.values()),
+                "resumed_rows": sum(run.rows for run in runs.values()),
             },
         )
-        for batch in client.iter_query(dataset_id, s.select_str, where, order, s.page_limit):
-            logger.debug("Snapshot batch fetched", extra={"dataset_id": dataset_id, "batch_size": len(batch)})
-            total += upsert_batch(conn, batch, field_map)
-            for r in batch:
-                ts = _parse_ts(r.get(":updated_at"))
-                if ts and (max_updated is None or ts > max_updated):
-                    max_updated = ts
-
-        update_sync_state(conn, dataset_id, max_updated, "SNAPSHOT_OK", total, None)
+        if progress is not None:
+            progress.start(_expected_total(client, dataset_id, runs))
+        for name, batch in metrics.metered(_iter_pages(client, s, runs, order), "snapshot"):
+            logger.debug(
+                "Snapshot batch fetched", extra={"dataset_id": dataset_id, "profile": name, "batch_size": len(batch)},
+            )
+            run = runs[name]
+            page_key = keyset_key(batch[-1]) if ":id" in batch[-1] else None
+            # The page and its checkpoint commit together, so a crash resumes
+            # exactly after the last page that reached the database.
+            write_start = time.monotonic()
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                page_rows, page_max = upsert_batch(conn, batch, field_map)
+                page_max = _latest(run.max_updated, page_max)
+                save_checkpoint(
+                    conn, dataset_id, run.where_hash, s.pagination, page_key,
+                    run.next_offset + len(batch), run.pages + 1, run.rows + page_rows, page_max, name,
+                )
+                bump_data_generation(conn, dataset_id)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            metrics.record_sync_page("snapshot", page_rows, time.monotonic() - write_start)
+            run.rows += page_rows
+            run.pages += 1
+            run.next_offset += len(batch)
+            run.last_key = page_key
+            run.max_updated = page_max
+            _flush_partitions(conn, s, s.parquet_flush_rows)
+            if progress is not None:
+                progress.page_done(len(batch))
+
+        _flush_partitions(conn, s)
+        compact_rollup(conn)
+        if not keep_checkpoint:
+            clear_checkpoint(conn, dataset_id)
+        max_updated = _record_runs(conn, dataset_id, runs, "SNAPSHOT_OK")
+        total = sum(run.rows for run in runs.values())
         logger.info(
             "Snapshot sync completed",
             extra={
                 "dataset_id": dataset_id,
                 "rows_upserted": total,
+                "profile_rows": {name: run.rows for name, run in runs.items()},
                 "max_updated": max_updated.isoformat() if max_updated else None,
                 "duration_s": round(time.monotonic() - start_time, 2),
+                "http": client.stats.snapshot(),
             },
         )
         return total
+    except SyncCancelled:
+        _record_runs(conn, dataset_id, runs, "SNAPSHOT_CANCELLED")
+        logger.info(
+            "Snapshot sync cancelled",
+            extra={"dataset_id": dataset_id, "rows_upserted": sum(run.rows for run in runs.values())},
+        )
+        raise
     except Exception as e:
-        update_sync_state(conn, dataset_id, max_updated, "SNAPSHOT_ERROR", total, str(e))
+        max_updated = _record_runs(conn, dataset_id, runs, "SNAPSHOT_ERROR", str(e))
         logger.exception(
             "Snapshot sync failed",
             extra={
                 "dataset_id": dataset_id,
-                "rows_upserted": total,
+                "rows_upserted": sum(run.rows for run in runs.values()),
                 "max_updated": max_updated.isoformat() if max_updated else None,
+                "last_key": {name: run.last_key for name, run in runs.items()},
                 "duration_s": round(time.monotonic() - start_time, 2),
+                "http": client.stats.snapshot(),
             },
         )
         raise
 
-def run_incremental(conn: duckdb.DuckDBPyConnection) -> int:
+def run_incremental(conn: duckdb.DuckDBPyConnection, progress=None) -> int:
+    """Rows updated since each profile's watermark; ``progress`` as in :func:`run_snapshot`.
+
+    With ``INCREMENTAL_KEY_SCAN`` the window is first read as keys only
+    (uid, ``:updated_at`` and ``KEY_SCAN_COLUMNS``), and full rows are then
+    fetched by uid for the keys that :func:`_changed_uids` keeps.
+    """
     s = get_settings()
-    client = SocrataClient(s.socrata_domain, s.socrata_app_token, s.socrata_username, s.socrata_password)
+    profiles = s.filter_profiles()
+    client = _client(s, len(profiles) + 1)
 
     dataset_id = s.dataset_id
     ensure_sync_state(conn, dataset_id)
+    _flush_partitions(conn, s)
 
-    last = get_last_dataset_updated_at(conn, dataset_id)
-    where_clauses = []
-    if last:
-        safe_last = _escape_socrata_value(last.isoformat())
-        where_clauses.append(f":updated_at > '{safe_last}'")
-    if s.filter_departamento:
-        safe_departamento = _escape_socrata_value(s.filter_departamento)
-        where_clauses.append(f"departamento_entidad = '{safe_departamento}'")
-    if s.filter_municipio:
-        safe_municipio = _escape_socrata_value(s.filter_municipio)
-        where_clauses.append(f"municipio_entidad = '{safe_municipio}'")
-    where = " AND ".join(where_clauses) if where_clauses else None
-    order = ":updated_at ASC"
+    runs: Dict[str, _ProfileRun] = {}
+    for name, profile in profiles.items():
+        last = get_profile_watermark(conn, dataset_id, name)
+        clauses = [f":updated_at > '{_escape_socrata_value(last.isoformat())}'"] if last else []
+        runs[name] = _ProfileRun(name, _profile_where(profile, clauses), since=last, max_updated=last)
+    order = ":updated_at ASC" if s.pagination == "offset" else ":updated_at ASC, :id ASC"
 
     field_map = _build_field_map(s)
-
-    total = 0
-    max_updated = last
+    key_map = _key_field_map(s) if s.incremental_key_scan else None
+    select = ",".join(dict.fromkeys(key_map.values())) if key_map else None
+    scanned = fetched = 0
     start_time = time.monotonic()
 
     try:
@@ -186,39 +559,205 @@ def run_incremental(conn: duckdb.DuckDBPyConnection) -> int:
             "Starting incremental sync",
             extra={
                 "dataset_id": dataset_id,
-                "where": where,
+                "where": {name: run.where for name, run in runs.items()},
                 "order": order,
                 "page_limit": s.page_limit,
-                "last_updated_at": last.isoformat() if last else None,
+                "pagination": s.pagination,
+                "fetch_workers": s.fetch_workers,
+                "key_scan": bool(key_map),
+                "last_updated_at": {
+                    name: run.since.isoformat() if run.since else None for name, run in runs.items()
+                },
             },
         )
-        for batch in client.iter_query(dataset_id, s.select_str, where, order, s.page_limit):
-            logger.debug("Incremental batch fetched", extra={"dataset_id": dataset_id, "batch_size": len(batch)})
-            total += upsert_batch(conn, batch, field_map)
-            for r in batch:
-                ts = _parse_ts(r.get(":updated_at"))
-                if ts and (max_updated is None or ts > max_updated):
-                    max_updated = ts
-        update_sync_state(conn, dataset_id, max_updated, "INCREMENTAL_OK", total, None)
+        if progress is not None:
+            progress.start(_expected_total(client, dataset_id, runs))
+        for name, batch in metrics.metered(_iter_pages(client, s, runs, order, select), "incremental"):
+            logger.debug(
+                "Incremental batch fetched",
+                extra={"dataset_id": dataset_id, "profile": name, "batch_size": len(batch)},
+            )
+            run = runs[name]
+            pages = [batch]
+            if key_map:
+                # The scan's keys set the watermark, whether or not their rows are fetched.
+                changed, scan_max = _changed_uids(conn, batch, key_map)
+                run.max_updated = _latest(run.max_updated, scan_max)
+                scanned += len(batch)
+                fetched += len(changed)
+                metrics.SYNC_KEY_SCAN_ROWS.inc(len(changed), result="fetched")
+                metrics.SYNC_KEY_SCAN_ROWS.inc(len(batch) - len(changed), result="skipped")
+                # One upsert per key page: the per-upsert cost of the derived
+                # tables would dominate with one per uid batch.
+                rows = [
+                    row
+                    for fetched_page in client.iter_query_in(
+                        dataset_id, s.select_str, key_map["uid"], changed, s.key_scan_batch,
+                        workers=s.fetch_workers,
+                    )
+                    for row in fetched_page
+                ]
+                pages = [rows] if rows else []
+            for page in pages:
+                write_start = time.monotonic()
+                # The page, its derived-table deltas and the generation commit
+                # together, so a failure leaves no half-applied page behind.
+                conn.execute("BEGIN TRANSACTION")
+                try:
+                    page_rows, page_max = upsert_batch(conn, page, field_map)
+                    bump_data_generation(conn, dataset_id)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                metrics.record_sync_page("incremental", page_rows, time.monotonic() - write_start)
+                run.rows += page_rows
+                run.pages += 1
+                if not key_map:
+                    # Re-fetched rows may already be newer than the scan position.
+                    run.max_updated = _latest(run.max_updated, page_max)
+            if ":id" in batch[-1]:
+                run.last_key = keyset_key(batch[-1])
+            _flush_partitions(conn, s, s.parquet_flush_rows)
+            if progress is not None:
+                progress.page_done(len(batch))
+        _flush_partitions(conn, s)
+        compact_rollup(conn)
+        max_updated = _record_runs(conn, dataset_id, runs, "INCREMENTAL_OK")
+        total = sum(run.rows for run in runs.values())
         logger.info(
             "Incremental sync completed",
             extra={
                 "dataset_id": dataset_id,
                 "rows_upserted": total,
+                "profile_rows": {name: run.rows for name, run in runs.items()},
+                "key_scan": {"scanned": scanned, "fetched": fetched} if key_map else None,
                 "max_updated": max_updated.isoformat() if max_updated else None,
                 "duration_s": round(time.monotonic() - start_time, 2),
+                "http": client.stats.snapshot(),
             },
         )
         return total
+    except SyncCancelled:
+        # Unfetched rows may share the last page's :updated_at, so keep the old watermarks.
+        _record_runs(conn, dataset_id, runs, "INCREMENTAL_CANCELLED", keep_watermarks=True)
+        logger.info(
+            "Incremental sync cancelled",
+            extra={"dataset_id": dataset_id, "rows_upserted": sum(run.rows for run in runs.values())},
+        )
+        raise
     except Exception as e:
-        update_sync_state(conn, dataset_id, last, "INCREMENTAL_ERROR", total, str(e))
+        _record_runs(conn, dataset_id, runs, "INCREMENTAL_ERROR", str(e), keep_watermarks=True)
         logger.exception(
             "Incremental sync failed",
             extra={
                 "dataset_id": dataset_id,
-                "rows_upserted": total,
-                "max_updated": max_updated.isoformat() if max_updated else None,
+                "rows_upserted": sum(run.rows for run in runs.values()),
+                "last_key": {name: run.last_key for name, run in runs.items()},
                 "duration_s": round(time.monotonic() - start_time, 2),
+                "http": client.stats.snapshot(),
             },
         )
         raise
+
+def _copy_sync_state(live: duckdb.DuckDBPyConnection, shadow: duckdb.DuckDBPyConnection) -> None:
+    for table in ("sync_state", "sync_profile_state"):
+        rows = live.execute(f"SELECT * FROM {table}").fetchall()
+        cols = [d[0] for d in live.description]
+        shadow.execute(f"DELETE FROM {table}")
+        if rows:
+            shadow.executemany(
+                f"INSERT INTO {table}({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", rows,
+            )
+
+def _open_shadow(live: duckdb.DuckDBPyConnection) -> duckdb.DuckDBPyConnection:
+    """Shadow database for a rebuild; one left with a checkpoint (not yet swapped in) is resumed."""
+    path = shadow_path()
+    if os.path.exists(path):
+        resumable = False
+        try:
+            shadow = duckdb.connect(path)
+            try:
+                resumable = shadow.execute("SELECT COUNT(*) FROM sync_checkpoint").fetchone()[0] > 0
+            finally:
+                if not resumable:
+                    shadow.close()
+        except duckdb.Error:
+            logger.warning("Discarding unreadable shadow database", extra={"path": path}, exc_info=True)
+        if not resumable:
+            remove_database(path)
+    if not os.path.exists(path):
+        shadow = duckdb.connect(path)
+    init_db(shadow)
+    _copy_sync_state(live, shadow)
+    return shadow
+
+def _advance_generation(conn: duckdb.DuckDBPyConnection, floor: int) -> int:
+    """Bump the data generation past ``floor`` so cache keys and ETags never repeat across files."""
+    current = get_data_generation(conn)
+    if current <= floor:
+        conn.execute("""
+            UPDATE sync_state SET data_generation = COALESCE(data_generation, 0) + ?
+            WHERE dataset_id = (SELECT MIN(dataset_id) FROM sync_state)
+        """, [floor - current + 1])
+    return get_data_generation(conn)
+
+def run_rebuild(conn: duckdb.DuckDBPyConnection, progress=None) -> int:
+    """Snapshot into a shadow database file, then swap it in for the live one.
+
+    Readers keep using the live file for the whole load and only wait for the
+    swap itself; the replaced file is kept for :func:`rollback_database`.
+    ``conn`` is a cursor on the live database and is closed before the swap.
+    The shadow keeps its checkpoint until the swap succeeds: after a
+    cancelled or failed load, or a swap that timed out waiting for readers,
+    the next rebuild resumes it instead of downloading everything again.
+    """
+    if get_settings().storage_backend == "parquet":
+        raise ValueError("Rebuild only supports STORAGE_BACKEND=duckdb")
+    start_time = time.monotonic()
+    shadow = _open_shadow(conn)
+    try:
+        total = run_snapshot(shadow, progress, keep_checkpoint=True)
+        generation = _advance_generation(shadow, get_data_generation(conn))
+        shadow.execute("CHECKPOINT")
+    finally:
+        shadow.close()
+    conn.close()
+    swap_start = time.monotonic()
+    swap_database(shadow_path(), expected_generation=generation)
+    with pooled_cursor() as cur:
+        clear_checkpoint(cur, get_settings().dataset_id)
+    clear_all()
+    logger.info(
+        "Rebuilt database swapped in",
+        extra={
+            "rows_upserted": total,
+            "data_generation": generation,
+            "swap_s": round(time.monotonic() - swap_start, 3),
+            "duration_s": round(time.monotonic() - start_time, 2),
+        },
+    )
+    return total
+
+def rollback_database(conn: duckdb.DuckDBPyConnection, progress=None) -> int:
+    """Swap the database replaced by the last rebuild back in.
+
+    The current file becomes the rollback point, so a rollback can itself be
+    undone. ``conn`` is closed before the swap, as in :func:`run_rebuild`.
+    """
+    path = previous_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError("No previous database to roll back to")
+    floor = get_data_generation(conn)
+    conn.close()
+    previous = duckdb.connect(path)
+    try:
+        generation = _advance_generation(previous, floor)
+        previous.execute("CHECKPOINT")
+    finally:
+        previous.close()
+    swap_database(path, expected_generation=generation)
+    clear_all()
+    logger.info("Previous database restored", extra={"data_generation": generation})
+    return 0
+
@@ -0,0 +1,217 @@
+"""Minimal write-only XLSX writer that streams Arrow record batches.
+
+Rows are rendered to SpreadsheetML with Arrow compute kernels, one batch at a
+time, and written straight into a deflated zip stream, so memory stays bounded
+by the batch size regardless of how many rows are exported.
+"""
+from __future__ import annotations
+
+import zipfile
+from typing import Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+EXCEL_MAX_ROWS = 1_048_576
+
+# Same characters as openpyxl's ILLEGAL_CHARACTERS_RE, in RE2 syntax.
+_ILLEGAL_CHARACTERS = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"
+_EXCEL_EPOCH_DAYS = 25569  # 1970-01-01 as an Excel serial date
+_EMPTY_CELL = "<c/>"
+
+_CONTENT_TYPES_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    "</Relationships>"
+)
+# cellXfs index 1 is the date-time style used for TIMESTAMP/DATE cells.
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+
+class ChunkSink:
+    """Non-seekable file object that collects written bytes until drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self.closed = True
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _sanitize_text(arr: pa.Array) -> pa.Array:
+    arr = pc.replace_substring_regex(arr, _ILLEGAL_CHARACTERS, "")
+    arr = pc.replace_substring(arr, "&", "&amp;")
+    arr = pc.replace_substring(arr, "<", "&lt;")
+    return pc.replace_substring(arr, ">", "&gt;")
+
+
+def _wrap(arr: pa.Array, head: str, tail: str) -> pa.Array:
+    return pc.fill_null(pc.binary_join_element_wise(head, arr, tail, ""), _EMPTY_CELL)
+
+
+def _cells(arr: pa.Array) -> pa.Array:
+    """Render one column as an array of ``<c>`` elements."""
+    t = arr.type
+    if pa.types.is_timestamp(t) or pa.types.is_date(t):
+        micros = pc.cast(pc.cast(arr, pa.timestamp("us")), pa.int64())
+        serial = pc.add(pc.divide(pc.cast(micros, pa.float64()), 86_400_000_000.0), float(_EXCEL_EPOCH_DAYS))
+        return _wrap(pc.cast(serial, pa.string()), '<c s="1"><v>', "</v></c>")
+    if pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_decimal(t):
+        values = pc.cast(arr, pa.float64())
+        values = pc.if_else(pc.is_finite(values), values, pa.scalar(None, pa.float64()))
+        return _wrap(pc.cast(values, pa.string()), "<c><v>", "</v></c>")
+    if pa.types.is_boolean(t):
+        return _wrap(pc.cast(pc.cast(arr, pa.int8()), pa.string()), '<c t="b"><v>', "</v></c>")
+    text = arr if pa.types.is_string(t) or pa.types.is_large_string(t) else pc.cast(arr, pa.string())
+    return _wrap(_sanitize_text(text), '<c t="inlineStr"><is><t xml:space="preserve">', "</t></is></c>")
+
+
+def _render_rows(batch: pa.RecordBatch) -> bytes:
+    cells = [_cells(col) for col in batch.columns]
+    rows = pc.binary_join_element_wise("<row>", *cells, "</row>", "")
+    joined = pc.binary_join(pa.ListArray.from_arrays(pa.array([0, len(rows)], pa.int32()), rows), "")
+    return joined[0].as_py().encode("utf-8")
+
+
+def _header_row(names: List[str]) -> bytes:
+    cells = "".join(
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(name)}</t></is></c>' for name in names
+    )
+    return f"<row>{cells}</row>".encode("utf-8")
+
+
+def iter_xlsx(
+    batches: Iterable[pa.RecordBatch],
+    sheet_title: str = "procesos",
+    max_rows: int = EXCEL_MAX_ROWS,
+) -> Iterator[bytes]:
+    """Yield an XLSX file built from ``batches``.
+
+    The first batch may be empty; its schema provides the header row. When a
+    sheet reaches ``max_rows`` (header included) the export continues on a new
+    sheet named ``<sheet_title>_2``, ``<sheet_title>_3``, and so on.
+    """
+    sink = ChunkSink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+    sheet_names: List[str] = []
+    header = b""
+    sheet = None
+    sheet_rows = 0
+
+    def _open_sheet():
+        nonlocal sheet, sheet_rows
+        sheet_names.append(sheet_title if not sheet_names else f"{sheet_title}_{len(sheet_names) + 1}")
+        sheet = zf.open(f"xl/worksheets/sheet{len(sheet_names)}.xml", "w", force_zip64=True)
+        sheet.write(_SHEET_HEAD.encode("utf-8"))
+        sheet.write(header)
+        sheet_rows = 1
+
+    def _close_sheet():
+        sheet.write(_SHEET_TAIL.encode("utf-8"))
+        sheet.close()
+
+    for batch in batches:
+        if sheet is None:
+            header = _header_row(batch.schema.names)
+            _open_sheet()
+        offset = 0
+        while offset < batch.num_rows:
+            if sheet_rows >= max_rows:
+                _close_sheet()
+                _open_sheet()
+            take = min(batch.num_rows - offset, max_rows - sheet_rows)
+            sheet.write(_render_rows(batch.slice(offset, take)))
+            sheet_rows += take
+            offset += take
+        yield sink.drain()
+
+    if sheet is None:
+        _open_sheet()
+    _close_sheet()
+
+    sheets_xml = "".join(
+        f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheet_names, 1)
+    )
+    zf.writestr(
+        "xl/workbook.xml",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f"<sheets>{sheets_xml}</sheets></workbook>",
+    )
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{i}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    styles_rel = (
+        f'<Relationship Id="rId{len(sheet_names) + 1}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+    )
+    zf.writestr(
+        "xl/_rels/workbook.xml.rels",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f"{sheet_rels}{styles_rel}</Relationships>",
+    )
+    zf.writestr("xl/styles.xml", _STYLES)
+    zf.writestr("_rels/.rels", _ROOT_RELS)
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    zf.writestr("[Content_Types].xml", _CONTENT_TYPES_HEAD + overrides + "</Types>")
+    zf.close()
+    yield sink.drain()
@@ -0,0 +1 @@
+"""Benchmarks and local stand-ins for SECOP I data (not imported by the app)."""
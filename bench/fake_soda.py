@@ -0,0 +1,278 @@
+"""Local stand-in for the Socrata SODA API, backed by DuckDB.
+
+Serves ``/resource/<dataset_id>.json`` with ``$select``, ``$where``,
+``$order``, ``$limit`` and ``$offset``. SoQL is close enough to DuckDB SQL for
+the queries the sync issues, so clauses are passed through after mapping the
+system fields ``:id``/``:updated_at`` to the ``_id``/``_updated_at`` columns.
+It executes the given SQL as-is: only bind it to localhost.
+
+Latency, 5xx errors and 429 throttling can be injected to exercise the
+client's retry path. ``POST /_admin/touch?rows=N`` bumps ``:updated_at`` on N
+random rows so an incremental sync has something to fetch; with ``change=0``
+the rows keep their values, as when Socrata re-publishes unchanged rows.
+
+Usage::
+
+    python -m bench.fake_soda --rows 200000 --port 8089 --latency-ms 50
+    SOCRATA_DOMAIN=http://127.0.0.1:8089 python -m uvicorn app.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+
+from . import synthetic
+
+TABLE = "soda_rows"
+_SYSTEM_FIELDS = {":updated_at": "_updated_at", ":id": "_id"}
+_SYSTEM_RE = re.compile(r":(updated_at|id)\b")
+_IDENTIFIER_RE = re.compile(r"[a-z_][a-z0-9_]*")
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%gZ"
+
+
+def _soql(clause: str) -> str:
+    return _SYSTEM_RE.sub(lambda m: _SYSTEM_FIELDS[m.group(0)], clause)
+
+
+def _split_select(select: str) -> List[str]:
+    items, depth, current = [], 0, []
+    for ch in select:
+        if ch == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current.append(ch)
+    items.append("".join(current).strip())
+    return [item for item in items if item]
+
+
+def _select_list(select: Optional[str], columns: List[str]) -> str:
+    if not select or select.strip() == "*":
+        items = [c for c in columns if c not in _SYSTEM_FIELDS.values()]
+    else:
+        items = _split_select(select)
+    out = []
+    for item in items:
+        if item == ":updated_at":
+            out.append(f"strftime(_updated_at, '{_TIMESTAMP_FORMAT}') AS \":updated_at\"")
+        elif item == ":id":
+            out.append('_id AS ":id"')
+        elif _IDENTIFIER_RE.fullmatch(item) and item not in columns:
+            # Fields that are null in every row are missing from generated or
+            # recorded data; Socrata would just omit them from each row.
+            out.append(f"NULL AS {item}")
+        else:
+            out.append(_soql(item))
+    return ", ".join(out)
+
+
+class FakeSoda:
+    """Dataset, query translation and fault injection, independent of HTTP."""
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, dataset_id: str = "f789-7hwg",
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after_s: int = 0, seed: int = 0):
+        self.conn = conn
+        self.dataset_id = dataset_id
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after_s = retry_after_s
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._columns = [r[0] for r in conn.execute(f"DESCRIBE {TABLE}").fetchall()]
+
+    def query(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        sql = f"SELECT {_select_list(params.get('$select'), self._columns)} FROM {TABLE}"
+        if params.get("$where"):
+            sql += f" WHERE {_soql(params['$where'])}"
+        if params.get("$order"):
+            sql += f" ORDER BY {_soql(params['$order'])}"
+        sql += f" LIMIT {int(params.get('$limit', 1000))} OFFSET {int(params.get('$offset', 0))}"
+        rows = self.conn.cursor().execute(sql).fetch_arrow_table().to_pylist()
+        # Socrata omits nulls and serializes every value as a string.
+        return [{k: v if isinstance(v, str) else str(v) for k, v in row.items() if v is not None} for row in rows]
+
+    def fault(self) -> Optional[int]:
+        """Status code to fail this request with, after the injected latency."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            roll = self._random.random()
+        if delay:
+            time.sleep(delay / 1000.0)
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def touch(self, rows: int, change: bool = True) -> int:
+        """Mark ``rows`` random rows as updated now (all with the same timestamp).
+
+        With ``change`` their ``estado_del_proceso`` becomes ``LIQUIDADO``.
+        """
+        change_sql = ", estado_del_proceso = 'LIQUIDADO'" if change else ""
+        cur = self.conn.cursor()
+        cur.execute(f"""
+            UPDATE {TABLE}
+            SET _updated_at = (SELECT MAX(_updated_at) FROM {TABLE}) + INTERVAL 1 SECOND{change_sql}
+            WHERE _id IN (SELECT _id FROM {TABLE} USING SAMPLE {int(rows)} ROWS)
+        """)
+        return int(cur.fetchone()[0])
+
+
+def _handler(soda: FakeSoda):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=5)
+                self.send_header("Content-Encoding", "gzip")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != f"/resource/{soda.dataset_id}.json":
+                return self._send(404, {"message": "not found"})
+            status = soda.fault()
+            if status == 429:
+                return self._send(429, {"message": "throttled"}, {"Retry-After": str(soda.retry_after_s)})
+            if status:
+                return self._send(status, {"message": "injected error"})
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                rows = soda.query(params)
+            except (duckdb.Error, ValueError) as exc:
+                return self._send(400, {"message": str(exc)})
+            self._send(200, rows)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/_admin/touch":
+                return self._send(404, {"message": "not found"})
+            query = parse_qs(url.query)
+            rows = int(query.get("rows", ["1000"])[-1])
+            change = query.get("change", ["1"])[-1] not in ("0", "false")
+            self._send(200, {"touched": soda.touch(rows, change)})
+
+    return Handler
+
+
+class FakeSodaServer:
+    """Threaded HTTP server for a :class:`FakeSoda`; usable as a context manager."""
+
+    def __init__(self, soda: FakeSoda, host: str = "127.0.0.1", port: int = 0):
+        self.soda = soda
+        self.httpd = ThreadingHTTPServer((host, port), _handler(soda))
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-soda", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSodaServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeSodaServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def load_dataset(conn: duckdb.DuckDBPyConnection, rows: int, seed: int = 0, source: Optional[str] = None) -> None:
+    """Fill the served table with synthetic rows, or with a recorded export.
+
+    A recorded file (JSON, CSV or Parquet as returned by the API) keeps its
+    ``:id``/``:updated_at`` when present; otherwise they are synthesized.
+    """
+    if not source:
+        synthetic.create_source(conn, TABLE, rows, seed)
+        return
+    if source.endswith(".parquet"):
+        reader = f"read_parquet('{source}')"
+    elif source.endswith(".csv"):
+        reader = f"read_csv('{source}', all_varchar = true)"
+    else:
+        reader = f"read_json_auto('{source}')"
+    conn.execute(f"CREATE OR REPLACE TABLE {TABLE} AS SELECT * FROM {reader}")
+    columns = [r[0] for r in conn.execute(f"DESCRIBE {TABLE}").fetchall()]
+    for field, column in _SYSTEM_FIELDS.items():
+        if field in columns:
+            conn.execute(f'ALTER TABLE {TABLE} RENAME "{field}" TO {column}')
+    if ":updated_at" in columns:
+        conn.execute(f"ALTER TABLE {TABLE} ALTER _updated_at TYPE TIMESTAMP")
+    else:
+        conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN _updated_at TIMESTAMP DEFAULT TIMESTAMP '{datetime(2024, 1, 1)}'")
+    if ":id" not in columns:
+        conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN _id VARCHAR")
+        conn.execute(f"UPDATE {TABLE} SET _id = 'row-' || uid")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", help="recorded JSON/CSV/Parquet export instead of synthetic rows")
+    parser.add_argument("--dataset-id", default="f789-7hwg")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(":memory:")
+    load_dataset(conn, args.rows, args.seed, args.source)
+    soda = FakeSoda(
+        conn, args.dataset_id, args.latency_ms, args.jitter_ms, args.error_rate,
+        args.throttle_rate, args.retry_after, args.seed,
+    )
+    server = FakeSodaServer(soda, args.host, args.port)
+    print(f"Serving {args.dataset_id} at {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Query-layer benchmark over a synthetic ``procesos_secop1``.
+
+Builds (or reuses) a DuckDB file with ``--rows`` synthetic processes from
+:func:`bench.synthetic.load_procesos`, then times the functions behind the
+API (listing, counting, stats, catalogs and the CSV/XLSX exports) across a
+matrix of filter combinations. The in-memory caches are cleared before every
+run, so each timing is a query against DuckDB (after one untimed warm-up
+run that loads the data it touches, except for exports). For every case it reports
+p50/p95 latency and how far RSS rose above its level before the call.
+
+Results can be saved as a baseline and later runs compared against it; the
+exit status is 1 when any p50 regresses beyond ``--tolerance``.
+
+Usage::
+
+    python -m bench.query_bench --rows 1000000 --workdir bench_data
+    python -m bench.query_bench --rows 1000000 --workdir bench_data --save-baseline base.json
+    python -m bench.query_bench --rows 1000000 --workdir bench_data --baseline base.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import duckdb
+
+from . import synthetic
+from .sync_bench import _peak_rss_mb
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+FILTER_KEYS = [
+    "anno", "anno_min", "anno_max", "modalidad", "destino", "entidad", "entidad_exact",
+    "departamento", "municipio", "cuantia_min", "cuantia_max", "bpin", "estado", "q",
+]
+
+
+def _filters(**kw) -> Dict[str, Any]:
+    values = {key: None for key in FILTER_KEYS}
+    values.update(entidad_exact=False, text=None)
+    values.update(kw)
+    return values
+
+
+# Filter combinations the UI produces, from unfiltered to very selective.
+CASES = {
+    "all": _filters(),
+    "anno": _filters(anno=2022),
+    "anno_range+modalidad": _filters(anno_min=2020, anno_max=2023, modalidad=synthetic.MODALIDADES[1]),
+    "departamento+municipio": _filters(departamento="La Guajira", municipio="Albania"),
+    "entidad_exact": _filters(entidad=synthetic.entidades()[0][0], entidad_exact=True),
+    "entidad_partial": _filters(entidad="HOSPITAL"),
+    "cuantia_range": _filters(cuantia_min=1_000_000, cuantia_max=50_000_000),
+    "estado+destino": _filters(estado="LIQUIDADO", destino="Inversión"),
+    "q": _filters(q="guajira"),
+    "text": _filters(text="alimentacion escolar"),
+    "text+departamento": _filters(text="vias terciarias", departamento="Antioquia"),
+    "bpin": _filters(bpin="2020000000007"),
+}
+
+EXPORT_OPS = {"export_csv", "export_xlsx"}
+
+
+class _RssSampler:
+    """Peak resident memory above the starting level while the block runs."""
+
+    def __init__(self, interval_s: float = 0.002):
+        self.interval_s = interval_s
+        self.peak_mb: Optional[float] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _rss_mb() -> Optional[float]:
+        if psutil is not None:
+            return psutil.Process().memory_info().rss / (1024 * 1024)
+        try:
+            with open("/proc/self/statm") as fh:
+                pages = int(fh.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, AttributeError, ValueError):
+            return None
+
+    def _run(self, start: float) -> None:
+        peak = start
+        while not self._stop.wait(self.interval_s):
+            peak = max(peak, self._rss_mb() or peak)
+        self.peak_mb = round(max(peak, self._rss_mb() or peak) - start, 1)
+
+    def __enter__(self):
+        start = self._rss_mb()
+        if start is not None:
+            self._thread = threading.Thread(target=self._run, args=(start,), daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if hasattr(self, "_thread"):
+            self._thread.join()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _drain(chunks) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+
+def _operations(conn, exports, qlib, iter_xlsx, f: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+    args = [f[key] for key in FILTER_KEYS]
+
+    def export_sql():
+        return exports._export_sql(
+            conn, None, f["anno"], f["anno_min"], f["anno_max"], f["modalidad"], f["destino"],
+            f["entidad"], f["departamento"], f["municipio"], f["cuantia_min"], f["cuantia_max"],
+            f["bpin"], f["estado"], f["q"], f["text"],
+        )
+
+    return {
+        "list_procesos": lambda: len(qlib.list_procesos(conn, *args, 50, 0, f["text"])),
+        "list_procesos_offset": lambda: len(qlib.list_procesos(conn, *args, 50, 10_000, f["text"])),
+        "count_procesos": lambda: qlib.count_procesos(conn, *args, f["text"]),
+        "get_stats": lambda: qlib.get_stats(conn, *args, f["text"])["total"],
+        "list_catalog": lambda: len(qlib.list_catalog(conn, "nombre_entidad", 1000, None, f["departamento"], f["municipio"])),
+        "export_csv": lambda: _drain(exports._iter_csv(*export_sql())),
+        "export_xlsx": lambda: _drain(iter_xlsx(exports._iter_record_batches(*export_sql()))),
+    }
+
+
+def _measure(fn: Callable[[], Any], repeat: int, clear: Callable[[], None], warmup: int = 0) -> Dict[str, Any]:
+    for _ in range(warmup):
+        clear()
+        fn()
+    timings, peaks, size = [], [], None
+    for _ in range(repeat):
+        clear()
+        with _RssSampler() as rss:
+            start = time.perf_counter()
+            size = fn()
+            timings.append((time.perf_counter() - start) * 1000.0)
+        if rss.peak_mb is not None:
+            peaks.append(rss.peak_mb)
+    return {
+        "runs": repeat,
+        "p50_ms": round(_percentile(timings, 50), 2),
+        "p95_ms": round(_percentile(timings, 95), 2),
+        "rss_mb": max(peaks) if peaks else None,
+        "size": size,
+    }
+
+
+def _prepare_db(args) -> Path:
+    workdir = Path(args.workdir or ".")
+    workdir.mkdir(parents=True, exist_ok=True)
+    path = workdir / f"procesos_{args.rows}_s{args.seed}.duckdb"
+    if path.exists():
+        conn = duckdb.connect(str(path))
+        try:
+            if conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0] == args.rows:
+                return path
+        except duckdb.Error:
+            pass
+        finally:
+            conn.close()
+        for suffix in ("", ".wal"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+    print(f"Generating {args.rows} rows into {path} ...", file=sys.stderr, flush=True)
+    start = time.perf_counter()
+    conn = duckdb.connect(str(path))
+    try:
+        synthetic.load_procesos(conn, args.rows, args.seed)
+    finally:
+        conn.close()
+    print(f"Generated in {time.perf_counter() - start:.1f}s", file=sys.stderr, flush=True)
+    return path
+
+
+def run(args) -> Dict[str, Any]:
+    path = _prepare_db(args)
+    # Settings are read from the environment on first use, so configure them
+    # before touching the app's connection or exports.
+    os.environ.update({
+        "DUCKDB_PATH": str(path),
+        "FILTER_ENTIDAD": "",
+        "FILTER_DEPARTAMENTO": "",
+        "FILTER_MUNICIPIO": "",
+    })
+    from app import db as db_lib
+    from app import exports
+    from app import query as qlib
+    from app.xlsx import iter_xlsx
+
+    conn = db_lib.get_conn()
+    results = []
+    try:
+        for case, filters in CASES.items():
+            if args.only and not any(part in case for part in args.only):
+                continue
+            ops = _operations(conn, exports, qlib, iter_xlsx, filters)
+            matches = ops["count_procesos"]()
+            for op, fn in ops.items():
+                row = {"case": case, "op": op, "matches": matches}
+                if op in EXPORT_OPS and matches > args.export_max_rows:
+                    row["skipped"] = f"more than {args.export_max_rows} rows"
+                else:
+                    export = op in EXPORT_OPS
+                    repeat = args.export_repeat if export else args.repeat
+                    row.update(_measure(fn, repeat, qlib.clear_caches, 0 if export else 1))
+                results.append(row)
+                print(f"{case:24} {op:22} {row.get('p50_ms', '-')}", file=sys.stderr, flush=True)
+    finally:
+        conn.close()
+        db_lib.close_db()
+    return {
+        "meta": {
+            "rows": args.rows,
+            "seed": args.seed,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "duckdb": duckdb.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "peak_rss_mb": _peak_rss_mb(),
+        },
+        "results": results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Annotate ``report`` rows with their ratio to the baseline; return regressions."""
+    base = {(r["case"], r["op"]): r for r in baseline["results"] if "p50_ms" in r}
+    regressions = []
+    for row in report["results"]:
+        ref = base.get((row["case"], row["op"]))
+        if ref is None or "p50_ms" not in row:
+            continue
+        row["baseline_p50_ms"] = ref["p50_ms"]
+        row["ratio"] = round(row["p50_ms"] / ref["p50_ms"], 2) if ref["p50_ms"] else None
+        if row["p50_ms"] > ref["p50_ms"] * (1 + tolerance) and row["p50_ms"] - ref["p50_ms"] > min_delta_ms:
+            regressions.append(f"{row['case']}/{row['op']}: {ref['p50_ms']} -> {row['p50_ms']} ms")
+    return regressions
+
+
+def _print(report: Dict[str, Any]) -> None:
+    cols = ["case", "op", "matches", "p50_ms", "p95_ms", "rss_mb", "ratio"]
+    rows = [{c: r.get(c, r.get("skipped", "") if c == "p50_ms" else "") for c in cols} for r in report["results"]]
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Query-layer benchmark over synthetic procesos_secop1")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where the generated database is kept and reused (default: .)")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--export-repeat", type=int, default=3)
+    parser.add_argument("--export-max-rows", type=int, default=250_000,
+                        help="skip exports of cases matching more rows than this")
+    parser.add_argument("--only", nargs="*", help="run only cases whose name contains one of these")
+    parser.add_argument("--baseline", help="compare p50 against this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown vs baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--save-baseline", help="write this run's report to a file")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    regressions: List[str] = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline["meta"]["rows"] != args.rows:
+            print(f"warning: baseline has {baseline['meta']['rows']} rows", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+    _print(report)
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
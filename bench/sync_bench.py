@@ -0,0 +1,224 @@
+"""End-to-end sync benchmark against the local SODA stand-in.
+
+Starts :mod:`bench.fake_soda` in a subprocess (so its memory is not counted),
+runs a snapshot into a fresh DuckDB file, touches some rows and runs an
+incremental sync (``--key-scan`` for the two-phase one; ``--unchanged-rows``
+also touches rows without changing them). For each phase it reports rows/sec, peak RSS and the time
+spent waiting on the network, parsing JSON and upserting into DuckDB.
+Fetching overlaps with upserts (prefetch), so the parts can add up to more
+than the wall time.
+
+Usage::
+
+    python -m bench.sync_bench --rows 200000 --incremental-rows 5000 --latency-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process, or None where it cannot be read."""
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    return None
+
+
+def _start_server(args) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "bench.fake_soda",
+        "--rows", str(args.rows), "--seed", str(args.seed), "--port", "0",
+        "--dataset-id", args.dataset_id,
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+    ]
+    if args.source:
+        cmd += ["--source", args.source]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, cwd=Path(__file__).resolve().parents[1])
+
+
+def _server_url(proc: subprocess.Popen) -> str:
+    line = proc.stdout.readline().strip()
+    if not line.startswith("Serving"):
+        raise RuntimeError(f"fake_soda did not start: {line!r}")
+    return line.rsplit(" ", 1)[-1]
+
+
+class _Probe:
+    """Captures the sync's Socrata clients and times each upsert."""
+
+    def __init__(self, sync_lib):
+        self.sync_lib = sync_lib
+        self.clients: List[Any] = []
+        self.upsert_s = 0.0
+        self.pages = 0
+        self.text_index_s = 0.0
+        self._make_client = sync_lib._client
+        self._upsert = sync_lib.upsert_batch
+        self._text_index = sync_lib.refresh_text_index
+
+    def __enter__(self):
+        def make_client(settings, *a, **kw):
+            client = self._make_client(settings, *a, **kw)
+            self.clients.append(client)
+            return client
+
+        def upsert(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return self._upsert(*a, **kw)
+            finally:
+                self.upsert_s += time.perf_counter() - start
+                self.pages += 1
+
+        def text_index(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return self._text_index(*a, **kw)
+            finally:
+                self.text_index_s += time.perf_counter() - start
+
+        self.sync_lib._client = make_client
+        self.sync_lib.upsert_batch = upsert
+        self.sync_lib.refresh_text_index = text_index
+        return self
+
+    def __exit__(self, *exc):
+        self.sync_lib._client = self._make_client
+        self.sync_lib.upsert_batch = self._upsert
+        self.sync_lib.refresh_text_index = self._text_index
+
+
+def _phase(name: str, run, conn, sync_lib) -> Dict[str, Any]:
+    with _Probe(sync_lib) as probe:
+        start = time.perf_counter()
+        rows = run(conn)
+        wall = time.perf_counter() - start
+    http = [c.stats.snapshot() for c in probe.clients]
+    return {
+        "phase": name,
+        "rows": rows,
+        "wall_s": round(wall, 3),
+        "rows_per_sec": round(rows / wall, 1) if wall else None,
+        "network_s": round(sum(h["latency_total_s"] for h in http), 3),
+        "parse_s": round(sum(h["parse_total_s"] for h in http), 3),
+        "upsert_s": round(probe.upsert_s, 3),
+        "pages": probe.pages,
+        "upsert_ms_page": round(1000 * probe.upsert_s / probe.pages, 1) if probe.pages else None,
+        "text_index_s": round(probe.text_index_s, 3),
+        "requests": sum(h["requests"] for h in http),
+        "retries": sum(h["retries"] for h in http),
+        "bytes_wire": sum(h["bytes_wire"] for h in http),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run(args) -> List[Dict[str, Any]]:
+    proc = _start_server(args)
+    try:
+        url = _server_url(proc)
+        workdir = Path(args.workdir or tempfile.mkdtemp(prefix="sync_bench_"))
+        db_path = workdir / "bench.duckdb"
+        for suffix in ("", ".wal"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        # Settings are read from the environment on first use, so configure
+        # them before importing the app.
+        os.environ.update({
+            "SOCRATA_DOMAIN": url,
+            "DATASET_ID": args.dataset_id,
+            "DUCKDB_PATH": str(db_path),
+            "PAGE_LIMIT": str(args.page_limit),
+            "PAGINATION": args.pagination,
+            "FETCH_WORKERS": str(args.fetch_workers),
+            "DEFAULT_SNAPSHOT_YEARS": "100",
+            "FILTER_ENTIDAD": "",
+            "FILTER_DEPARTAMENTO": "",
+            "FILTER_MUNICIPIO": "",
+            "INCREMENTAL_KEY_SCAN": "true" if args.key_scan else "false",
+            "KEY_SCAN_COLUMNS": args.key_scan_columns,
+        })
+        from app import db as db_lib
+        from app import sync as sync_lib
+
+        conn = db_lib.get_conn()
+        results = [_phase("snapshot", sync_lib.run_snapshot, conn, sync_lib)]
+        if args.unchanged_rows:
+            requests.post(
+                f"{url}/_admin/touch", params={"rows": args.unchanged_rows, "change": 0}, timeout=60,
+            ).raise_for_status()
+        if args.incremental_rows:
+            requests.post(f"{url}/_admin/touch", params={"rows": args.incremental_rows}, timeout=60).raise_for_status()
+        if args.incremental_rows or args.unchanged_rows:
+            results.append(_phase("incremental", sync_lib.run_incremental, conn, sync_lib))
+        conn.close()
+        db_lib.close_db()
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def _print(results: List[Dict[str, Any]]) -> None:
+    cols = ["phase", "rows", "wall_s", "rows_per_sec", "network_s", "parse_s", "upsert_s",
+            "pages", "upsert_ms_page", "text_index_s", "requests", "retries", "bytes_wire", "peak_rss_mb"]
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="End-to-end sync benchmark against bench.fake_soda")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--incremental-rows", type=int, default=5_000)
+    parser.add_argument("--unchanged-rows", type=int, default=0,
+                        help="rows touched before the incremental without changing their values")
+    parser.add_argument("--key-scan", action="store_true", help="two-phase incremental (INCREMENTAL_KEY_SCAN)")
+    # The synthetic rows have no ultima_actualizacion, which touch() leaves alone anyway.
+    parser.add_argument("--key-scan-columns", default="estado_del_proceso")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", help="recorded export served instead of synthetic rows")
+    parser.add_argument("--dataset-id", default="f789-7hwg")
+    parser.add_argument("--page-limit", type=int, default=50_000)
+    parser.add_argument("--pagination", choices=["keyset", "offset"], default="keyset")
+    parser.add_argument("--fetch-workers", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--workdir", help="directory for the benchmark database (default: a temp dir)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    _print(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Synthetic SECOP I (f789-7hwg) rows generated set-based in DuckDB.
+
+Values follow the shapes of the real dataset: a few entidades concentrate
+most processes, modalidad/estado use the SECOP I vocabularies, descriptions
+are long free text and every value is a string, as Socrata serves it.
+Generation is deterministic for a given ``seed``.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import duckdb
+
+from app.db import (
+    DERIVED_COLUMNS,
+    apply_catalog_delta,
+    apply_rollup_delta,
+    compact_rollup,
+    init_db,
+    refresh_text_index,
+)
+from app.sync import ensure_sync_state, update_sync_state
+
+MODALIDADES = [
+    "Contratación Directa (Ley 1150 de 2007)",
+    "Contratación Mínima Cuantía",
+    "Régimen Especial",
+    "Selección Abreviada de Menor Cuantía (Ley 1150 de 2007)",
+    "Licitación Pública",
+    "Concurso de Méritos Abierto",
+    "Selección Abreviada servicios de Salud",
+    "Subasta",
+    "Licitación obra pública",
+    "Contratos y convenios con más de dos partes",
+]
+ESTADOS = [
+    "CELEBRADO",
+    "LIQUIDADO",
+    "TERMINADO SIN LIQUIDAR",
+    "CONVOCADO",
+    "ADJUDICADO",
+    "TERMINADO ANORMALMENTE DESPUES DE CONVOCADO",
+    "DESCARTADO",
+]
+DESTINOS = ["Inversión", "Funcionamiento"]
+LUGARES = [
+    ("La Guajira", "Albania"),
+    ("La Guajira", "Riohacha"),
+    ("La Guajira", "Maicao"),
+    ("Antioquia", "Medellín"),
+    ("Antioquia", "Envigado"),
+    ("Bogotá D.C.", "Bogotá D.C."),
+    ("Cundinamarca", "Soacha"),
+    ("Valle del Cauca", "Cali"),
+    ("Atlántico", "Barranquilla"),
+    ("Bolívar", "Cartagena"),
+    ("Santander", "Bucaramanga"),
+    ("Nariño", "Pasto"),
+    ("Córdoba", "Montería"),
+    ("Cesar", "Valledupar"),
+    ("Magdalena", "Santa Marta"),
+    ("Boyacá", "Tunja"),
+]
+ENTIDADES = [
+    "{dep} - ALCALDiA MUNICIPIO DE {mun}",
+    "{dep} - E.S.E. HOSPITAL {mun}",
+    "{dep} - GOBERNACION",
+    "{dep} - CONCEJO MUNICIPAL DE {mun}",
+    "{dep} - INSTITUTO DE DEPORTES DE {mun}",
+]
+OBJETOS = [
+    "PRESTACION DE SERVICIOS PROFESIONALES",
+    "PRESTACION DE SERVICIOS DE APOYO A LA GESTION",
+    "MANTENIMIENTO Y MEJORAMIENTO DE VIAS TERCIARIAS",
+    "SUMINISTRO DE ALIMENTOS PARA EL PROGRAMA DE ALIMENTACION ESCOLAR",
+    "CONSTRUCCION DE PLACA HUELLA",
+    "ADQUISICION DE EQUIPOS DE COMPUTO",
+    "INTERVENTORIA TECNICA ADMINISTRATIVA Y FINANCIERA",
+    "TRANSPORTE ESCOLAR DE ESTUDIANTES DEL AREA RURAL",
+    "ARRENDAMIENTO DE INMUEBLE",
+    "SUMINISTRO DE COMBUSTIBLE",
+]
+DETALLES = [
+    "EN LA SECRETARIA DE PLANEACION DEL MUNICIPIO",
+    "PARA EL FORTALECIMIENTO INSTITUCIONAL",
+    "EN LAS INSTITUCIONES EDUCATIVAS OFICIALES",
+    "DE CONFORMIDAD CON LOS ESTUDIOS PREVIOS Y EL PLIEGO DE CONDICIONES",
+    "EN LA ZONA RURAL Y URBANA",
+    "CON CARGO AL SISTEMA GENERAL DE PARTICIPACIONES",
+    "SEGUN ESPECIFICACIONES TECNICAS ANEXAS",
+    "DURANTE LA VIGENCIA FISCAL",
+]
+CONTRATISTAS = [
+    "CONSORCIO VIAS DEL SUR",
+    "UNION TEMPORAL ALIMENTAR",
+    "FUNDACION PARA EL DESARROLLO SOCIAL",
+    "INGENIERIA Y CONSTRUCCIONES S.A.S.",
+    "SUMINISTROS LA GUAJIRA LTDA",
+    "JUAN CARLOS PEREZ GOMEZ",
+    "MARIA FERNANDA RODRIGUEZ",
+    "COOPERATIVA DE TRANSPORTADORES",
+]
+
+
+def _lit(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _array(values: List[str]) -> str:
+    return "[" + ", ".join(_lit(v) for v in values) + "]"
+
+
+def _uniform(seed: int, k: int) -> str:
+    """Deterministic pseudo-random value in [0, 1) for row ``i``, stream ``k``."""
+    return f"((hash(i, {seed}, {k}) % 1000003) / 1000003.0)"
+
+
+def _pick(values: List[str], seed: int, k: int, skew: float = 1.0) -> str:
+    """One of ``values``; ``skew`` > 1 concentrates picks on the first ones."""
+    index = f"CAST(floor(pow({_uniform(seed, k)}, {skew}) * {len(values)}) AS INTEGER) + 1"
+    return f"list_element({_array(values)}, {index})"
+
+
+def entidades() -> List[Tuple[str, str, str]]:
+    """``(nombre_entidad, departamento, municipio)``, most frequent first."""
+    return [
+        (template.format(dep=dep.upper(), mun=mun.upper()), dep, mun)
+        for template in ENTIDADES
+        for dep, mun in LUGARES
+    ]
+
+
+def source_expressions(seed: int = 0, first_year: int = 2018, last_year: int = 2025) -> Dict[str, str]:
+    """SQL expression per Socrata field, over an integer row number ``i``."""
+    ents = entidades()
+    ent = f"CAST(floor(pow({_uniform(seed, 1)}, 3.0) * {len(ents)}) AS INTEGER) + 1"
+    years = last_year - first_year + 1
+    year = f"{first_year} + CAST(floor({_uniform(seed, 2)} * {years}) AS INTEGER)"
+    firma = f"(DATE '{first_year}-01-01' + CAST(floor({_uniform(seed, 2)} * {years * 365}) AS INTEGER))"
+    cuantia = f"round(exp(13 + 3 * {_uniform(seed, 3)}) , 0)"
+    detalle = " || ' ' || ".join(
+        [_pick(OBJETOS, seed, 10, 1.5)] + [_pick(DETALLES, seed, 11 + n) for n in range(6)]
+    )
+    return {
+        "uid": f"'{seed}-' || i::VARCHAR",
+        "anno_cargue_secop": f"({year})::VARCHAR",
+        "anno_firma_contrato": (
+            f"CASE WHEN {_uniform(seed, 4)} < 0.03 THEN 'Sin Firma' ELSE strftime({firma}, '%Y') END"
+        ),
+        "nombre_entidad": f"list_element({_array([e[0] for e in ents])}, {ent})",
+        "departamento_entidad": f"list_element({_array([e[1] for e in ents])}, {ent})",
+        "municipio_entidad": f"list_element({_array([e[2] for e in ents])}, {ent})",
+        "modalidad_de_contratacion": _pick(MODALIDADES, seed, 5, 2.5),
+        "estado_del_proceso": _pick(ESTADOS, seed, 6, 2.0),
+        "destino_gasto": _pick(DESTINOS, seed, 7, 1.5),
+        "objeto_a_contratar": _pick(OBJETOS, seed, 10, 1.5),
+        "detalle_del_objeto_a_contratar": detalle,
+        "tipo_de_contrato": _pick(["Prestación de Servicios", "Obra", "Suministro", "Compraventa", "Otro"], seed, 8, 2.0),
+        "numero_de_proceso": "'PROC-' || i::VARCHAR",
+        "numero_de_contrato": "'CTO-' || i::VARCHAR",
+        "cuantia_proceso": f"({cuantia} * 1.05)::VARCHAR",
+        "cuantia_contrato": f"({cuantia})::VARCHAR",
+        "nom_razon_social_contratista": _pick(CONTRATISTAS, seed, 9, 2.0),
+        "fecha_de_firma_del_contrato": f"strftime({firma}, '%Y-%m-%dT00:00:00.000')",
+        "codigo_bpin": f"CASE WHEN {_uniform(seed, 20)} < 0.2 THEN (2020000000000 + i)::VARCHAR END",
+        "moneda": "'Peso Colombiano'",
+    }
+
+
+def create_source(
+    conn: duckdb.DuckDBPyConnection,
+    table: str,
+    rows: int,
+    seed: int = 0,
+    updated_from: datetime = datetime(2024, 1, 1),
+) -> None:
+    """Create ``table`` with ``rows`` Socrata-shaped rows.
+
+    Besides the string fields, ``_id`` and ``_updated_at`` hold the system
+    fields ``:id`` and ``:updated_at`` (one second apart, in row order).
+    """
+    exprs = source_expressions(seed)
+    columns = ",\n".join(f"{expr} AS {name}" for name, expr in exprs.items())
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT {columns},
+               'row-' || lpad(i::VARCHAR, 10, '0') AS _id,
+               TIMESTAMP '{updated_from:%Y-%m-%d %H:%M:%S}' + to_seconds(i) AS _updated_at
+        FROM range({int(rows)}) t(i)
+    """)
+
+
+def load_procesos(
+    conn: duckdb.DuckDBPyConnection,
+    rows: int,
+    seed: int = 0,
+    dataset_id: str = "f789-7hwg",
+    chunk_rows: int = 500_000,
+    updated_from: datetime = datetime(2024, 1, 1),
+) -> None:
+    """Append ``rows`` synthetic processes to ``procesos_secop1``.
+
+    Rows are typed like an upsert would type them and inserted in chunks; each
+    chunk also feeds the text index, ``catalog_values`` and ``stats_rollup``
+    the way a sync page does, so the query layer sees a consistent database.
+    The sync state is marked as a finished snapshot.
+    """
+    init_db(conn)
+    types = {r[1]: r[2] for r in conn.execute("PRAGMA table_info('procesos_secop1')").fetchall()}
+    typed = ",\n".join(
+        f"TRY_CAST({expr} AS {types[name]}) AS {name}" for name, expr in source_expressions(seed).items()
+    )
+    derived = ", ".join(f"{expr} AS {name}" for name, (_, _, expr) in DERIVED_COLUMNS.items())
+    start = conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0]
+    for lo in range(start, start + rows, chunk_rows):
+        hi = min(lo + chunk_rows, start + rows)
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE bench_chunk AS
+                SELECT *, {derived}
+                FROM (
+                    SELECT {typed},
+                           TIMESTAMP '{updated_from:%Y-%m-%d %H:%M:%S}' + to_seconds(i) AS dataset_updated_at
+                    FROM range({lo}, {hi}) t(i)
+                )
+            """)
+            conn.execute("INSERT INTO procesos_secop1 BY NAME SELECT * FROM bench_chunk")
+            refresh_text_index(conn, "bench_chunk")
+            apply_catalog_delta(conn, None, "bench_chunk")
+            apply_rollup_delta(conn, None, "bench_chunk")
+            conn.execute("DROP TABLE bench_chunk")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    compact_rollup(conn)
+    ensure_sync_state(conn, dataset_id)
+    latest = conn.execute("SELECT MAX(dataset_updated_at) FROM procesos_secop1").fetchone()[0]
+    update_sync_state(conn, dataset_id, latest, "SNAPSHOT_OK", rows, None)
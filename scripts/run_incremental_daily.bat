@@ -9,7 +9,7 @@ if not exist .venv (
 
 call .venv\Scripts\activate
 
-REM Run incremental sync
-python -c "from app.db import get_conn; from app.sync import run_incremental; print(run_incremental(get_conn()))"
+REM Run incremental sync through the API if it is up, so it never overlaps another sync
+python -m scripts.run_sync incremental
 
 endlocal
@@ -0,0 +1,60 @@
+"""Run a sync through the jobs layer, so it never overlaps another one.
+
+When the API is up the job is submitted to it (``POST /sync/run``) and
+followed until it finishes: the API process owns the DuckDB file and its
+job registry is where the single-flight check lives. Otherwise the job runs
+in this process through ``app.jobs``.
+
+Usage: python -m scripts.run_sync [incremental|snapshot|rebuild]
+"""
+import os
+import sys
+import time
+
+import requests
+
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8001")
+POLL_SECONDS = 5
+
+
+def _run_via_api(mode: str):
+    """Job dict from the API, or None when it is not running."""
+    try:
+        resp = requests.post(f"{API_URL}/sync/run", params={"mode": mode}, timeout=30)
+    except requests.ConnectionError:
+        return None
+    if resp.status_code == 409:
+        detail = resp.json()["detail"]
+        raise SystemExit(f"Sync not started: {detail['message']}")
+    resp.raise_for_status()
+    job = resp.json()
+    print(f"Submitted {mode} job {job['id']} to {API_URL}")
+    while job["status"] in ("queued", "running"):
+        time.sleep(POLL_SECONDS)
+        resp = requests.get(f"{API_URL}/sync/jobs/{job['id']}", timeout=30)
+        resp.raise_for_status()
+        job = resp.json()
+    return job
+
+
+def _run_in_process(mode: str):
+    from app import jobs
+    from app.settings import get_settings
+
+    job = jobs.submit(mode, get_settings().dataset_id)
+    job.wait()
+    return job.to_dict()
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else "incremental"
+    job = _run_via_api(mode)
+    if job is None:
+        job = _run_in_process(mode)
+    print(f"{job['mode']} {job['status']}: {job['rows']} rows")
+    if job["status"] != "succeeded":
+        raise SystemExit(job["error"] or 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+import unittest
+
+import duckdb
+from starlette.requests import Request
+
+from app import cache
+from app import db as db_lib
+from app.sync import ensure_sync_state, update_sync_state
+
+
+def _request(if_none_match=None):
+    headers = []
+    if if_none_match:
+        headers.append((b"if-none-match", if_none_match.encode("latin-1")))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUCache(2)
+        lru.put("a", 1)
+        lru.put("b", 2)
+        self.assertEqual(lru.get("a"), 1)
+        lru.put("c", 3)
+        self.assertNotIn("b", lru)
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+
+    def test_zero_size_disables(self):
+        lru = cache.LRUCache(0)
+        lru.put("a", 1)
+        self.assertIsNone(lru.get("a"))
+
+
+class TestCachedJson(unittest.TestCase):
+    def setUp(self):
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        ensure_sync_state(self.conn, "ds")
+        cache.clear_all()
+        self.calls = 0
+
+    def tearDown(self):
+        cache.clear_all()
+        self.conn.close()
+
+    def _compute(self):
+        self.calls += 1
+        return {"calls": self.calls}
+
+    def _get(self, params, if_none_match=None):
+        return cache.cached_json(_request(if_none_match), self.conn, "test", params, self._compute)
+
+    def test_repeat_request_served_from_cache(self):
+        first = self._get({"q": "obra", "modalidad": None})
+        second = self._get({"modalidad": "", "q": "obra"})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.headers["etag"], second.headers["etag"])
+        self.assertNotEqual(self._get({"q": "vias"}).headers["etag"], first.headers["etag"])
+
+    def test_if_none_match_returns_304(self):
+        etag = self._get({"q": "obra"}).headers["etag"]
+        response = self._get({"q": "obra"}, if_none_match=f'W/{etag}, "other"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+
+    def test_sync_commit_invalidates(self):
+        etag = self._get({"q": "obra"}).headers["etag"]
+        update_sync_state(self.conn, "ds", None, "INCREMENTAL_OK", 0, None)
+        self.assertEqual(len(cache.get_response_cache()), 0)
+        response = self._get({"q": "obra"}, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.body), {"calls": 2})
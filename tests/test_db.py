@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+import duckdb
+
+from app import db as db_lib
+
+
+class TestCursorPool(unittest.TestCase):
+    def setUp(self):
+        self.db = duckdb.connect(":memory:")
+        db_lib.init_db(self.db)
+        self.pool = db_lib.CursorPool(self.db, size=2, timeout=0.1)
+
+    def tearDown(self):
+        self.pool.close()
+        self.db.close()
+
+    def test_released_cursor_is_reused(self):
+        with self.pool.cursor() as first:
+            pass
+        with self.pool.cursor() as second:
+            self.assertIs(first, second)
+
+    def test_cursors_share_database(self):
+        with self.pool.cursor() as cur:
+            cur.execute("INSERT INTO sync_state(dataset_id) VALUES ('abcd-1234')")
+        with self.pool.cursor() as cur:
+            row = cur.execute("SELECT COUNT(*) FROM sync_state").fetchone()
+        self.assertEqual(row[0], 1)
+
+    def test_acquire_blocks_when_exhausted(self):
+        a = self.pool.acquire()
+        b = self.pool.acquire()
+        with self.assertRaises(TimeoutError):
+            self.pool.acquire()
+        self.pool.release(a)
+        self.pool.release(b)
+
+    def test_concurrent_queries(self):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(20):
+                    with self.pool.cursor() as cur:
+                        cur.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()
+            except Exception as exc:  # pragma: no cover - surfaced below
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+
+class TestDerivedColumnsMigration(unittest.TestCase):
+    def test_init_db_adds_and_backfills_derived_columns(self):
+        conn = duckdb.connect(":memory:")
+        db_lib.init_db(conn)
+        for name in db_lib.DERIVED_COLUMNS:
+            conn.execute(f"ALTER TABLE procesos_secop1 DROP COLUMN {name}")
+        conn.execute(
+            "INSERT INTO procesos_secop1(uid, anno_firma_contrato, nombre_entidad, departamento_entidad, municipio_entidad) "
+            "VALUES ('a', '2022', 'Alcaldía', 'Bolívar', 'Cartagena')"
+        )
+        db_lib.init_db(conn)
+        row = conn.execute(
+            "SELECT anno_firma_int, nombre_entidad_norm, departamento_entidad_norm, municipio_entidad_norm "
+            "FROM procesos_secop1"
+        ).fetchone()
+        self.assertEqual(row, (2022, "ALCALDIA", "BOLIVAR", "CARTAGENA"))
+        conn.close()
@@ -0,0 +1,195 @@
+import dataclasses
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import duckdb
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import db as db_lib
+from app import sync as sync_lib
+from app.settings import get_settings
+from bench import fake_soda
+
+
+class SwapTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "secop.duckdb")
+        self.settings = dataclasses.replace(get_settings(), duckdb_path=self.path, swap_drain_timeout=5.0)
+        for module in (db_lib, sync_lib):
+            patch = mock.patch.object(module, "get_settings", return_value=self.settings)
+            patch.start()
+            self.addCleanup(patch.stop)
+        db_lib.close_db()
+        self.addCleanup(db_lib.close_db)
+        db_lib.init_db(db_lib.get_db())
+
+    def _count(self):
+        with db_lib.pooled_cursor() as cur:
+            return cur.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0]
+
+
+class TestSwapDatabase(SwapTestCase):
+    def _write_next(self, rows):
+        conn = duckdb.connect(db_lib.shadow_path())
+        db_lib.init_db(conn)
+        conn.execute("INSERT INTO procesos_secop1 (uid) SELECT 'u' || range FROM range(?)", [rows])
+        conn.close()
+
+    def test_swap_waits_for_readers_and_keeps_previous_file(self):
+        self._write_next(3)
+        holding, release = threading.Event(), threading.Event()
+
+        def reader():
+            with db_lib.pooled_cursor() as cur:
+                holding.set()
+                release.wait(5)
+                cur.execute("SELECT 1").fetchone()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        holding.wait(5)
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        start = time.monotonic()
+        db_lib.swap_database(db_lib.shadow_path())
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        thread.join()
+
+        self.assertEqual(self._count(), 3)
+        self.assertTrue(os.path.exists(db_lib.previous_path()))
+        self.assertFalse(os.path.exists(db_lib.shadow_path()))
+
+    def test_drain_timeout_leaves_live_file_in_place(self):
+        self._write_next(3)
+        with db_lib.pooled_cursor():
+            with self.assertRaises(TimeoutError):
+                db_lib.swap_database(db_lib.shadow_path(), timeout=0.1)
+        self.assertEqual(self._count(), 0)
+        self.assertTrue(os.path.exists(db_lib.shadow_path()))
+
+    def test_generation_mismatch_restores_live_file(self):
+        self._write_next(3)
+        with self.assertRaises(RuntimeError):
+            db_lib.swap_database(db_lib.shadow_path(), expected_generation=42)
+        self.assertEqual(self._count(), 0)
+        self.assertTrue(os.path.exists(db_lib.shadow_path()))
+        self.assertFalse(os.path.exists(db_lib.previous_path()))
+
+
+    def test_concurrent_requests_across_a_swap(self):
+        self._write_next(3)
+        app = FastAPI()
+
+        @app.get("/count")
+        def count(conn=Depends(db_lib.get_cursor)):
+            return conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0]
+
+        statuses, counts, errors = [], [], []
+
+        def worker(client):
+            for _ in range(25):
+                try:
+                    response = client.get("/count")
+                except Exception as exc:
+                    errors.append(exc)
+                    continue
+                statuses.append(response.status_code)
+                counts.append(response.json())
+
+        with TestClient(app) as client:
+            threads = [threading.Thread(target=worker, args=(client,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.05)
+            db_lib.swap_database(db_lib.shadow_path())
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(statuses, [200] * 200)
+        self.assertLessEqual(set(counts), {0, 3})
+        self.assertEqual(db_lib._IN_FLIGHT, 0)
+        self.assertEqual(self._count(), 3)
+
+
+    def test_swap_waits_for_open_get_conn_cursors(self):
+        self._write_next(3)
+        conn = db_lib.get_conn()
+        with self.assertRaises(TimeoutError):
+            db_lib.swap_database(db_lib.shadow_path(), timeout=0.1)
+        conn.close()
+        conn.close()
+        db_lib.swap_database(db_lib.shadow_path())
+        self.assertEqual(self._count(), 3)
+
+
+class TestRebuild(SwapTestCase):
+    def setUp(self):
+        super().setUp()
+        source = duckdb.connect(":memory:")
+        fake_soda.load_dataset(source, 300, seed=5)
+        self.addCleanup(source.close)
+        soda = fake_soda.FakeSoda(source, seed=5)
+        server = fake_soda.FakeSodaServer(soda).start()
+        self.addCleanup(server.stop)
+        self.settings = dataclasses.replace(
+            self.settings,
+            socrata_domain=server.url,
+            dataset_id=soda.dataset_id,
+            page_limit=100,
+            default_snapshot_years=100,
+            filter_departamento=None,
+            filter_municipio=None,
+            filter_entidad=None,
+        )
+        sync_lib.get_settings.return_value = self.settings
+        db_lib.get_settings.return_value = self.settings
+        self.expected = source.execute(
+            f"SELECT COUNT(*) FROM {fake_soda.TABLE} WHERE anno_firma_contrato <> 'Sin Firma'"
+        ).fetchone()[0]
+
+    def test_rebuild_swaps_in_new_data_and_rollback_restores_it(self):
+        conn = db_lib.get_conn()
+        sync_lib.ensure_sync_state(conn, self.settings.dataset_id)
+        sync_lib.update_sync_state(conn, self.settings.dataset_id, None, "SNAPSHOT_OK", 0, None)
+        generation = db_lib.get_data_generation(conn)
+
+        self.assertEqual(sync_lib.run_rebuild(conn), self.expected)
+        self.assertEqual(self._count(), self.expected)
+        with db_lib.pooled_cursor() as cur:
+            rebuilt_generation = db_lib.get_data_generation(cur)
+        self.assertGreater(rebuilt_generation, generation)
+        self.assertFalse(os.path.exists(db_lib.shadow_path()))
+
+        sync_lib.rollback_database(db_lib.get_conn())
+        self.assertEqual(self._count(), 0)
+        with db_lib.pooled_cursor() as cur:
+            self.assertGreater(db_lib.get_data_generation(cur), rebuilt_generation)
+
+        sync_lib.rollback_database(db_lib.get_conn())
+        self.assertEqual(self._count(), self.expected)
+
+    def test_timed_out_swap_is_retried_without_reloading(self):
+        self.settings = dataclasses.replace(self.settings, swap_drain_timeout=0.1)
+        sync_lib.get_settings.return_value = self.settings
+        db_lib.get_settings.return_value = self.settings
+        with db_lib.pooled_cursor():
+            with self.assertRaises(TimeoutError):
+                sync_lib.run_rebuild(db_lib.get_conn())
+        self.assertEqual(self._count(), 0)
+        self.assertTrue(os.path.exists(db_lib.shadow_path()))
+
+        with mock.patch.object(sync_lib, "upsert_batch", wraps=sync_lib.upsert_batch) as upsert:
+            self.assertEqual(sync_lib.run_rebuild(db_lib.get_conn()), self.expected)
+        upsert.assert_not_called()
+        self.assertEqual(self._count(), self.expected)
+        with db_lib.pooled_cursor() as cur:
+            self.assertEqual(cur.execute("SELECT COUNT(*) FROM sync_checkpoint").fetchone()[0], 0)
+
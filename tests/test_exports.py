@@ -0,0 +1,99 @@
+import csv
+import io
+import unittest
+from datetime import datetime
+
+import duckdb
+import openpyxl
+import pyarrow as pa
+import pyarrow.ipc as paipc
+import pyarrow.parquet as pq
+
+from app import db as db_lib
+from app import exports
+from app import xlsx
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = duckdb.connect(":memory:")
+        db_lib.init_db(self.db)
+        self.db.execute(
+            """
+            INSERT INTO procesos_secop1(uid, estado_del_proceso, cuantia_contrato, dataset_updated_at)
+            SELECT 'u' || i, 'Celebrado, "A"', i * 1.5, TIMESTAMP '2024-01-01' + INTERVAL (i) SECOND
+            FROM range(25) t(i)
+            """
+        )
+        self._saved_pool = db_lib._POOL
+        db_lib._POOL = db_lib.CursorPool(self.db, size=2)
+
+    def tearDown(self):
+        db_lib._POOL.close()
+        db_lib._POOL = self._saved_pool
+        self.db.close()
+
+
+class TestCsvExport(ExportTestCase):
+    def test_csv_streams_in_batches_with_single_header(self):
+        sql = "SELECT uid, estado_del_proceso, cuantia_contrato FROM procesos_secop1 ORDER BY dataset_updated_at DESC"
+        chunks = list(exports._iter_csv(sql, [], batch_rows=10))
+        self.assertGreater(len(chunks), 2)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+        self.assertEqual(rows[0], ["uid", "estado_del_proceso", "cuantia_contrato"])
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(rows[1], ["u24", 'Celebrado, "A"', "36"])
+
+    def test_csv_empty_result_has_header(self):
+        sql = "SELECT uid FROM procesos_secop1 WHERE uid = ?"
+        body = b"".join(exports._iter_csv(sql, ["missing"]))
+        self.assertEqual(body.decode("utf-8").strip(), "uid")
+
+
+class TestXlsxExport(ExportTestCase):
+    def _load(self, chunks):
+        return openpyxl.load_workbook(io.BytesIO(b"".join(chunks)), read_only=True)
+
+    def test_xlsx_round_trips_types_and_sanitizes(self):
+        self.db.execute(
+            "UPDATE procesos_secop1 SET detalle_del_objeto_a_contratar = 'a\x01b <&>' WHERE uid = 'u0'"
+        )
+        sql = (
+            "SELECT uid, detalle_del_objeto_a_contratar, cuantia_contrato, dataset_updated_at "
+            "FROM procesos_secop1 WHERE uid = 'u0'"
+        )
+        wb = self._load(xlsx.iter_xlsx(exports._iter_record_batches(sql, [])))
+        rows = list(wb["procesos"].iter_rows(values_only=True))
+        self.assertEqual(rows[0], ("uid", "detalle_del_objeto_a_contratar", "cuantia_contrato", "dataset_updated_at"))
+        self.assertEqual(rows[1], ("u0", "ab <&>", 0, datetime(2024, 1, 1)))
+
+    def test_xlsx_splits_sheets_at_row_limit(self):
+        sql = "SELECT uid FROM procesos_secop1 ORDER BY dataset_updated_at"
+        chunks = xlsx.iter_xlsx(exports._iter_record_batches(sql, [], batch_rows=7), max_rows=11)
+        wb = self._load(chunks)
+        self.assertEqual(wb.sheetnames, ["procesos", "procesos_2", "procesos_3"])
+        sheets = [list(wb[name].iter_rows(values_only=True)) for name in wb.sheetnames]
+        self.assertEqual([len(rows) for rows in sheets], [11, 11, 6])
+        self.assertTrue(all(rows[0] == ("uid",) for rows in sheets))
+        uids = [row[0] for rows in sheets for row in rows[1:]]
+        self.assertEqual(uids, [f"u{i}" for i in range(25)])
+
+    def test_xlsx_empty_result_has_header(self):
+        wb = self._load(xlsx.iter_xlsx(exports._iter_record_batches("SELECT uid FROM procesos_secop1 WHERE false", [])))
+        self.assertEqual(list(wb["procesos"].iter_rows(values_only=True)), [("uid",)])
+
+
+class TestColumnarExports(ExportTestCase):
+    SQL = "SELECT uid, cuantia_contrato, dataset_updated_at FROM procesos_secop1 ORDER BY dataset_updated_at DESC"
+
+    def test_parquet_keeps_types(self):
+        table = pq.read_table(io.BytesIO(b"".join(exports._iter_parquet(self.SQL, []))))
+        self.assertEqual(table.num_rows, 25)
+        self.assertEqual(table.schema.field("cuantia_contrato").type, pa.float64())
+        self.assertTrue(pa.types.is_timestamp(table.schema.field("dataset_updated_at").type))
+        self.assertEqual(table.column("uid")[0].as_py(), "u24")
+
+    def test_arrow_stream_keeps_types(self):
+        table = paipc.open_stream(b"".join(exports._iter_arrow(self.SQL, []))).read_all()
+        self.assertEqual(table.num_rows, 25)
+        self.assertEqual(table.schema.field("cuantia_contrato").type, pa.float64())
@@ -0,0 +1,193 @@
+import dataclasses
+import unittest
+from unittest import mock
+
+import duckdb
+
+from app import db as db_lib
+from app import metrics
+from app import sync as sync_lib
+from app.settings import get_settings
+from app.socrata import SocrataClient
+from bench import fake_soda
+
+
+class TestSyncAgainstFakeSoda(unittest.TestCase):
+    def setUp(self):
+        source = duckdb.connect(":memory:")
+        fake_soda.load_dataset(source, 500, seed=3)
+        self.soda = fake_soda.FakeSoda(source, error_rate=0.2, seed=3)
+        self.server = fake_soda.FakeSodaServer(self.soda).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(source.close)
+
+        settings = dataclasses.replace(
+            get_settings(),
+            socrata_domain=self.server.url,
+            dataset_id=self.soda.dataset_id,
+            page_limit=120,
+            default_snapshot_years=100,
+            filter_departamento="La Guajira",
+            filter_municipio=None,
+        )
+        patch = mock.patch.object(sync_lib, "get_settings", return_value=settings)
+        patch.start()
+        self.addCleanup(patch.stop)
+        backoff = mock.patch("app.socrata.SocrataClient._backoff", return_value=0.0)
+        backoff.start()
+        self.addCleanup(backoff.stop)
+
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.source = source
+
+    def _expected(self, where):
+        return self.source.execute(f"SELECT COUNT(*) FROM {fake_soda.TABLE} WHERE {where}").fetchone()[0]
+
+    def test_snapshot_then_incremental(self):
+        snapshot_where = "departamento_entidad = 'La Guajira' AND anno_firma_contrato <> 'Sin Firma'"
+        rows_before = metrics.SYNC_ROWS.value(mode="snapshot")
+        self.assertEqual(sync_lib.run_snapshot(self.conn), self._expected(snapshot_where))
+        self.assertEqual(metrics.SYNC_ROWS.value(mode="snapshot") - rows_before, self._expected(snapshot_where))
+        self.assertEqual(
+            self.conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0],
+            self._expected(snapshot_where),
+        )
+
+        touched = self.soda.touch(40)
+        rows = sync_lib.run_incremental(self.conn)
+        self.assertEqual(
+            rows,
+            self._expected(
+                f"departamento_entidad = 'La Guajira' AND _updated_at = (SELECT MAX(_updated_at) FROM {fake_soda.TABLE})"
+            ),
+        )
+        self.assertLessEqual(rows, touched)
+        state = self.conn.execute("SELECT last_run_status, last_dataset_updated_at FROM sync_state").fetchone()
+        self.assertEqual(state[0], "INCREMENTAL_OK")
+        self.assertEqual(
+            state[1], self.source.execute(f"SELECT MAX(_updated_at) FROM {fake_soda.TABLE}").fetchone()[0]
+        )
+
+
+    def test_each_committed_page_moves_the_data_generation(self):
+        generations = []
+        progress = mock.Mock()
+        progress.page_done.side_effect = lambda rows: generations.append(db_lib.get_data_generation(self.conn))
+        sync_lib.run_snapshot(self.conn, progress)
+        self.assertGreater(len(generations), 1)
+        self.assertEqual(generations, sorted(set(generations)))
+
+
+    def test_failed_incremental_page_is_rolled_back(self):
+        sync_lib.run_snapshot(self.conn)
+        self.soda.touch(40)
+        state = """
+            SELECT (SELECT MAX(dataset_updated_at) FROM procesos_secop1),
+                   (SELECT SUM(n) FROM catalog_values), (SELECT SUM(n) FROM stats_rollup),
+                   (SELECT COUNT(*) FROM procesos_tokens)
+        """
+        before = self.conn.execute(state).fetchone()
+        with mock.patch.object(sync_lib, "apply_rollup_delta", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                sync_lib.run_incremental(self.conn)
+        self.assertEqual(self.conn.execute(state).fetchone(), before)
+
+
+class TestKeyScanIncremental(unittest.TestCase):
+    def setUp(self):
+        source = duckdb.connect(":memory:")
+        fake_soda.load_dataset(source, 400, seed=9)
+        self.addCleanup(source.close)
+        self.soda = fake_soda.FakeSoda(source, seed=9)
+        server = fake_soda.FakeSodaServer(self.soda).start()
+        self.addCleanup(server.stop)
+        self.settings = dataclasses.replace(
+            get_settings(),
+            socrata_domain=server.url,
+            dataset_id=self.soda.dataset_id,
+            page_limit=100,
+            default_snapshot_years=100,
+            filter_departamento=None,
+            filter_municipio=None,
+            incremental_key_scan=True,
+            key_scan_columns=["estado_del_proceso"],
+            key_scan_batch=3,
+        )
+        patch = mock.patch.object(sync_lib, "get_settings", return_value=self.settings)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.source = source
+
+    def _bump(self, where, estado=None):
+        change = f", estado_del_proceso = '{estado}'" if estado else ""
+        self.source.execute(f"""
+            UPDATE {fake_soda.TABLE}
+            SET _updated_at = (SELECT MAX(_updated_at) FROM {fake_soda.TABLE}) + INTERVAL 1 SECOND {change}
+            WHERE {where}
+        """)
+
+    def test_only_changed_rows_are_fetched(self):
+        sync_lib.run_snapshot(self.conn)
+        ids = [r[0] for r in self.source.execute(
+            f"SELECT _id FROM {fake_soda.TABLE} WHERE anno_firma_contrato <> 'Sin Firma' ORDER BY _id LIMIT 30"
+        ).fetchall()]
+        self._bump(f"_id IN ({', '.join(repr(i) for i in ids[5:])})")
+        self._bump(f"_id IN ({', '.join(repr(i) for i in ids[:5])})", estado="REVOCADO")
+
+        skipped = metrics.SYNC_KEY_SCAN_ROWS.value(result="skipped")
+        self.assertEqual(sync_lib.run_incremental(self.conn), 5)
+        self.assertEqual(metrics.SYNC_KEY_SCAN_ROWS.value(result="skipped") - skipped, 25)
+        self.assertEqual(
+            self.conn.execute(
+                "SELECT COUNT(*) FROM procesos_secop1 WHERE estado_del_proceso = 'REVOCADO'"
+            ).fetchone()[0],
+            5,
+        )
+        watermark = self.conn.execute("SELECT last_dataset_updated_at FROM sync_state").fetchone()[0]
+        self.assertEqual(
+            watermark, self.source.execute(f"SELECT MAX(_updated_at) FROM {fake_soda.TABLE}").fetchone()[0]
+        )
+        self.assertEqual(sync_lib.run_incremental(self.conn), 0)
+
+    def test_rows_without_compared_values_are_always_fetched(self):
+        self.settings.key_scan_columns = ["ultima_actualizacion"]
+        sync_lib.run_snapshot(self.conn)
+        self.soda.touch(12)
+        touched = self.source.execute(
+            f"SELECT COUNT(*) FROM {fake_soda.TABLE} WHERE _updated_at = (SELECT MAX(_updated_at) FROM {fake_soda.TABLE})"
+        ).fetchone()[0]
+        self.assertEqual(sync_lib.run_incremental(self.conn), touched)
+
+    def test_rows_updated_during_the_fetch_phase_are_not_skipped(self):
+        sync_lib.run_snapshot(self.conn)
+        ids = [r[0] for r in self.source.execute(
+            f"SELECT _id FROM {fake_soda.TABLE} WHERE anno_firma_contrato <> 'Sin Firma' ORDER BY _id LIMIT 2"
+        ).fetchall()]
+        changed, later = repr(ids[0]), repr(ids[1])
+        self._bump(f"_id = {changed}", estado="REVOCADO")
+        scan_position = self.source.execute(f"SELECT MAX(_updated_at) FROM {fake_soda.TABLE}").fetchone()[0]
+        original = SocrataClient.iter_query_in
+
+        def iter_query_in(client, *args, **kwargs):
+            # Between the scan and the fetch, another row changes and then the
+            # changed row is updated again, so its :updated_at passes both.
+            self._bump(f"_id = {later}", estado="LIQUIDADO")
+            self._bump(f"_id = {changed}")
+            yield from original(client, *args, **kwargs)
+
+        with mock.patch.object(SocrataClient, "iter_query_in", iter_query_in):
+            self.assertEqual(sync_lib.run_incremental(self.conn), 1)
+        watermark = self.conn.execute("SELECT last_dataset_updated_at FROM sync_state").fetchone()[0]
+        self.assertEqual(watermark, scan_position)
+
+        self.assertGreaterEqual(sync_lib.run_incremental(self.conn), 1)
+        uid = self.source.execute(f"SELECT uid FROM {fake_soda.TABLE} WHERE _id = {later}").fetchone()[0]
+        self.assertEqual(
+            self.conn.execute("SELECT estado_del_proceso FROM procesos_secop1 WHERE uid = ?", [uid]).fetchone()[0],
+            "LIQUIDADO",
+        )
@@ -0,0 +1,72 @@
+import threading
+import unittest
+from unittest import mock
+
+from app import jobs
+
+
+class FakeConn:
+    def close(self):
+        pass
+
+
+class TestSyncJobs(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.first_page = threading.Event()
+        patches = [
+            mock.patch.object(jobs, "get_conn", FakeConn),
+            mock.patch.dict(jobs._RUNNERS, {"snapshot": self._fake_sync, "incremental": self._failing_sync}),
+            mock.patch.object(jobs, "_JOBS", jobs.OrderedDict()),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _fake_sync(self, conn, progress):
+        progress.start(30)
+        for _ in range(3):
+            progress.page_done(10)
+            self.first_page.set()
+            self.release.wait(5)
+        return 30
+
+    def _failing_sync(self, conn, progress):
+        raise RuntimeError("boom")
+
+    def _wait(self, job):
+        self.assertTrue(job.wait(5))
+        self.assertFalse(job._thread.is_alive())
+
+    def test_job_reports_progress_and_succeeds(self):
+        job = jobs.submit("snapshot", "ds")
+        self.assertTrue(self.first_page.wait(5))
+        running = job.to_dict()
+        self.assertEqual(running["status"], "running")
+        self.assertEqual((running["pages"], running["rows"], running["expected_rows"]), (1, 10, 30))
+        self.assertIsNotNone(running["eta_s"])
+        self.release.set()
+        self._wait(job)
+        done = job.to_dict()
+        self.assertEqual((done["status"], done["pages"], done["rows"]), ("succeeded", 3, 30))
+        self.assertIsNone(done["eta_s"])
+
+    def test_single_flight_per_dataset(self):
+        job = jobs.submit("snapshot", "ds")
+        with self.assertRaises(jobs.JobConflict) as ctx:
+            jobs.submit("incremental", "ds")
+        self.assertEqual(ctx.exception.job.id, job.id)
+        self.release.set()
+        self._wait(job)
+        again = jobs.submit("incremental", "ds")
+        self._wait(again)
+        self.assertEqual((again.status, again.error), ("failed", "boom"))
+
+    def test_cancel_stops_between_pages(self):
+        job = jobs.submit("snapshot", "ds")
+        self.assertTrue(self.first_page.wait(5))
+        job.cancel()
+        self.release.set()
+        self._wait(job)
+        self.assertEqual((job.status, job.pages), ("cancelled", 2))
+        self.assertEqual([j.id for j in jobs.list_jobs()], [job.id])
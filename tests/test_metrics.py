@@ -0,0 +1,84 @@
+import dataclasses
+import unittest
+from unittest import mock
+
+import duckdb
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.settings import get_settings
+
+
+class TestPrometheusText(unittest.TestCase):
+    def test_counter_and_histogram_exposition(self):
+        counter = metrics.Counter("t_events_total", "Events.", ["kind"])
+        hist = metrics.Histogram("t_latency_seconds", "Latency.", ["route"], buckets=(0.1, 1.0))
+        self.addCleanup(metrics._METRICS.remove, counter)
+        self.addCleanup(metrics._METRICS.remove, hist)
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        for value in (0.05, 0.5, 3.0):
+            hist.observe(value, route="/x")
+
+        text = metrics.render()
+        self.assertIn("# TYPE t_events_total counter", text)
+        self.assertIn('t_events_total{kind="a\\"b"} 3', text)
+        self.assertIn('t_latency_seconds_bucket{route="/x",le="0.1"} 1', text)
+        self.assertIn('t_latency_seconds_bucket{route="/x",le="1"} 2', text)
+        self.assertIn('t_latency_seconds_bucket{route="/x",le="+Inf"} 3', text)
+        self.assertIn('t_latency_seconds_sum{route="/x"} 3.55', text)
+        self.assertIn('t_latency_seconds_count{route="/x"} 3', text)
+
+
+class TestQueryTiming(unittest.TestCase):
+    def setUp(self):
+        self.conn = duckdb.connect(":memory:")
+        self.addCleanup(self.conn.close)
+        self.conn.execute("CREATE TABLE t AS SELECT range AS i FROM range(1000)")
+        settings = dataclasses.replace(
+            get_settings(), slow_query_ms=0, slow_query_log_size=2, slow_query_profile=True,
+        )
+        for patch in (
+            mock.patch.object(metrics, "get_settings", return_value=settings),
+            mock.patch.object(metrics, "_SLOW", None),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_slow_queries_are_profiled_into_a_ring_buffer(self):
+        before = metrics.QUERY_LATENCY.count(query="t_scan")
+        scanned = metrics.SLOW_QUERY_ROWS_SCANNED.value(query="t_scan")
+        for bound in (10, 20, 900):
+            rows = metrics.timed_fetchall(self.conn, "t_scan", "SELECT i FROM t WHERE i < ?", [bound])
+        self.assertEqual(len(rows), 900)
+        self.assertEqual(self.conn.description[0][0], "i")
+        self.assertEqual(metrics.QUERY_LATENCY.count(query="t_scan"), before + 3)
+
+        entries = metrics.slow_queries()
+        self.assertEqual([e["params"] for e in entries], [[900], [20]])
+        newest = entries[0]
+        self.assertEqual((newest["query"], newest["rows_returned"]), ("t_scan", 900))
+        self.assertEqual(newest["rows_scanned"], 900)
+        self.assertEqual(metrics.SLOW_QUERY_ROWS_SCANNED.value(query="t_scan") - scanned, 930)
+        self.assertTrue(any(op["operator"].endswith("SCAN") for op in newest["plan"]))
+
+
+class TestMiddleware(unittest.TestCase):
+    def test_routes_are_labelled_by_template(self):
+        app = FastAPI()
+        app.add_middleware(metrics.MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        def item(item_id: int):
+            return {"id": item_id}
+
+        before = metrics.HTTP_LATENCY.count(method="GET", route="/items/{item_id}", status=200)
+        with TestClient(app) as client:
+            client.get("/items/1")
+            client.get("/items/2")
+            self.assertEqual(client.get("/missing").status_code, 404)
+        self.assertEqual(
+            metrics.HTTP_LATENCY.count(method="GET", route="/items/{item_id}", status=200), before + 2
+        )
+        self.assertGreaterEqual(metrics.HTTP_LATENCY.count(method="GET", route="unmatched", status=404), 1)
@@ -0,0 +1,175 @@
+import dataclasses
+import glob
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import duckdb
+
+from app import db as db_lib
+from app import partitions
+from app import query as qlib
+from app import sync as sync_lib
+from app.settings import get_settings
+from bench import fake_soda, synthetic
+
+
+def _args(**kw):
+    values = dict(
+        anno=None, anno_min=None, anno_max=None, modalidad=None, destino=None, entidad=None,
+        entidad_exact=False, departamento=None, municipio=None, cuantia_min=None, cuantia_max=None,
+        bpin=None, estado=None, q=None,
+    )
+    values.update(kw)
+    return list(values.values())
+
+
+class PartitionTestCase(unittest.TestCase):
+    def setUp(self):
+        qlib.clear_caches()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.parquet_dir = os.path.join(tmp.name, "parts")
+        self.duckdb_settings = dataclasses.replace(
+            get_settings(), storage_backend="duckdb", parquet_dir=self.parquet_dir, parquet_flush_rows=250,
+        )
+        self.parquet_settings = dataclasses.replace(self.duckdb_settings, storage_backend="parquet")
+        self.patches = [
+            mock.patch.object(module, "get_settings", return_value=self.duckdb_settings)
+            for module in (db_lib, sync_lib, qlib)
+        ]
+        for patch in self.patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.conn = duckdb.connect(":memory:")
+        self.addCleanup(self.conn.close)
+
+    def use(self, settings):
+        for patch in self.patches:
+            patch.target.get_settings.return_value = settings
+        qlib.clear_caches()
+
+    def files(self):
+        return sorted(
+            os.path.relpath(path, self.parquet_dir)
+            for path in glob.glob(os.path.join(self.parquet_dir, "*", "*", "*.parquet"))
+        )
+
+    def derived_state(self):
+        return (
+            self.conn.execute("SELECT * FROM catalog_values ORDER BY ALL").fetchall(),
+            self.conn.execute("""
+                SELECT anno_firma_int, departamento_entidad_norm, SUM(n), round(SUM(sum_cuantia_contrato))
+                FROM stats_rollup GROUP BY ALL HAVING SUM(n) <> 0 ORDER BY ALL
+            """).fetchall(),
+        )
+
+
+class TestPartitionedStorage(PartitionTestCase):
+    CASES = [
+        dict(),
+        dict(anno=2021),
+        dict(anno_min=2020, anno_max=2022, departamento="La Guajira"),
+        dict(departamento="Bogotá D.C."),
+        dict(anno_max=2019, estado="LIQUIDADO"),
+    ]
+
+    def test_migration_keeps_rows_and_prunes_partitions(self):
+        synthetic.load_procesos(self.conn, 1500, seed=2, chunk_rows=500)
+        expected = [qlib.count_procesos(self.conn, *_args(**case)) for case in self.CASES]
+        stats = qlib.get_stats(self.conn, *_args(departamento="Antioquia"))
+        derived = self.derived_state()
+
+        self.use(self.parquet_settings)
+        db_lib.init_db(self.conn)
+        self.assertTrue(db_lib.is_view(self.conn, "procesos_secop1"))
+        self.assertEqual(partitions.staged_rows(self.conn), 0)
+        self.assertIn("part_anno=2021/part_departamento=LA_GUAJIRA/data.parquet", self.files())
+        self.assertEqual([qlib.count_procesos(self.conn, *_args(**case)) for case in self.CASES], expected)
+        self.assertEqual(qlib.get_stats(self.conn, *_args(departamento="Antioquia", q="a")), stats)
+        self.assertEqual(self.derived_state(), derived)
+
+        # Queries scoped to one departamento never read the others' files
+        # (DuckDB takes the schema from the first file when binding the view).
+        for path in self.files()[1:]:
+            if "LA_GUAJIRA" not in path:
+                with open(os.path.join(self.parquet_dir, path), "w") as fh:
+                    fh.write("not parquet")
+        qlib.clear_caches()
+        self.assertEqual(qlib.count_procesos(self.conn, *_args(**self.CASES[2])), expected[2])
+        page = qlib.list_procesos(self.conn, *_args(departamento="La Guajira", anno=2021), 5, 0)
+        self.assertTrue(all(row["departamento_entidad"] == "La Guajira" for row in page))
+
+    def test_switching_back_loads_the_partitions(self):
+        synthetic.load_procesos(self.conn, 600, seed=4, chunk_rows=600)
+        expected = self.conn.execute("SELECT * FROM procesos_secop1 ORDER BY uid").fetchall()
+        self.use(self.parquet_settings)
+        db_lib.init_db(self.conn)
+        self.use(self.duckdb_settings)
+        db_lib.init_db(self.conn)
+        self.assertFalse(db_lib.is_view(self.conn, "procesos_secop1"))
+        self.assertEqual(self.conn.execute("SELECT * FROM procesos_secop1 ORDER BY uid").fetchall(), expected)
+
+
+class TestPartitionedSync(PartitionTestCase):
+    def setUp(self):
+        super().setUp()
+        source = duckdb.connect(":memory:")
+        fake_soda.load_dataset(source, 600, seed=7)
+        self.addCleanup(source.close)
+        self.soda = fake_soda.FakeSoda(source, seed=7)
+        server = fake_soda.FakeSodaServer(self.soda).start()
+        self.addCleanup(server.stop)
+        self.source = source
+        self.parquet_settings = dataclasses.replace(
+            self.parquet_settings,
+            socrata_domain=server.url,
+            dataset_id=self.soda.dataset_id,
+            page_limit=100,
+            default_snapshot_years=100,
+            filter_departamento=None,
+            filter_municipio=None,
+            filter_entidad=None,
+        )
+        self.use(self.parquet_settings)
+        db_lib.init_db(self.conn)
+
+    def assert_derived_tables_match_rows(self):
+        stage = partitions.STAGE_TABLE
+        self.assertEqual(partitions.staged_rows(self.conn), 0)
+        actual = self.derived_state()
+        # Recompute the derived tables from a copy of the view and compare.
+        self.conn.execute(f"CREATE OR REPLACE TEMP TABLE {stage}_copy AS SELECT * FROM procesos_secop1")
+        self.conn.execute("DELETE FROM catalog_values")
+        self.conn.execute("DELETE FROM stats_rollup")
+        db_lib.apply_catalog_delta(self.conn, None, f"{stage}_copy")
+        db_lib.apply_rollup_delta(self.conn, None, f"{stage}_copy")
+        self.assertEqual(actual, self.derived_state())
+
+    def test_incremental_rewrites_only_affected_partitions(self):
+        total = sync_lib.run_snapshot(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0], total)
+        mtimes = {path: os.stat(os.path.join(self.parquet_dir, path)).st_mtime_ns for path in self.files()}
+
+        # Move a few rows to another year, so their old partition is rewritten too.
+        self.source.execute(f"""
+            UPDATE {fake_soda.TABLE}
+            SET _updated_at = (SELECT MAX(_updated_at) FROM {fake_soda.TABLE}) + INTERVAL 1 SECOND,
+                anno_firma_contrato = '2011'
+            WHERE _id IN (SELECT _id FROM {fake_soda.TABLE} WHERE anno_firma_contrato <> 'Sin Firma' LIMIT 3)
+        """)
+        moved = self.source.execute(
+            f"SELECT _id FROM {fake_soda.TABLE} WHERE anno_firma_contrato = '2011'"
+        ).fetchall()
+        self.assertEqual(sync_lib.run_incremental(self.conn), len(moved))
+
+        after = {path: os.stat(os.path.join(self.parquet_dir, path)).st_mtime_ns for path in self.files()}
+        rewritten = {path for path in after if mtimes.get(path) != after[path]}
+        self.assertTrue(any(path.startswith("part_anno=2011/") for path in rewritten))
+        self.assertLess(len(rewritten), len(after))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0], total)
+        self.assertEqual(
+            self.conn.execute("SELECT COUNT(DISTINCT uid) FROM procesos_secop1").fetchone()[0], total
+        )
+        self.assert_derived_tables_match_rows()
@@ -0,0 +1,146 @@
+import dataclasses
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import duckdb
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import db as db_lib
+from app import query as qlib
+from app import settings as settings_lib
+from app import sync as sync_lib
+from app.routers import procesos
+from app.settings import FilterProfile, get_settings
+from bench import fake_soda
+
+PROFILES = {
+    "guajira": FilterProfile("guajira", departamento="La Guajira"),
+    "antioquia": FilterProfile("antioquia", departamento="Antioquia"),
+}
+
+
+class TestProfileSettings(unittest.TestCase):
+    def test_profiles_file_and_default(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profiles.yml")
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write("default: b\nprofiles:\n  a:\n    municipio: ALBANIA\n  b:\n    departamento: ANTIOQUIA\n")
+            profiles, default = settings_lib._load_profiles(path)
+        settings = dataclasses.replace(get_settings(), profiles=profiles, default_profile=default)
+        self.assertEqual(settings.get_profile(), FilterProfile("b", departamento="ANTIOQUIA"))
+        self.assertEqual(settings.get_profile("a").municipio, "ALBANIA")
+        with self.assertRaises(ValueError):
+            settings.get_profile("c")
+
+    def test_without_profiles_the_filter_variables_are_the_default_profile(self):
+        settings = dataclasses.replace(
+            get_settings(), profiles={}, default_profile=None,
+            filter_departamento="LA GUAJIRA", filter_municipio=None, filter_entidad=None,
+        )
+        self.assertEqual(list(settings.filter_profiles()), [settings_lib.DEFAULT_PROFILE])
+        self.assertEqual(settings.get_profile().departamento, "LA GUAJIRA")
+
+
+    def test_unknown_default_profile_fails_at_startup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"PROFILES_PATH": os.path.join(tmp, "missing.yml"), "DEFAULT_PROFILE": "foo"}
+            with mock.patch.dict(os.environ, env), mock.patch.object(settings_lib, "_SETTINGS", None):
+                with self.assertRaises(ValueError):
+                    get_settings()
+                os.environ["DEFAULT_PROFILE"] = settings_lib.DEFAULT_PROFILE
+                self.assertEqual(get_settings().get_profile().name, settings_lib.DEFAULT_PROFILE)
+
+
+class TestMultiProfileSync(unittest.TestCase):
+    def setUp(self):
+        source = duckdb.connect(":memory:")
+        fake_soda.load_dataset(source, 500, seed=11)
+        self.addCleanup(source.close)
+        self.soda = fake_soda.FakeSoda(source, seed=11)
+        server = fake_soda.FakeSodaServer(self.soda).start()
+        self.addCleanup(server.stop)
+        self.source = source
+        self.settings = dataclasses.replace(
+            get_settings(),
+            socrata_domain=server.url,
+            dataset_id=self.soda.dataset_id,
+            page_limit=50,
+            default_snapshot_years=100,
+            profiles=PROFILES,
+            default_profile="guajira",
+        )
+        for module in (sync_lib, qlib):
+            patch = mock.patch.object(module, "get_settings", return_value=self.settings)
+            patch.start()
+            self.addCleanup(patch.stop)
+        patch = mock.patch.object(settings_lib, "get_settings", return_value=self.settings)
+        patch.start()
+        self.addCleanup(patch.stop)
+        qlib.clear_caches()
+        self.addCleanup(qlib.clear_caches)
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+
+    def _source_count(self, where):
+        return self.source.execute(f"SELECT COUNT(*) FROM {fake_soda.TABLE} WHERE {where}").fetchone()[0]
+
+    def _profile_state(self):
+        return dict(self.conn.execute(
+            "SELECT profile, last_dataset_updated_at FROM sync_profile_state ORDER BY profile"
+        ).fetchall())
+
+    def test_profiles_share_one_store_with_their_own_watermarks(self):
+        window = "anno_firma_contrato <> 'Sin Firma'"
+        guajira = self._source_count(f"departamento_entidad = 'La Guajira' AND {window}")
+        antioquia = self._source_count(f"departamento_entidad = 'Antioquia' AND {window}")
+        self.assertEqual(sync_lib.run_snapshot(self.conn), guajira + antioquia)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0], guajira + antioquia)
+        snapshot_state = self._profile_state()
+        self.assertEqual(set(snapshot_state), set(PROFILES))
+
+        # Only La Guajira changes: its watermark moves, Antioquia's does not.
+        self.source.execute(f"""
+            UPDATE {fake_soda.TABLE}
+            SET _updated_at = (SELECT MAX(_updated_at) FROM {fake_soda.TABLE}) + INTERVAL 1 SECOND
+            WHERE _id IN (SELECT _id FROM {fake_soda.TABLE} WHERE departamento_entidad = 'La Guajira' LIMIT 4)
+        """)
+        self.assertEqual(sync_lib.run_incremental(self.conn), 4)
+        state = self._profile_state()
+        self.assertGreater(state["guajira"], snapshot_state["guajira"])
+        self.assertEqual(state["antioquia"], snapshot_state["antioquia"])
+        dataset_watermark = self.conn.execute("SELECT last_dataset_updated_at FROM sync_state").fetchone()[0]
+        self.assertEqual(dataset_watermark, state["guajira"])
+        self.assertEqual(sync_lib.run_incremental(self.conn), 0)
+
+    def test_api_selects_the_profile_per_request(self):
+        sync_lib.run_snapshot(self.conn)
+        app = FastAPI()
+        app.include_router(procesos.router)
+
+        def _cursor():
+            cur = self.conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+        app.dependency_overrides[procesos.get_cursor] = _cursor
+        with TestClient(app) as client:
+            totals = {
+                name: client.get("/procesos", params={"profile": name, "limit": 1}).json()["total"]
+                for name in PROFILES
+            }
+            self.assertEqual(client.get("/procesos", params={"limit": 1}).json()["total"], totals["guajira"])
+            for name, total in totals.items():
+                stats = client.get("/stats/resumen", params={"profile": name}).json()
+                self.assertEqual(stats["total"], total)
+            for name, municipio in (("guajira", "Albania"), ("antioquia", "Envigado")):
+                municipios = client.get("/catalogos/municipio_entidad", params={"profile": name}).json()["items"]
+                self.assertIn(municipio, municipios)
+                self.assertNotIn("Bucaramanga", municipios)
+            self.assertEqual(client.get("/procesos", params={"profile": "nope"}).status_code, 400)
+            self.assertEqual(client.get("/profiles").json()["default"], "guajira")
@@ -0,0 +1,266 @@
+import unittest
+from unittest import mock
+
+import duckdb
+
+from app import db as db_lib
+from app import query as qlib
+from app import sync as sync_lib
+
+FIELD_MAP = {
+    "uid": "uid",
+    "anno_firma_contrato": "anno_firma_contrato",
+    "nombre_entidad": "nombre_entidad",
+    "departamento_entidad": "departamento_entidad",
+    "municipio_entidad": "municipio_entidad",
+    "cuantia_contrato": "cuantia_contrato",
+    "detalle_del_objeto_a_contratar": "detalle_del_objeto_a_contratar",
+    "dataset_updated_at": ":updated_at",
+}
+
+ROWS = [
+    {"uid": "1", "anno_firma_contrato": "2021", "nombre_entidad": "Alcaldía de Albania",
+     "departamento_entidad": "La Guajira", "municipio_entidad": "Albania", "cuantia_contrato": "100",
+     "detalle_del_objeto_a_contratar": "Mantenimiento de vías terciarias y mantenimiento de puentes",
+     ":updated_at": "2024-01-01T00:00:00.000"},
+    {"uid": "2", "anno_firma_contrato": "2023", "nombre_entidad": "ALCALDIA DE ALBANIA",
+     "departamento_entidad": "LA GUAJIRA", "municipio_entidad": "ALBANIA", "cuantia_contrato": "200",
+     "detalle_del_objeto_a_contratar": "Construcción de vía urbana",
+     ":updated_at": "2024-01-02T00:00:00.000"},
+    {"uid": "3", "anno_firma_contrato": "Sin Firma", "nombre_entidad": "Gobernación de Bolívar",
+     "departamento_entidad": "Bolívar", "municipio_entidad": "Cartagena", "cuantia_contrato": "300",
+     "detalle_del_objeto_a_contratar": "Suministro de alimentos escolares",
+     ":updated_at": "2024-01-03T00:00:00.000"},
+]
+
+
+def _filters(**kwargs):
+    base = dict(
+        anno=None, anno_min=None, anno_max=None, modalidad=None, destino=None, entidad=None,
+        entidad_exact=False, departamento=None, municipio=None, cuantia_min=None, cuantia_max=None,
+        bpin=None, estado=None, q=None,
+    )
+    base.update(kwargs)
+    return base
+
+
+class QueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        sync_lib.upsert_batch(self.conn, ROWS, FIELD_MAP)
+        qlib._TOTALS.clear()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def uids(self, **kwargs):
+        where_clause, params = qlib._build_filters(**_filters(**kwargs))
+        rows = self.conn.execute(f"SELECT uid FROM procesos_secop1 {where_clause}", params).fetchall()
+        return sorted(r[0] for r in rows)
+
+
+class TestDerivedColumnFilters(QueryTestCase):
+    def test_upsert_fills_derived_columns(self):
+        row = self.conn.execute(
+            "SELECT anno_firma_int, nombre_entidad_norm, departamento_entidad_norm FROM procesos_secop1 WHERE uid = '3'"
+        ).fetchone()
+        self.assertEqual(row, (None, "GOBERNACION DE BOLIVAR", "BOLIVAR"))
+
+    def test_year_filters(self):
+        self.assertEqual(self.uids(anno=2021), ["1"])
+        self.assertEqual(self.uids(anno_min=2022), ["2"])
+        self.assertEqual(self.uids(anno_max=2023), ["1", "2"])
+
+    def test_entidad_exact_is_accent_and_case_insensitive(self):
+        self.assertEqual(self.uids(entidad="alcaldia de albania", entidad_exact=True), ["1", "2"])
+
+    def test_departamento_and_municipio(self):
+        self.assertEqual(self.uids(departamento="bolivar"), ["3"])
+        self.assertEqual(self.uids(departamento="la guajira", municipio="Albania"), ["1", "2"])
+
+    def test_stats_use_integer_year(self):
+        stats = qlib.get_stats(self.conn, **_filters())
+        self.assertEqual(stats["min_anno_firma_contrato"], 2021)
+        self.assertEqual(stats["max_anno_firma_contrato"], 2023)
+
+
+class TestTextSearch(QueryTestCase):
+    def test_tokenize_folds_accents_and_drops_stopwords(self):
+        self.assertEqual(qlib._tokenize("Construcción de VÍAS, vías"), ["construccion", "vias"])
+
+    def test_text_filter_matches_all_tokens(self):
+        self.assertEqual(self.uids(text="vias"), ["1"])
+        self.assertEqual(self.uids(text="via"), ["2"])
+        self.assertEqual(self.uids(text="mantenimiento puentes"), ["1"])
+        self.assertEqual(self.uids(text="mantenimiento alimentos"), [])
+        self.assertEqual(self.uids(text="bolivar"), ["3"])
+
+    def test_ranked_listing_and_count(self):
+        sync_lib.upsert_batch(self.conn, [
+            {"uid": "4", "detalle_del_objeto_a_contratar": "Mantenimiento general", ":updated_at": "2024-02-01T00:00:00.000"},
+        ], FIELD_MAP)
+        items = qlib.list_procesos(self.conn, **_filters(), limit=10, offset=0, text="mantenimiento")
+        self.assertEqual([item["cuantia_contrato"] for item in items], [100.0, None])
+        self.assertEqual(qlib.count_procesos(self.conn, **_filters(), text="mantenimiento"), 2)
+
+    def test_index_follows_updates(self):
+        sync_lib.upsert_batch(self.conn, [
+            {"uid": "3", "detalle_del_objeto_a_contratar": "Dotacion hospitalaria", ":updated_at": "2024-03-01T00:00:00.000"},
+        ], FIELD_MAP)
+        self.assertEqual(self.uids(text="alimentos"), [])
+        self.assertEqual(self.uids(text="hospitalaria"), ["3"])
+
+    def test_unchanged_text_keeps_its_postings(self):
+        postings = "SELECT uid, token, tf FROM procesos_tokens ORDER BY ALL"
+        before = self.conn.execute(postings).fetchall()
+        updated = dict(ROWS[0], cuantia_contrato="150", **{":updated_at": "2024-04-01T00:00:00.000"})
+        conn = mock.Mock(wraps=self.conn)
+        sync_lib.upsert_batch(conn, [updated], FIELD_MAP)
+        self.assertFalse(any("DELETE FROM procesos_tokens" in c.args[0] for c in conn.execute.call_args_list))
+        self.assertEqual(self.conn.execute(postings).fetchall(), before)
+
+
+class TestCursorPagination(unittest.TestCase):
+    def setUp(self):
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        self.conn.execute(
+            """
+            INSERT INTO procesos_secop1(uid, numero_de_proceso, dataset_updated_at)
+            SELECT printf('u%02d', i), printf('p%02d', i),
+                   CASE WHEN i < 3 THEN NULL ELSE TIMESTAMP '2024-01-01' + INTERVAL (i // 2) DAY END
+            FROM range(11) t(i)
+            """
+        )
+        qlib._TOTALS.clear()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def page(self, cursor=None, offset=0):
+        return qlib.list_procesos_page(self.conn, **_filters(), limit=4, offset=offset, cursor=cursor)
+
+    def test_forward_and_backward_match_offset_order(self):
+        expected = [
+            item["numero_de_proceso"]
+            for item in qlib.list_procesos(self.conn, **_filters(), limit=100, offset=0)
+        ]
+        pages = [self.page()]
+        while pages[-1]["next_cursor"]:
+            pages.append(self.page(pages[-1]["next_cursor"]))
+        self.assertEqual([len(p["items"]) for p in pages], [4, 4, 3])
+        self.assertIsNone(pages[0]["prev_cursor"])
+        forward = [item["numero_de_proceso"] for p in pages for item in p["items"]]
+        self.assertEqual(forward, expected)
+
+        back = self.page(pages[2]["prev_cursor"])
+        self.assertEqual(back["items"], pages[1]["items"])
+        first = self.page(back["prev_cursor"])
+        self.assertEqual(first["items"], pages[0]["items"])
+        self.assertIsNone(first["prev_cursor"])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            self.page("not-a-cursor")
+
+    def test_total_is_reused_until_generation_changes(self):
+        self.assertEqual(qlib.count_procesos(self.conn, **_filters()), 11)
+        self.conn.execute("INSERT INTO procesos_secop1(uid) VALUES ('extra')")
+        self.assertEqual(qlib.count_procesos(self.conn, **_filters()), 11)
+        self.conn.execute("INSERT INTO sync_state(dataset_id, data_generation) VALUES ('ds', 1)")
+        self.assertEqual(qlib.count_procesos(self.conn, **_filters()), 12)
+
+
+class TestMaterializedCatalogs(QueryTestCase):
+    def test_counts_follow_upserts(self):
+        counts = qlib.list_catalog_counts(self.conn, "municipio_entidad", 10, None, None, None)
+        self.assertEqual(counts, [
+            {"value": "ALBANIA", "count": 1},
+            {"value": "Albania", "count": 1},
+            {"value": "Cartagena", "count": 1},
+        ])
+        sync_lib.upsert_batch(self.conn, [
+            {"uid": "2", "municipio_entidad": "Albania", ":updated_at": "2024-02-01T00:00:00.000"},
+        ], FIELD_MAP)
+        self.conn.execute("INSERT INTO sync_state(dataset_id, data_generation) VALUES ('ds', 1)")
+        counts = qlib.list_catalog_counts(self.conn, "municipio_entidad", 10, None, None, None)
+        self.assertEqual(counts, [{"value": "Albania", "count": 2}, {"value": "Cartagena", "count": 1}])
+
+    def test_catalog_is_cached_per_generation(self):
+        self.assertEqual(qlib.list_catalog(self.conn, "anno_firma_contrato", 10, None, None, None),
+                         ["2021", "2023", "Sin Firma"])
+        self.conn.execute("DELETE FROM catalog_values")
+        self.assertEqual(len(qlib.list_catalog(self.conn, "anno_firma_contrato", 10, None, None, None)), 3)
+
+    def test_catalog_query_and_location_filters(self):
+        values = qlib.list_catalog(self.conn, "nombre_entidad", 10, "albania", "LA GUAJIRA", None)
+        self.assertEqual(values, ["ALCALDIA DE ALBANIA", "Alcaldía de Albania"])
+
+    def test_invalid_catalog_column(self):
+        with self.assertRaises(ValueError):
+            qlib.list_catalog(self.conn, "uid", 10, None, None, None)
+
+
+class TestStatsRollup(QueryTestCase):
+    def base_stats(self, **kwargs):
+        # cuantia_min is not a rollup dimension, so any value forces the base table.
+        return qlib.get_stats(self.conn, **_filters(cuantia_min=-1e18, **kwargs))
+
+    def assert_rollup_matches_base(self, **kwargs):
+        self.assertEqual(qlib.get_stats(self.conn, **_filters(**kwargs)), self.base_stats(**kwargs))
+
+    def test_rollup_matches_base_table(self):
+        self.assert_rollup_matches_base()
+        self.assert_rollup_matches_base(anno_min=2022)
+        self.assert_rollup_matches_base(departamento="la guajira")
+        self.assert_rollup_matches_base(entidad="alcaldia de albania", entidad_exact=True)
+        self.assert_rollup_matches_base(anno=1999)
+
+    def test_rollup_follows_updates_and_compaction(self):
+        sync_lib.upsert_batch(self.conn, [
+            {"uid": "2", "anno_firma_contrato": "2022", "cuantia_contrato": "50",
+             ":updated_at": "2024-02-01T00:00:00.000"},
+            {"uid": "9", "anno_firma_contrato": "2020", "cuantia_contrato": "5",
+             ":updated_at": "2024-02-01T00:00:00.000"},
+        ], FIELD_MAP)
+        stats = qlib.get_stats(self.conn, **_filters())
+        self.assertEqual(stats["total"], 4)
+        self.assertEqual(stats["total_cuantia_contrato"], 455.0)
+        self.assertEqual((stats["min_anno_firma_contrato"], stats["max_anno_firma_contrato"]), (2020, 2022))
+        self.assert_rollup_matches_base()
+
+        db_lib.compact_rollup(self.conn)
+        self.assertEqual(qlib.get_stats(self.conn, **_filters()), stats)
+        groups = self.conn.execute("SELECT COUNT(*) FROM stats_rollup").fetchone()[0]
+        self.assertEqual(groups, 4)
+
+
+class TestGroupStats(QueryTestCase):
+    def group(self, dimensions, top=10, order="count", **kwargs):
+        return qlib.group_stats(self.conn, dimensions, top, order, **_filters(**kwargs))
+
+    def test_single_dimension_with_others_bucket(self):
+        result = self.group(["anno_firma_contrato"], top=2, order="cuantia_contrato")
+        self.assertEqual(result["total_groups"], 3)
+        self.assertEqual(
+            [(g["anno_firma_contrato"], g["count"], g["sum_cuantia_contrato"]) for g in result["groups"]],
+            [("Sin Firma", 1, 300.0), ("2023", 1, 200.0)],
+        )
+        self.assertEqual(result["others"], {
+            "count": 1, "sum_cuantia_contrato": 100.0, "sum_cuantia_proceso": 0.0, "groups": 1,
+        })
+
+    def test_two_dimensions_without_others(self):
+        result = self.group(["departamento_entidad", "municipio_entidad"], departamento="la guajira")
+        self.assertIsNone(result["others"])
+        self.assertEqual(
+            sorted((g["departamento_entidad"], g["municipio_entidad"], g["count"]) for g in result["groups"]),
+            [("LA GUAJIRA", "ALBANIA", 1), ("La Guajira", "Albania", 1)],
+        )
+
+    def test_invalid_dimensions(self):
+        with self.assertRaises(ValueError):
+            self.group(["uid"])
+        with self.assertRaises(ValueError):
+            self.group(["estado_del_proceso", "destino_gasto", "codigo_bpin"])
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+import unittest
+
+import requests
+
+from app import socrata
+
+
+class FakeClient(socrata.SocrataClient):
+    def __init__(self, total_rows, delay=0.0):
+        super().__init__("example.invalid")
+        self.total_rows = total_rows
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def fetch_page(self, dataset_id, params, page_size=None):
+        if page_size is not None:
+            params["$limit"] = page_size.size
+        with self.lock:
+            self.calls.append(dict(params))
+        time.sleep(self.delay)
+        start = params["$offset"]
+        end = min(start + params["$limit"], self.total_rows)
+        return [{"uid": str(i)} for i in range(start, end)]
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_prefetch_preserves_order(self):
+        self.assertEqual(list(socrata.prefetch(iter(range(10)), depth=3)), list(range(10)))
+
+    def test_prefetch_reraises_producer_errors(self):
+        def gen():
+            yield 1
+            raise RuntimeError("boom")
+
+        it = socrata.prefetch(gen(), depth=1)
+        self.assertEqual(next(it), 1)
+        with self.assertRaises(RuntimeError):
+            next(it)
+
+    def test_prefetch_overlaps_producer_and_consumer(self):
+        def slow_pages():
+            for i in range(4):
+                time.sleep(0.05)
+                yield i
+
+        start = time.monotonic()
+        for _ in socrata.prefetch(slow_pages(), depth=2):
+            time.sleep(0.05)
+        # Sequential would take ~0.4 s; overlapped is ~0.25 s.
+        self.assertLess(time.monotonic() - start, 0.35)
+
+
+    def test_interleave_runs_streams_concurrently_in_order(self):
+        def slow(prefix):
+            for i in range(3):
+                time.sleep(0.05)
+                yield f"{prefix}{i}"
+
+        start = time.monotonic()
+        items = list(socrata.interleave({"a": slow("a"), "b": slow("b")}, depth=2))
+        self.assertLess(time.monotonic() - start, 0.25)
+        for key in ("a", "b"):
+            self.assertEqual([item for k, item in items if k == key], [f"{key}{i}" for i in range(3)])
+
+
+class TestConcurrentQuery(unittest.TestCase):
+    def test_pages_are_yielded_in_order(self):
+        client = FakeClient(total_rows=25, delay=0.01)
+        pages = list(client.iter_query_concurrent("ds", "uid", None, None, limit=10, workers=3))
+        uids = [r["uid"] for page in pages for r in page]
+        self.assertEqual(uids, [str(i) for i in range(25)])
+
+    def test_in_flight_requests_are_bounded(self):
+        client = FakeClient(total_rows=1000, delay=0.0)
+        it = client.iter_query_concurrent("ds", "uid", None, None, limit=10, workers=2, prefetch_pages=1)
+        next(it)
+        time.sleep(0.05)
+        self.assertLessEqual(len(client.calls), 4)
+        it.close()
+
+
+class TestKeysetQuery(unittest.TestCase):
+    def test_pages_are_bounded_by_last_key(self):
+        rows = [{"uid": str(i), ":updated_at": f"2024-01-0{i // 2 + 1}T00:00:00.000", ":id": f"row-{i}"} for i in range(5)]
+        pages = [rows[0:2], rows[2:4], rows[4:5]]
+        client = FakeClient(total_rows=0)
+        client.fetch_page = lambda dataset_id, params, page_size=None: (
+            params.setdefault("$limit", page_size.size), client.calls.append(params), pages[len(client.calls) - 1]
+        )[2]
+
+        result = list(client.iter_query_keyset("ds", "uid,:updated_at", "municipio_entidad = 'X'", limit=2))
+
+        self.assertEqual(result, pages)
+        self.assertEqual(len(client.calls), 3)
+        for params in client.calls:
+            self.assertNotIn("$offset", params)
+            self.assertEqual(params["$order"], ":updated_at ASC, :id ASC")
+            self.assertTrue(params["$select"].endswith(":id"))
+        self.assertEqual(client.calls[0]["$where"], "(municipio_entidad = 'X')")
+        self.assertIn(
+            "(:updated_at > '2024-01-02T00:00:00.000' OR (:updated_at = '2024-01-02T00:00:00.000' AND :id > 'row-3'))",
+            client.calls[2]["$where"],
+        )
+        self.assertEqual(socrata.keyset_key(rows[4]), ("2024-01-03T00:00:00.000", "row-4"))
+
+
+def _response(status, body=b"[]", headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body
+    r.headers.update(headers or {})
+    r.url = "https://example.invalid/resource/ds.json"
+    return r
+
+
+class ScriptedClient(socrata.SocrataClient):
+    """Client whose session replays ``outcomes`` (responses or exceptions)."""
+
+    def __init__(self, outcomes, **kwargs):
+        super().__init__("example.invalid", **kwargs)
+        self.outcomes = list(outcomes)
+        self.limits = []
+        self.sleeps = []
+        self._sleep = self.sleeps.append
+        self.session.get = self._fake_get
+
+    def _fake_get(self, url, params=None, timeout=None):
+        self.limits.append(params.get("$limit"))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestTransport(unittest.TestCase):
+    def test_retries_honor_retry_after_and_backoff(self):
+        client = ScriptedClient([
+            _response(429, headers={"Retry-After": "7"}),
+            requests.ConnectionError("reset"),
+            _response(200, b'[{"uid": "1"}]'),
+        ])
+        self.assertEqual(client.fetch_page("ds", {"$limit": 10}), [{"uid": "1"}])
+        self.assertEqual(client.sleeps[0], 7.0)
+        self.assertLessEqual(client.sleeps[1], 2.0)
+        stats = client.stats.snapshot()
+        self.assertEqual((stats["requests"], stats["retries"], stats["rows"]), (1, 2, 1))
+        self.assertEqual(stats["bytes_decoded"], len(b'[{"uid": "1"}]'))
+
+    def test_client_errors_and_exhausted_retries_raise(self):
+        with self.assertRaises(requests.HTTPError):
+            ScriptedClient([_response(400)]).fetch_page("ds", {})
+        client = ScriptedClient([_response(503)] * 3, max_retries=2)
+        with self.assertRaises(requests.HTTPError):
+            client.fetch_page("ds", {})
+        self.assertEqual(len(client.sleeps), 2)
+        self.assertEqual(client.stats.snapshot()["failures"], 1)
+
+    def test_timeouts_shrink_page_size_and_fast_pages_grow_it(self):
+        full = lambda n: _response(200, json.dumps([{"uid": str(i)} for i in range(n)]).encode())
+        client = ScriptedClient([requests.Timeout(), full(2000), full(4000), _response(200, b"[]")])
+        pages = list(client.iter_query("ds", "uid", None, None, limit=4000))
+        self.assertEqual(client.limits, [4000, 2000, 4000, 4000])
+        self.assertEqual([len(p) for p in pages], [2000, 4000])
@@ -1,9 +1,15 @@
+import dataclasses
 import unittest
+from datetime import datetime
+from unittest import mock
 
 import duckdb
 
+from app import db as db_lib
 from app import query as qlib
 from app import sync as sync_lib
+from app.settings import get_settings
+from app.socrata import TransportStats
 
 
 class TestSocrataEscaping(unittest.TestCase):
@@ -16,24 +22,27 @@ class TestSocrataEscaping(unittest.TestCase):
 class TestCatalogFilters(unittest.TestCase):
     def setUp(self):
         self.conn = duckdb.connect(":memory:")
-        self.conn.execute(
-            """
-            CREATE TABLE procesos_secop1 (
-                nombre_entidad TEXT,
-                departamento_entidad TEXT,
-                municipio_entidad TEXT
-            )
-            """
-        )
-        self.conn.execute(
-            """
-            INSERT INTO procesos_secop1(nombre_entidad, departamento_entidad, municipio_entidad)
-            VALUES
-                ('Entidad A', 'Antioquia', 'Medellin'),
-                ('Entidad B', 'ANTIOQUIA', 'MEDELLIN'),
-                ('Entidad C', 'Cundinamarca', 'Bogota')
-            """
+        db_lib.init_db(self.conn)
+        field_map = {
+            "uid": "uid",
+            "nombre_entidad": "nombre_entidad",
+            "departamento_entidad": "departamento_entidad",
+            "municipio_entidad": "municipio_entidad",
+        }
+        rows = [
+            ("Entidad A", "Antioquia", "Medellin"),
+            ("Entidad B", "ANTIOQUIA", "MEDELLIN"),
+            ("Entidad C", "Cundinamarca", "Bogota"),
+        ]
+        sync_lib.upsert_batch(
+            self.conn,
+            [
+                {"uid": str(i), "nombre_entidad": e, "departamento_entidad": d, "municipio_entidad": m}
+                for i, (e, d, m) in enumerate(rows)
+            ],
+            field_map,
         )
+        qlib.clear_caches()
 
     def tearDown(self):
         self.conn.close()
@@ -48,3 +57,127 @@ class TestCatalogFilters(unittest.TestCase):
             municipio="medellin",
         )
         self.assertEqual(set(values), {"Entidad A", "Entidad B"})
+
+
+class TestUpsertBatch(unittest.TestCase):
+    def setUp(self):
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        self.field_map = {
+            "uid": "uid",
+            "cuantia_contrato": "cuantia_contrato",
+            "nombre_entidad": "nombre_entidad",
+            "dataset_updated_at": ":updated_at",
+        }
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_upsert_casts_and_keeps_latest_duplicate(self):
+        rows = [
+            {"uid": "a", "cuantia_contrato": "10.5", "nombre_entidad": "X", ":updated_at": "2024-01-01T00:00:00.000Z"},
+            {"uid": "a", "cuantia_contrato": "20", "nombre_entidad": "Y", ":updated_at": "2024-02-01T00:00:00.000Z"},
+            {"uid": "b", "cuantia_contrato": "no-num", "nombre_entidad": "Z", ":updated_at": None},
+        ]
+        self.assertEqual(sync_lib.upsert_batch(self.conn, rows, self.field_map), (3, datetime(2024, 2, 1)))
+        result = self.conn.execute(
+            "SELECT uid, cuantia_contrato, nombre_entidad, dataset_updated_at FROM procesos_secop1 ORDER BY uid"
+        ).fetchall()
+        self.assertEqual(result[0][:3], ("a", 20.0, "Y"))
+        self.assertEqual(result[0][3], datetime(2024, 2, 1))
+        self.assertEqual(result[1], ("b", None, "Z", None))
+
+    def test_upsert_updates_existing_rows(self):
+        sync_lib.upsert_batch(self.conn, [{"uid": "a", "nombre_entidad": "X"}], self.field_map)
+        sync_lib.upsert_batch(self.conn, [{"uid": "a", "nombre_entidad": "Y"}], self.field_map)
+        rows = self.conn.execute("SELECT uid, nombre_entidad FROM procesos_secop1").fetchall()
+        self.assertEqual(rows, [("a", "Y")])
+
+    def test_upsert_stores_non_string_json_values_as_text(self):
+        rows = [
+            {"uid": "a", "cuantia_contrato": 15, "nombre_entidad": {"url": "https://x.co/p?id=1"}},
+            {"uid": "b", "cuantia_contrato": 2.5, "nombre_entidad": True},
+        ]
+        self.assertEqual(sync_lib.upsert_batch(self.conn, rows, self.field_map)[0], 2)
+        result = self.conn.execute(
+            "SELECT uid, cuantia_contrato, nombre_entidad FROM procesos_secop1 ORDER BY uid"
+        ).fetchall()
+        self.assertEqual(result, [("a", 15.0, '{"url": "https://x.co/p?id=1"}'), ("b", 2.5, "True")])
+
+
+class FlakySocrata:
+    """Serves ``ROWS`` by $offset and fails once when reaching ``fail_at``."""
+
+    ROWS = [
+        {"uid": f"u{i}", "nombre_entidad": f"E{i}", ":updated_at": f"2024-01-0{i + 1}T00:00:00.000"}
+        for i in range(7)
+    ]
+    fail_at = None
+    offsets = []
+
+    def __init__(self, *args, **kwargs):
+        self.stats = TransportStats()
+
+    def count(self, dataset_id, where):
+        return len(self.ROWS)
+
+    def iter_query(self, dataset_id, select, where, order, limit=50000, offset=0):
+        while True:
+            FlakySocrata.offsets.append(offset)
+            if offset == FlakySocrata.fail_at:
+                FlakySocrata.fail_at = None
+                raise ConnectionError("network blip")
+            batch = self.ROWS[offset:offset + limit]
+            if not batch:
+                break
+            yield batch
+            offset += limit
+
+
+class TestSnapshotCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.conn = duckdb.connect(":memory:")
+        db_lib.init_db(self.conn)
+        settings = dataclasses.replace(
+            get_settings(),
+            pagination="offset",
+            page_limit=2,
+            fetch_workers=1,
+            prefetch_pages=1,
+            filter_departamento=None,
+            filter_municipio=None,
+            fields={"uid": "uid", "nombre_entidad": "nombre_entidad"},
+        )
+        FlakySocrata.offsets = []
+        for p in (
+            mock.patch.object(sync_lib, "get_settings", return_value=settings),
+            mock.patch.object(sync_lib, "SocrataClient", FlakySocrata),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_snapshot_resumes_after_last_committed_page(self):
+        FlakySocrata.fail_at = 4
+        with self.assertRaises(ConnectionError):
+            sync_lib.run_snapshot(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0], 4)
+        self.assertEqual(
+            self.conn.execute("SELECT next_offset, pages, rows_upserted FROM sync_checkpoint").fetchone(),
+            (4, 2, 4),
+        )
+
+        FlakySocrata.offsets = []
+        self.assertEqual(sync_lib.run_snapshot(self.conn), 7)
+        self.assertEqual(FlakySocrata.offsets, [4, 6, 8])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0], 7)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM sync_checkpoint").fetchone()[0], 0)
+        state = self.conn.execute("SELECT last_run_status, last_dataset_updated_at FROM sync_state").fetchone()
+        self.assertEqual(state, ("SNAPSHOT_OK", datetime(2024, 1, 7)))
+
+    def test_checkpoint_for_other_query_is_discarded(self):
+        sync_lib.save_checkpoint(self.conn, get_settings().dataset_id, "other", "offset", None, 6, 3, 6, None)
+        self.assertEqual(sync_lib.run_snapshot(self.conn), 7)
+        self.assertEqual(FlakySocrata.offsets, [0, 2, 4, 6, 8])
@@ -0,0 +1,45 @@
+import unittest
+
+import duckdb
+
+from app import query as qlib
+from bench import synthetic
+
+
+class TestLoadProcesos(unittest.TestCase):
+    def setUp(self):
+        qlib.clear_caches()
+        self.conn = duckdb.connect(":memory:")
+        self.addCleanup(self.conn.close)
+        synthetic.load_procesos(self.conn, 3000, seed=1, chunk_rows=1000)
+
+    def test_derived_tables_match_base_table(self):
+        conn = self.conn
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM procesos_secop1").fetchone()[0], 3000)
+        self.assertEqual(
+            conn.execute("SELECT COUNT(*) FROM procesos_secop1 WHERE nombre_entidad_norm IS NULL").fetchone()[0], 0
+        )
+        expected = conn.execute("""
+            SELECT modalidad_de_contratacion, COUNT(*) FROM procesos_secop1 GROUP BY 1 ORDER BY 1
+        """).fetchall()
+        catalog = conn.execute("""
+            SELECT value, SUM(n) FROM catalog_values WHERE column_name = 'modalidad_de_contratacion'
+            GROUP BY 1 ORDER BY 1
+        """).fetchall()
+        self.assertEqual(catalog, expected)
+        self.assertEqual(
+            conn.execute("SELECT SUM(n), round(SUM(sum_cuantia_contrato)) FROM stats_rollup").fetchone(),
+            conn.execute("SELECT COUNT(*), round(SUM(cuantia_contrato)) FROM procesos_secop1").fetchone(),
+        )
+        self.assertEqual(
+            conn.execute("SELECT COUNT(DISTINCT uid) FROM procesos_tokens").fetchone()[0], 3000
+        )
+
+    def test_query_layer_reads_generated_rows(self):
+        args = [None] * 6 + [False] + [None] * 7
+        total = qlib.count_procesos(self.conn, *args, text="placa huella")
+        self.assertGreater(total, 0)
+        stats = qlib.get_stats(self.conn, *args)
+        self.assertEqual(stats["total"], 3000)
+        status = self.conn.execute("SELECT last_run_status, data_generation FROM sync_state").fetchone()
+        self.assertEqual(status, ("SNAPSHOT_OK", 1))